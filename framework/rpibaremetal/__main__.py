@@ -0,0 +1,10 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+""" Runs the rpibm command line tool as python -m rpibaremetal. """
+
+import sys
+
+from rpibaremetal.cli import main
+
+sys.exit(main())
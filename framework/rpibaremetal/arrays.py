@@ -0,0 +1,75 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module reads and writes the target memory as NumPy arrays (requires the numpy package). The
+target is little endian, so the data is transferred in the little endian variant of the dtype and
+converted to the byte order of the requested dtype on the host. The transfers use the chunked path
+of the protocol, so the progress and cancel arguments work like at Protocol.memory_read.
+"""
+
+import numbers
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ArrayException(Exception):
+    """ Exception type for missing NumPy support and invalid arrays. """
+
+def check_numpy():
+    """ Raises ArrayException if NumPy is not installed. """
+    if numpy is None:
+        raise ArrayException("Typed memory access requires the numpy package")
+
+def get_target_dtype(dtype):
+    """ Returns the little endian variant of a dtype, which is the layout in the target memory. """
+    return numpy.dtype(dtype).newbyteorder("<")
+
+def get_shape(count):
+    """ Converts an element count, e.g. an int or a NumPy integer, or a shape into a tuple. """
+    if isinstance(count, numbers.Integral):
+        return (operator.index(count),)
+    return tuple(operator.index(size) for size in count)
+
+def read_array(protocol, address, dtype=None, count=None, out=None, progress=None, cancel=None):
+    """
+    Reads an array of count elements of dtype from the given address. The count can also be a
+    shape tuple. When out is given, the array is filled in place and returned, its dtype and shape
+    are used by default. A contiguous little endian out array receives the data directly, any other
+    array is filled from a temporary buffer.
+    """
+    check_numpy()
+    if out is None:
+        if dtype is None or count is None:
+            raise ArrayException("Either dtype and count or an output array is needed")
+        dtype = numpy.dtype(dtype)
+        buffer = numpy.empty(count, get_target_dtype(dtype))
+        protocol.memory_read_into(address, buffer, progress, cancel)
+        return buffer if buffer.dtype == dtype else buffer.astype(dtype)
+
+    if not out.flags.writeable:
+        raise ArrayException("The output array is not writeable")
+    if (dtype is not None and numpy.dtype(dtype) != out.dtype) or \
+            (count is not None and get_shape(count) != out.shape):
+        raise ArrayException("The dtype or count does not match the output array")
+
+    if out.flags.c_contiguous and out.dtype == get_target_dtype(out.dtype):
+        protocol.memory_read_into(address, out, progress, cancel)
+    else:
+        buffer = numpy.empty(out.shape, get_target_dtype(out.dtype))
+        protocol.memory_read_into(address, buffer, progress, cancel)
+        out[...] = buffer
+    return out
+
+def write_array(protocol, address, array, progress=None, cancel=None):
+    """
+    Writes an array to the given address in little endian C order. Strided, non-contiguous and big
+    endian arrays are packed into a single temporary buffer before the transfer.
+    """
+    check_numpy()
+    array = numpy.asarray(array)
+    buffer = numpy.ascontiguousarray(array, get_target_dtype(array.dtype))
+    protocol.memory_write(address, buffer, progress, cancel)
@@ -0,0 +1,67 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+""" This module contains helpers for finding the highest reliable baud rate of a link. """
+
+import time
+
+from rpibaremetal.protocol import Protocol
+
+BAUD_RATES = [115200, 230400, 460800, 921600, 1000000, 1500000, 2000000, 3000000]
+
+def probe_baud_rate(protocol, baud_rates=None, test_length=4096, retries=3):
+    """
+    Finds the highest baud rate which transfers a test pattern without errors. The baud rates above
+    the current one are tried in ascending order and the probing stops at the first failing rate.
+    The test pattern overwrites the start of the user memory area. The link is left at the highest
+    reliable baud rate, which is returned.
+    """
+    baud_rates = BAUD_RATES if baud_rates is None else baud_rates
+    address = protocol.get_base_address()
+    pattern = bytes((i * 167 + (i >> 8)) & 0xff for i in range(test_length))
+
+    try:
+        best_baud_rate = protocol.connection.get_baudrate()
+    except protocol.connection.ConnectionException as exception:
+        raise Protocol.ProtocolException(exception) from exception
+
+    for baud_rate in sorted(rate for rate in baud_rates if rate > best_baud_rate):
+        if not switch_baud_rate(protocol, baud_rate, retries):
+            break
+
+        if not check_link(protocol, address, pattern):
+            if not switch_baud_rate(protocol, best_baud_rate, retries):
+                raise Protocol.ProtocolException("Unable to return to %d baud" % best_baud_rate)
+            break
+
+        best_baud_rate = baud_rate
+
+    return best_baud_rate
+
+def switch_baud_rate(protocol, baud_rate, retries):
+    """
+    Changes the baud rate and retries if the request or its response was corrupted. Returns False if
+    the target has rejected the baud rate or the new baud rate could not be confirmed.
+    """
+    for _ in range(retries):
+        try:
+            return protocol.set_baud_rate(baud_rate)
+        except Protocol.ProtocolException:
+            # The target might be waiting for the confirmation, let it time out
+            recover(protocol, Protocol.BAUD_RATE_CONFIRM_TIMEOUT)
+    return False
+
+def check_link(protocol, address, pattern):
+    """ Writes the test pattern into the memory, reads it back and compares them. """
+    try:
+        protocol.memory_write(address, pattern)
+        return protocol.memory_read(address, len(pattern)) == pattern
+    except Protocol.ProtocolException:
+        # Wait for the rest of the broken response before dropping it
+        recover(protocol, len(pattern) * 10 / protocol.connection.get_baudrate())
+        return False
+
+def recover(protocol, delay):
+    """ Waits for the target to finish the ongoing transmission and drops the received data. """
+    time.sleep(delay + Protocol.BAUD_RATE_SETTLE_TIME)
+    protocol.discard_input()
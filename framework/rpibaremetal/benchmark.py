@@ -0,0 +1,264 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module measures the latency and the throughput of the protocol commands and the startup time
+of the package, keeps the results of the runs in a JSON Lines file and compares runs to find the
+regressions.
+
+A record of the store describes a run: its identifier, label and time, the kernel version, the
+host and adaptor metadata, the link settings and the metrics. A metric has a name, a transfer size
+and the list of the measured durations in seconds.
+"""
+
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+
+from rpibaremetal.connection.connection import Connection
+
+DEFAULT_SIZES = [0x100, 0x1000, 0x10000]
+STARTUP_MODULES = ["rpibaremetal.connection.factory", "rpibaremetal.protocol", "rpibaremetal.cli"]
+DEFAULT_STORE = os.environ.get("RPIBM_RESULTS", os.path.join(
+    os.path.expanduser("~"), ".local", "share", "rpibaremetal", "results.jsonl"))
+
+class BenchmarkException(Exception):
+    """ Exception type for invalid result stores and run selections. """
+
+def measure(function, repeats):
+    """ Calls the function repeatedly and returns the durations in seconds. """
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def create_metric(name, size, samples):
+    """ Creates a metric entry of a record. """
+    return {"name": name, "size": size, "samples": samples}
+
+def run_benchmarks(protocol, sizes=None, repeats=5):
+    """
+    Measures the round trip of get_version and register_read and the memory writes and reads of
+    the given sizes at the base address. Returns the list of metrics.
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    address = protocol.get_base_address()
+    metrics = [create_metric("get_version", 0, measure(protocol.get_version, repeats)),
+               create_metric("register_read", 4,
+                             measure(lambda: protocol.register_read(address), repeats))]
+
+    for size in sizes:
+        data = bytes((i * 167 + (i >> 8)) & 0xff for i in range(size))
+        metrics.append(create_metric("memory_write", size,
+                                     measure(lambda data=data: protocol.memory_write(address, data),
+                                             repeats)))
+        metrics.append(create_metric("memory_read", size,
+                                     measure(lambda size=size: protocol.memory_read(address, size),
+                                             repeats)))
+    return metrics
+
+def run_startup_benchmarks(modules=None, repeats=5):
+    """
+    Measures the start of a Python process which only imports a module, for each of the modules,
+    and of an empty process as the reference. These dominate the one-shot CLI invocations. Returns
+    the list of metrics.
+    """
+    import subprocess #pylint: disable=import-outside-toplevel
+
+    modules = STARTUP_MODULES if modules is None else modules
+    environment = dict(os.environ)
+    # The measured package is the one of this module, even if it is not installed
+    package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment["PYTHONPATH"] = os.pathsep.join(
+        [package_directory] + ([environment["PYTHONPATH"]] if "PYTHONPATH" in environment else []))
+
+    def start(code):
+        subprocess.run([sys.executable, "-c", code], check=True, env=environment)
+
+    metrics = [create_metric("python_startup", 0, measure(lambda: start("pass"), repeats))]
+    for module in modules:
+        metrics.append(create_metric("import " + module.rsplit(".", 1)[-1], 0,
+                                     measure(lambda module=module: start("import " + module),
+                                             repeats)))
+    return metrics
+
+def get_baud_rate(protocol):
+    """ Returns the baud rate of the connection or None if the transport has no baud rate. """
+    try:
+        return protocol.connection.get_baudrate()
+    except Connection.ConnectionException:
+        return None
+
+def get_adaptor_metadata(port):
+    """ Returns the USB metadata of a serial port if pyserial can find it. """
+    try:
+        from serial.tools import list_ports #pylint: disable=import-outside-toplevel
+    except ImportError:
+        return {}
+
+    for info in list_ports.comports():
+        if info.device == port:
+            return {"description": info.description, "vid": info.vid, "pid": info.pid,
+                    "serial_number": info.serial_number, "manufacturer": info.manufacturer}
+    return {}
+
+def collect_metadata(protocol, port=None):
+    """ Collects the kernel version, the host, adaptor and link settings of a run. """
+    return {
+        "version": protocol.get_version(),
+        "host": {"node": platform.node(), "platform": platform.platform(),
+                 "python": platform.python_version()},
+        "adaptor": get_adaptor_metadata(port) if port else {},
+        "link": {"port": port, "baud_rate": get_baud_rate(protocol),
+                 "framing": protocol.framing, "chunk_size": protocol.chunk_size,
+                 "pipeline_depth": protocol.pipeline_depth},
+    }
+
+def create_record(metadata, metrics, label=None):
+    """ Creates a record of a run from the metadata and the metrics. """
+    record = {"run_id": uuid.uuid4().hex[:12], "label": label,
+              "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")}
+    record.update(metadata)
+    record["metrics"] = metrics
+    return record
+
+class ResultStore:
+    """ Append-only JSON Lines file of benchmark records, by default at DEFAULT_STORE. """
+
+    def __init__(self, path=None):
+        self.path = DEFAULT_STORE if path is None else path
+
+    def append(self, record):
+        """ Appends a record to the store. """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as store_file:
+            store_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def read(self):
+        """ Returns all records in the order of the runs. """
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        with open(self.path, "r", encoding="utf-8") as store_file:
+            for number, line in enumerate(store_file, 1):
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as exception:
+                        raise BenchmarkException("Invalid record in %s:%d" %
+                                                 (self.path, number)) from exception
+        return records
+
+    def select(self, selector):
+        """
+        Returns the records of a run identifier or of all runs with a label. The selector latest
+        selects the last run and previous the run before it.
+        """
+        records = self.read()
+        if selector in ["latest", "previous"]:
+            index = -1 if selector == "latest" else -2
+            return [records[index]] if len(records) >= -index else []
+        return [record for record in records
+                if record["run_id"] == selector or record.get("label") == selector]
+
+def mann_whitney_u(baseline, candidate):
+    """
+    Two-sided Mann-Whitney U test with normal approximation and tie correction. Returns the
+    p-value of the hypothesis that the two samples come from the same distribution. The test does
+    not assume normally distributed timings, which are typically skewed by the scheduling of the
+    host and the USB latency.
+    """
+    count_a = len(baseline)
+    count_b = len(candidate)
+    if not count_a or not count_b:
+        return 1.0
+
+    values = sorted([(value, 0) for value in baseline] + [(value, 1) for value in candidate])
+    ranks = [0.0] * len(values)
+    tie_sum = 0
+    start = 0
+    while start < len(values):
+        end = start
+        while end + 1 < len(values) and values[end + 1][0] == values[start][0]:
+            end += 1
+        for index in range(start, end + 1):
+            ranks[index] = (start + end) / 2 + 1
+        tie_sum += (end - start + 1) ** 3 - (end - start + 1)
+        start = end + 1
+
+    rank_sum_a = sum(rank for rank, (_, group) in zip(ranks, values) if group == 0)
+    u_a = rank_sum_a - count_a * (count_a + 1) / 2
+    total = count_a + count_b
+    variance = count_a * count_b / 12 * ((total + 1) - tie_sum / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+
+    mean = count_a * count_b / 2
+    # Continuity correction
+    z = max(0.0, abs(u_a - mean) - 0.5) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2))
+
+def pool_samples(records):
+    """ Merges the samples of the same metric of several runs. """
+    pooled = {}
+    for record in records:
+        for metric in record["metrics"]:
+            pooled.setdefault((metric["name"], metric["size"]), []).extend(metric["samples"])
+    return pooled
+
+class Comparison:
+    """ Result of comparing a metric of two sets of runs. The change is the relative change. """
+
+    def __init__(self, name, size, baseline, candidate, #pylint: disable=too-many-arguments
+                 p_value, change, status):
+        self.name = name
+        self.size = size
+        self.baseline = baseline
+        self.candidate = candidate
+        self.p_value = p_value
+        self.change = change
+        self.status = status
+
+def compare(baseline_records, candidate_records, alpha=0.05, threshold=0.05):
+    """
+    Compares the median durations of the metrics measured in both sets of runs. A metric is a
+    regression or an improvement if the Mann-Whitney U test is significant at alpha and the
+    median changed by more than the threshold ratio. Returns the list of Comparison objects.
+    """
+    baseline = pool_samples(baseline_records)
+    candidate = pool_samples(candidate_records)
+    comparisons = []
+    for key in sorted(set(baseline) & set(candidate)):
+        baseline_median = statistics.median(baseline[key])
+        candidate_median = statistics.median(candidate[key])
+        change = candidate_median / baseline_median - 1 if baseline_median else 0.0
+        p_value = mann_whitney_u(baseline[key], candidate[key])
+
+        status = "unchanged"
+        if p_value < alpha and abs(change) > threshold:
+            status = "regression" if change > 0 else "improvement"
+        comparisons.append(Comparison(key[0], key[1], baseline_median, candidate_median, p_value,
+                                      change, status))
+    return comparisons
+
+def format_comparison(comparison):
+    """ Formats a comparison as a line of the report. """
+    line = "%-14s %8d B %10.3f ms -> %10.3f ms %+7.1f%% p=%.4f" % (
+        comparison.name, comparison.size, comparison.baseline * 1000,
+        comparison.candidate * 1000, comparison.change * 100, comparison.p_value)
+    if comparison.size:
+        line += " %10.1f KiB/s" % (comparison.size / comparison.candidate / 1024)
+    if comparison.status != "unchanged":
+        line += " " + comparison.status.upper()
+    return line
@@ -0,0 +1,189 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module tunes the chunk size and the pipeline depth of the bulk transfers for a link. The
+results are stored in per-port profile files, so later sessions can start with the tuned values.
+"""
+
+import json
+import os
+import re
+import time
+
+from rpibaremetal.baudrate import recover
+from rpibaremetal.connection.connection import Connection
+from rpibaremetal.protocol import Protocol
+
+CHUNK_SIZES = [0x400, 0x1000, 0x4000, 0x10000]
+PIPELINE_DEPTHS = [1, 2, 4]
+MAX_TEST_LENGTH = 0x10000
+PROBE_TIME = 0.5 # Wire time of the default test pattern in seconds
+TIMEOUT_USAGE = 0.75 # Part of the receive timeout which the response of a chunk may take
+PROFILE_DIRECTORY = os.environ.get("RPIBM_PROFILE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".config", "rpibaremetal"))
+
+class LinkProfile:
+    """ Tuned transfer parameters of a link and the measurement they are based on. """
+
+    def __init__(self, baud_rate, chunk_size, pipeline_depth, goodput=0.0, error_rate=0.0):
+        self.baud_rate = baud_rate
+        self.chunk_size = chunk_size
+        self.pipeline_depth = pipeline_depth
+        self.goodput = goodput
+        self.error_rate = error_rate
+
+    def apply(self, protocol):
+        """ Sets the transfer parameters of the protocol. """
+        protocol.chunk_size = self.chunk_size
+        protocol.pipeline_depth = self.pipeline_depth
+
+    def to_dict(self):
+        """ Converts the profile into a JSON serializable dictionary. """
+        return {"baud_rate": self.baud_rate, "chunk_size": self.chunk_size,
+                "pipeline_depth": self.pipeline_depth, "goodput": self.goodput,
+                "error_rate": self.error_rate}
+
+    @staticmethod
+    def from_dict(values):
+        """ Creates a profile from a dictionary of to_dict. """
+        return LinkProfile(values["baud_rate"], values["chunk_size"], values["pipeline_depth"],
+                           values.get("goodput", 0.0), values.get("error_rate", 0.0))
+
+def get_transfer_time(length, baud_rate):
+    """ Returns the wire time of the given number of bytes in seconds, 10 bits per byte (8N1). """
+    return length * 10 / baud_rate
+
+def get_chunk_sizes(baud_rate, timeout, chunk_sizes=None):
+    """
+    Returns the sorted chunk sizes whose response fits into TIMEOUT_USAGE of the receive timeout
+    at the baud rate, or the smallest one if none of them fits. The chunk sizes are not limited if
+    the timeout or the baud rate is None.
+    """
+    chunk_sizes = sorted(CHUNK_SIZES if chunk_sizes is None else chunk_sizes)
+    if timeout is None or baud_rate is None:
+        return chunk_sizes
+    return [chunk_size for chunk_size in chunk_sizes
+            if get_transfer_time(chunk_size, baud_rate) <= timeout * TIMEOUT_USAGE] or \
+        chunk_sizes[:1]
+
+def get_default_profile(baud_rate, timeout):
+    """
+    Returns the profile of a link which has not been calibrated: the largest chunk size of
+    CHUNK_SIZES which fits into the receive timeout and no pipelining.
+    """
+    return LinkProfile(baud_rate, get_chunk_sizes(baud_rate, timeout)[-1], 1)
+
+def get_test_length(baud_rate):
+    """
+    Returns the default test pattern length, which takes PROBE_TIME on the wire at the baud rate,
+    so a calibration at a low baud rate still finishes quickly.
+    """
+    if baud_rate is None:
+        return MAX_TEST_LENGTH
+    return max(CHUNK_SIZES[0], min(MAX_TEST_LENGTH, int(PROBE_TIME * baud_rate / 10)))
+
+def calibrate(protocol, chunk_sizes=None, pipeline_depths=None, #pylint: disable=too-many-arguments
+              test_length=None, rounds=2, max_error_rate=0.0, timeout=None, baud_rate=None):
+    """
+    Measures every combination of the chunk sizes and pipeline depths by writing a test pattern to
+    the start of the user memory area and reading it back in the given number of rounds. The
+    goodput is the verified bytes per second, a round with an exception or a mismatch counts as an
+    error. Returns the profile of the highest goodput whose error rate does not exceed
+    max_error_rate, and applies it to the protocol. Pipeline depths above 1 are only measured if
+    the target supports pipelining, see Protocol.supports_pipelining.
+
+    The test pattern length defaults to get_test_length of the baud rate. The chunk sizes which
+    are longer than the test pattern or do not fit into the receive timeout of the connection in
+    seconds are skipped, see get_chunk_sizes. The baud rate of the link is queried from the
+    connection unless it is given, which is needed for the transports without baud rate, e.g. TCP.
+    Without a baud rate the test pattern and the chunk sizes are not scaled.
+    """
+    if baud_rate is None:
+        try:
+            baud_rate = protocol.connection.get_baudrate()
+        except Connection.ConnectionException:
+            pass # The transport has no baud rate
+    test_length = get_test_length(baud_rate) if test_length is None else test_length
+    chunk_sizes = get_chunk_sizes(baud_rate, timeout, chunk_sizes)
+    chunk_sizes = [chunk_size for chunk_size in chunk_sizes if chunk_size <= test_length] or \
+        chunk_sizes[:1]
+    pipeline_depths = PIPELINE_DEPTHS if pipeline_depths is None else pipeline_depths
+    if not protocol.supports_pipelining():
+        pipeline_depths = [1]
+
+    address = protocol.get_base_address()
+    pattern = bytes((i * 167 + (i >> 8)) & 0xff for i in range(test_length))
+    best = None
+
+    try:
+        for chunk_size in chunk_sizes:
+            for pipeline_depth in pipeline_depths:
+                profile = LinkProfile(baud_rate, chunk_size, pipeline_depth)
+                profile.apply(protocol)
+                measure(protocol, profile, address, pattern, rounds)
+                if profile.error_rate <= max_error_rate and \
+                        (best is None or profile.goodput > best.goodput):
+                    best = profile
+    finally:
+        (best or get_default_profile(baud_rate, timeout)).apply(protocol)
+
+    if best is None:
+        raise Protocol.ProtocolException("No reliable transfer parameters were found")
+    return best
+
+def measure(protocol, profile, address, pattern, rounds):
+    """ Runs the write and read back rounds and stores the goodput and error rate of a profile. """
+    errors = 0
+    verified = 0
+    elapsed = 0.0
+    for _ in range(rounds):
+        start = time.monotonic()
+        try:
+            protocol.memory_write(address, pattern)
+            valid = protocol.memory_read(address, len(pattern)) == pattern
+        except Protocol.ProtocolException:
+            valid = False
+            # Wait for the responses of the requests in flight before dropping them
+            in_flight = profile.chunk_size * profile.pipeline_depth
+            recover(protocol, get_transfer_time(in_flight, profile.baud_rate)
+                    if profile.baud_rate else 0)
+        elapsed += time.monotonic() - start
+
+        if valid:
+            verified += 2 * len(pattern)
+        else:
+            errors += 1
+
+    profile.goodput = verified / elapsed if elapsed > 0 else 0.0
+    profile.error_rate = errors / rounds
+
+def get_profile_path(port, directory=None):
+    """ Returns the path of the profile file of a serial port. """
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", port).strip("_") or "default"
+    return os.path.join(PROFILE_DIRECTORY if directory is None else directory, name + ".json")
+
+def load_profile(port, baud_rate, directory=None):
+    """ Returns the stored profile of a port at the given baud rate or None. """
+    try:
+        with open(get_profile_path(port, directory), "r", encoding="utf-8") as profile_file:
+            profiles = json.load(profile_file)
+    except (OSError, ValueError):
+        return None
+
+    values = profiles.get(str(baud_rate))
+    return None if values is None else LinkProfile.from_dict(values)
+
+def save_profile(port, profile, directory=None):
+    """ Stores the profile of a port. The profiles of the other baud rates are kept. """
+    path = get_profile_path(port, directory)
+    try:
+        with open(path, "r", encoding="utf-8") as profile_file:
+            profiles = json.load(profile_file)
+    except (OSError, ValueError):
+        profiles = {}
+
+    profiles[str(profile.baud_rate)] = profile.to_dict()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as profile_file:
+        json.dump(profiles, profile_file, indent=4, sort_keys=True)
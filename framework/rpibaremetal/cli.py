@@ -0,0 +1,394 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module implements the rpibm command line tool. The connection backends are imported only when
+a subcommand needs the target, so the help and argument errors do not pay for loading pyserial.
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import time
+
+DEFAULT_PORT = os.environ.get("RPIBM_PORT", "/dev/ttyUSB0")
+DEFAULT_BAUD_RATE = 115200
+DEFAULT_TIMEOUT = 2.0
+
+class Progress:
+    """
+    Prints the transferred bytes, the throughput and the estimated remaining time of a transfer to
+    a stream. The line is redrawn at most once per interval and only on terminals, other streams get
+    the final line only.
+    """
+
+    def __init__(self, total, stream=None, interval=0.2):
+        self.total = total
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self.interactive = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.start = time.monotonic()
+        self.last_update = 0.0
+        self.done = 0
+
+    def update(self, done):
+        """ Sets the number of transferred bytes and redraws the line if it is due. """
+        self.done = done
+        now = time.monotonic()
+        if self.interactive and now - self.last_update >= self.interval:
+            self.last_update = now
+            self.stream.write("\r" + self.format_line(now) + "\x1b[K")
+            self.stream.flush()
+
+    def finish(self):
+        """ Prints the final state of the transfer. """
+        line = self.format_line(time.monotonic())
+        self.stream.write(("\r" + line + "\x1b[K" if self.interactive else line) + "\n")
+        self.stream.flush()
+
+    def format_line(self, now):
+        """ Formats the progress line. """
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        percent = 100 * self.done // self.total if self.total else 100
+        line = "%s / %s %3d%% %s/s" % (format_size(self.done), format_size(self.total), percent,
+                                       format_size(rate))
+        if self.done < self.total:
+            eta = (self.total - self.done) / rate if rate > 0 else None
+            line += " ETA " + ("--:--" if eta is None else "%d:%02d" % divmod(int(eta), 60))
+        else:
+            line += " in %.1f s" % elapsed
+        return line
+
+def format_size(size):
+    """ Formats a byte count with a binary prefix. """
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return ("%d %s" if unit == "B" else "%.1f %s") % (size, unit)
+        size /= 1024
+    return "%.1f GiB" % size
+
+def open_protocol(args):
+    """
+    Connects to the target, negotiates the framing and applies the stored link profile of the port.
+    Without a profile the chunk size is limited to what fits into the receive timeout.
+    """
+    #pylint: disable=import-outside-toplevel
+    from rpibaremetal.calibration import get_default_profile, load_profile
+    from rpibaremetal.connection.factory import connect
+    from rpibaremetal.protocol import Protocol
+
+    connection = connect(args.port, args.baud, args.timeout)
+    protocol = Protocol(connection)
+    try:
+        protocol.negotiate_framing()
+    except Protocol.ProtocolException:
+        connection.close()
+        raise
+
+    baud_rate = get_baud_rate(protocol, args)
+    profile = None if args.no_profile else load_profile(args.port, baud_rate, args.profile_dir)
+    (profile or get_default_profile(baud_rate, args.timeout)).apply(protocol)
+    return protocol
+
+def get_baud_rate(protocol, args):
+    """
+    Returns the baud rate of the connection. The transports which have no baud rate, e.g. TCP,
+    use the baud rate of the arguments, which is the rate of the serial port behind them.
+    """
+    #pylint: disable=import-outside-toplevel
+    from rpibaremetal.connection.connection import Connection
+
+    try:
+        return protocol.connection.get_baudrate()
+    except Connection.ConnectionException:
+        return args.baud
+
+def command_info(protocol, args):
+    """ Prints the version, framing and base address of the target. """
+    version = protocol.get_version()
+    print("Port:         %s @ %d baud" % (args.port, get_baud_rate(protocol, args)))
+    print("Version:      0x%04X" % version)
+    print("Framing:      v%d" % protocol.framing)
+    print("Base address: 0x%016X" % protocol.get_base_address())
+    print("Chunk size:   %d" % protocol.chunk_size)
+    print("Pipeline:     %d" % protocol.pipeline_depth)
+
+def command_load(protocol, args):
+    """ Writes a file into the memory of the target. """
+    address = protocol.get_base_address() if args.address is None else args.address
+    chunk_size, block_size = get_block_size(protocol, args)
+    with open(args.file, "rb") as image:
+        length = os.fstat(image.fileno()).st_size
+        progress = Progress(length)
+        if length:
+            with mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for offset in range(0, length, block_size):
+                    block = data[offset:offset + block_size]
+                    if args.compress:
+                        protocol.memory_write_compressed(address + offset, block)
+                    else:
+                        protocol.memory_write(address + offset, block, chunk_size=chunk_size)
+                    progress.update(offset + len(block))
+        progress.finish()
+    print("Loaded %d bytes to 0x%016X" % (length, address))
+
+def command_dump(protocol, args):
+    """ Reads a memory area of the target into a file. """
+    with open(args.file, "w+b") as image:
+        image.truncate(args.length)
+        chunk_size, block_size = get_block_size(protocol, args)
+        progress = Progress(args.length)
+        if args.length:
+            with mmap.mmap(image.fileno(), args.length, access=mmap.ACCESS_WRITE) as data:
+                for offset in range(0, args.length, block_size):
+                    length = min(block_size, args.length - offset)
+                    data[offset:offset + length] = protocol.memory_read(
+                        args.address + offset, length, chunk_size=chunk_size)
+                    progress.update(offset + length)
+                data.flush()
+        progress.finish()
+    print("Dumped %d bytes from 0x%016X" % (args.length, args.address))
+
+def get_block_size(protocol, args):
+    """
+    Returns the request size and the size of the blocks handed to the protocol at once, which
+    keeps the pipeline of the protocol full between the progress updates.
+    """
+    chunk_size = protocol.chunk_size if args.chunk_size is None else args.chunk_size
+    return chunk_size, chunk_size * protocol.pipeline_depth
+
+def command_calibrate(protocol, args):
+    """ Tunes the transfer parameters of the link and stores them in the profile of the port. """
+    #pylint: disable=import-outside-toplevel
+    from rpibaremetal.calibration import calibrate, get_profile_path, save_profile
+
+    profile = calibrate(protocol, test_length=args.length, rounds=args.rounds,
+                        timeout=args.timeout, baud_rate=get_baud_rate(protocol, args))
+    print("Chunk size:   %d" % profile.chunk_size)
+    print("Pipeline:     %d" % profile.pipeline_depth)
+    print("Goodput:      %s/s" % format_size(profile.goodput))
+    if not args.no_save:
+        save_profile(args.port, profile, args.profile_dir)
+        print("Saved to %s" % get_profile_path(args.port, args.profile_dir))
+
+def command_bench(protocol, args):
+    """ Measures the link and appends the results to the store. """
+    #pylint: disable=import-outside-toplevel
+    import statistics
+    from rpibaremetal.benchmark import BenchmarkException, ResultStore, collect_metadata, \
+        create_record, run_benchmarks, run_startup_benchmarks
+
+    try:
+        metrics = run_benchmarks(protocol, args.size, args.repeats)
+        if not args.no_startup:
+            metrics += run_startup_benchmarks(repeats=args.repeats)
+        record = create_record(collect_metadata(protocol, args.port), metrics, args.label)
+        store = ResultStore(args.store)
+        store.append(record)
+    except BenchmarkException as exception:
+        print_error(exception)
+        return 1
+
+    for metric in metrics:
+        print("%-14s %8d B %10.3f ms" % (metric["name"], metric["size"],
+                                         statistics.median(metric["samples"]) * 1000))
+    print("Stored run %s in %s" % (record["run_id"], store.path))
+
+def command_compare(_protocol, args):
+    """ Compares two runs or labels of the store. Returns 1 if there are regressions. """
+    #pylint: disable=import-outside-toplevel
+    from rpibaremetal.benchmark import BenchmarkException, ResultStore, compare, \
+        format_comparison
+
+    try:
+        store = ResultStore(args.store)
+        baseline = store.select(args.baseline)
+        candidate = store.select(args.candidate)
+        for selector, records in [(args.baseline, baseline), (args.candidate, candidate)]:
+            if not records:
+                raise BenchmarkException("No runs found for %s" % selector)
+        comparisons = compare(baseline, candidate, args.alpha, args.threshold)
+    except BenchmarkException as exception:
+        print_error(exception)
+        return 1
+
+    print("Baseline:  %s (%d runs, version 0x%04X)" % (args.baseline, len(baseline),
+                                                      baseline[-1]["version"]))
+    print("Candidate: %s (%d runs, version 0x%04X)" % (args.candidate, len(candidate),
+                                                      candidate[-1]["version"]))
+    for comparison in comparisons:
+        print(format_comparison(comparison))
+
+    regressions = [comparison for comparison in comparisons if comparison.status == "regression"]
+    print("%d regressions" % len(regressions))
+    return 1 if regressions else 0
+
+def command_peek(protocol, args):
+    """ Reads a 32 bit register or prints a hex dump of a memory area. """
+    if args.length is None:
+        print("0x%08X" % protocol.register_read(args.address))
+        return
+
+    data = protocol.memory_read(args.address, args.length)
+    for offset in range(0, len(data), 16):
+        line = data[offset:offset + 16]
+        hex_bytes = " ".join("%02x" % byte for byte in line)
+        text = "".join(chr(byte) if 0x20 <= byte < 0x7f else "." for byte in line)
+        print("%016X  %-47s  %s" % (args.address + offset, hex_bytes, text))
+
+def command_poke(protocol, args):
+    """ Writes a 32 bit register. """
+    protocol.register_write(args.address, args.value)
+
+def command_exec(protocol, args):
+    """ Executes the code at the given address and prints its result. """
+    print("0x%016X" % protocol.execute(args.address))
+
+def command_reset(protocol, _args):
+    """ Resets the target. """
+    protocol.reset()
+
+def parse_int(text):
+    """ Parses a decimal, hexadecimal, octal or binary number. """
+    try:
+        return int(text, 0)
+    except ValueError as exception:
+        raise argparse.ArgumentTypeError("invalid number: %s" % text) from exception
+
+def parse_u32(text):
+    """ Parses a 32 bit unsigned number. """
+    value = parse_int(text)
+    if not 0 <= value <= 0xffffffff:
+        raise argparse.ArgumentTypeError("value out of range: %s" % text)
+    return value
+
+def parse_positive(text):
+    """ Parses a positive number. """
+    value = parse_int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("value must be positive: %s" % text)
+    return value
+
+def create_parser():
+    """ Builds the argument parser of the tool. """
+    parser = argparse.ArgumentParser(prog="rpibm",
+                                     description="Raspberry Pi bare metal prototyping tool")
+    parser.add_argument("-p", "--port", default=DEFAULT_PORT,
+                        help="serial port or connection URL, e.g. tcp://host:port or sim:// "
+                             "(default: $RPIBM_PORT or %(default)s)")
+    parser.add_argument("-b", "--baud", type=int, default=DEFAULT_BAUD_RATE,
+                        help="baud rate (default: %(default)s)")
+    parser.add_argument("-t", "--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="receive timeout in seconds (default: %(default)s)")
+    parser.add_argument("--profile-dir",
+                        help="link profile directory (default: $RPIBM_PROFILE_DIR or "
+                             "~/.config/rpibaremetal)")
+    parser.add_argument("--no-profile", action="store_true",
+                        help="do not apply the stored link profile")
+    parser.set_defaults(target=True)
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    info = subparsers.add_parser("info", help="print target information")
+    info.set_defaults(function=command_info)
+
+    load = subparsers.add_parser("load", help="write a file into the target memory")
+    load.add_argument("file", help="image file")
+    load.add_argument("address", type=parse_int, nargs="?",
+                      help="target address (default: base address)")
+    load.add_argument("-c", "--chunk-size", type=parse_positive,
+                      help="bytes per request (default: from the link profile)")
+    load.add_argument("-z", "--compress", action="store_true", help="use LZ4 compressed writes")
+    load.set_defaults(function=command_load)
+
+    dump = subparsers.add_parser("dump", help="read target memory into a file")
+    dump.add_argument("address", type=parse_int, help="target address")
+    dump.add_argument("length", type=parse_int, help="length in bytes")
+    dump.add_argument("file", help="output file")
+    dump.add_argument("-c", "--chunk-size", type=parse_positive,
+                      help="bytes per request (default: from the link profile)")
+    dump.set_defaults(function=command_dump)
+
+    peek = subparsers.add_parser("peek", help="read a register or hex dump memory")
+    peek.add_argument("address", type=parse_int, help="target address")
+    peek.add_argument("length", type=parse_int, nargs="?",
+                      help="hex dump length in bytes (default: read a 32 bit register)")
+    peek.set_defaults(function=command_peek)
+
+    poke = subparsers.add_parser("poke", help="write a 32 bit register")
+    poke.add_argument("address", type=parse_int, help="target address")
+    poke.add_argument("value", type=parse_u32, help="register value")
+    poke.set_defaults(function=command_poke)
+
+    execute = subparsers.add_parser("exec", help="execute code at an address")
+    execute.add_argument("address", type=parse_int, help="target address")
+    execute.set_defaults(function=command_exec)
+
+    reset = subparsers.add_parser("reset", help="reset the target")
+    reset.set_defaults(function=command_reset)
+
+    calibration = subparsers.add_parser("calibrate",
+                                        help="tune the chunk size and the pipeline depth")
+    calibration.add_argument("-l", "--length", type=parse_positive,
+                             help="test pattern length (default: scaled to the baud rate)")
+    calibration.add_argument("-r", "--rounds", type=parse_positive, default=2,
+                             help="rounds per setting (default: %(default)s)")
+    calibration.add_argument("-n", "--no-save", action="store_true",
+                             help="do not store the profile")
+    calibration.set_defaults(function=command_calibrate)
+
+    bench = subparsers.add_parser("bench", help="measure the link and store the results")
+    bench.add_argument("-s", "--size", type=parse_positive, action="append",
+                       help="transfer size, can be repeated (default: 256, 4096 and 65536)")
+    bench.add_argument("-r", "--repeats", type=parse_positive, default=5,
+                       help="measurements per metric (default: %(default)s)")
+    bench.add_argument("-l", "--label", help="label of the run, e.g. nightly")
+    bench.add_argument("--no-startup", action="store_true",
+                       help="do not measure the process startup and import times")
+    bench.add_argument("--store", default=None, help="result store (default: $RPIBM_RESULTS or "
+                                                     "~/.local/share/rpibaremetal/results.jsonl)")
+    bench.set_defaults(function=command_bench)
+
+    comparison = subparsers.add_parser("compare", help="compare stored runs, exit status is 1 "
+                                                       "on regressions")
+    comparison.add_argument("baseline", help="run id, label or previous")
+    comparison.add_argument("candidate", nargs="?", default="latest",
+                            help="run id, label or latest (default: %(default)s)")
+    comparison.add_argument("-a", "--alpha", type=float, default=0.05,
+                            help="significance level (default: %(default)s)")
+    comparison.add_argument("--threshold", type=float, default=0.05,
+                            help="minimal relative change (default: %(default)s)")
+    comparison.add_argument("--store", default=None, help="result store")
+    comparison.set_defaults(function=command_compare, target=False)
+
+    return parser
+
+def print_error(message):
+    """ Prints an error message in the format of argparse. """
+    print("rpibm: error: %s" % message, file=sys.stderr)
+
+def main(argv=None):
+    """ Entry point of the rpibm tool. Returns the exit status. """
+    args = create_parser().parse_args(argv)
+
+    #pylint: disable=import-outside-toplevel
+    from rpibaremetal.connection.connection import Connection
+    from rpibaremetal.protocol import Protocol
+
+    try:
+        if not args.target:
+            return args.function(None, args) or 0
+
+        protocol = open_protocol(args)
+        try:
+            return args.function(protocol, args) or 0
+        finally:
+            protocol.connection.close()
+    except (Connection.ConnectionException, Protocol.ProtocolException, OSError) as exception:
+        print_error(exception)
+        return 1
+    except KeyboardInterrupt:
+        print("rpibm: interrupted", file=sys.stderr)
+        return 130
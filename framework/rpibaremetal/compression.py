@@ -0,0 +1,127 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module implements the LZ4 block format which is used for compressed memory writes. The
+compression uses the lz4 package when it is installed and falls back to a pure Python encoder.
+"""
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+MIN_MATCH = 4
+MAX_OFFSET = 0xffff
+LAST_LITERALS = 5
+MATCH_FIND_LIMIT = 12
+
+class CompressionException(Exception):
+    """ Exception type for invalid compressed data. """
+
+def compress(data):
+    """ Compresses data into an LZ4 block. """
+    if lz4_block:
+        return lz4_block.compress(bytes(data), mode="default", store_size=False)
+    return lz4_compress(data)
+
+def lz4_compress(data):
+    """ Pure Python greedy LZ4 block encoder. """
+    data = bytes(data)
+    length = len(data)
+    match_limit = length - LAST_LITERALS
+    output = bytearray()
+    table = {}
+    anchor = 0
+    position = 0
+
+    while position < length - MATCH_FIND_LIMIT:
+        key = data[position:position + MIN_MATCH]
+        candidate = table.get(key)
+        table[key] = position
+        if candidate is None or position - candidate > MAX_OFFSET:
+            position += 1
+            continue
+
+        offset = position - candidate
+        match_end = position + MIN_MATCH
+        while match_end < match_limit and data[match_end] == data[match_end - offset]:
+            match_end += 1
+
+        lz4_push_sequence(output, data[anchor:position], offset, match_end - position)
+        position = match_end
+        anchor = position
+
+    lz4_push_sequence(output, data[anchor:], 0, 0)
+    return bytes(output)
+
+def lz4_push_sequence(output, literals, offset, match_length):
+    """ Appends a sequence to the block. A sequence without match is only valid at the end. """
+    match_token = match_length - MIN_MATCH if match_length else 0
+    output.append((min(len(literals), 15) << 4) | min(match_token, 15))
+    lz4_push_length(output, len(literals))
+    output += literals
+    if match_length:
+        output += offset.to_bytes(2, "little")
+        lz4_push_length(output, match_token)
+
+def lz4_push_length(output, length):
+    """ Appends the extra bytes of a length which did not fit into the token. """
+    if length >= 15:
+        length -= 15
+        while length >= 255:
+            output.append(255)
+            length -= 255
+        output.append(length)
+
+def decompress(data, length):
+    """ Decompresses an LZ4 block which must produce exactly length bytes. """
+    data = bytes(data)
+    output = bytearray()
+    position = 0
+
+    def read_length(value):
+        nonlocal position
+        if value == 15:
+            while True:
+                if position >= len(data):
+                    raise CompressionException("Truncated length")
+                byte = data[position]
+                position += 1
+                value += byte
+                if byte != 255:
+                    break
+        return value
+
+    while position < len(data):
+        token = data[position]
+        position += 1
+
+        literal_length = read_length(token >> 4)
+        if position + literal_length > len(data):
+            raise CompressionException("Truncated literals")
+        output += data[position:position + literal_length]
+        position += literal_length
+        if position == len(data):
+            break
+
+        if position + 2 > len(data):
+            raise CompressionException("Truncated offset")
+        offset = data[position] | (data[position + 1] << 8)
+        position += 2
+        match_length = read_length(token & 0x0f) + MIN_MATCH
+        if offset == 0 or offset > len(output):
+            raise CompressionException("Invalid offset")
+
+        if offset >= match_length:
+            output += output[-offset:len(output) - offset + match_length]
+        else:
+            for _ in range(match_length):
+                output.append(output[-offset])
+
+        if len(output) > length:
+            raise CompressionException("Decompressed data is too long")
+
+    if len(output) != length:
+        raise CompressionException("Invalid decompressed length")
+    return bytes(output)
@@ -24,3 +24,18 @@ class Connection:
     @abc.abstractmethod
     def recv(self, length):
         """ Receives data from the target for the given length. """
+
+    def close(self):
+        """ Releases the resources of the connection. """
+
+    def get_baudrate(self):
+        """ Returns the baud rate of the connection if the transport has one. """
+        raise self.ConnectionException("The connection has no baud rate")
+
+    def set_baudrate(self, baudrate):
+        """ Changes the baud rate of the connection if the transport has one. """
+        raise self.ConnectionException("Changing the baud rate is not supported")
+
+    def discard_input(self):
+        """ Drops the received data which has not been read yet. """
+        raise self.ConnectionException("Discarding input is not supported")
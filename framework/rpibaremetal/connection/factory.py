@@ -0,0 +1,133 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module opens connections by URL. The backend of a scheme is imported only when a URL of the
+scheme is opened, so e.g. replaying a trace does not load pyserial:
+
+    serial:///dev/ttyUSB0?baud=921600&timeout=2
+    tcp://localhost:2000?timeout=2
+    sim://?error_rate=0.01&seed=1
+    replay://trace.bin?realtime=1
+
+A URL without a scheme is a serial port. The baud option is ignored by the transports which have
+no baud rate.
+"""
+
+from rpibaremetal.connection.connection import Connection
+
+DEFAULT_BAUD_RATE = 115200
+
+BACKENDS = {}
+
+def register_backend(scheme, function):
+    """
+    Registers the function(location, options, baud, timeout) which opens the connections of a
+    scheme. The location is the part of the URL between the scheme and the query, the options are
+    the remaining query parameters as strings. The function imports its backend module itself.
+    """
+    BACKENDS[scheme] = function
+
+def connect(url, baud=None, timeout=None):
+    """
+    Opens the connection of a URL. The baud and timeout arguments are the defaults of the query
+    parameters of the same name.
+    """
+    scheme, separator, rest = url.partition("://")
+    if not separator:
+        scheme, rest = "serial", url
+    location, _, query = rest.partition("?")
+
+    function = BACKENDS.get(scheme)
+    if function is None:
+        raise Connection.ConnectionException("Unknown connection scheme: %s" % scheme)
+
+    options = {}
+    for item in query.split("&") if query else []:
+        name, separator, value = item.partition("=")
+        if not name or not separator:
+            raise Connection.ConnectionException("Invalid query in connection URL: %s" % url)
+        options[unquote(name)] = unquote(value)
+
+    baud = pop_option(options, "baud", int, DEFAULT_BAUD_RATE if baud is None else baud)
+    timeout = pop_option(options, "timeout", float, timeout)
+    return function(unquote(location), options, baud, timeout)
+
+def unquote(text):
+    """ Decodes the percent-encoded characters of a URL part. """
+    if "%" not in text:
+        return text
+    # urllib.parse takes longer to import than the rest of the package
+    import urllib.parse #pylint: disable=import-outside-toplevel
+    return urllib.parse.unquote(text)
+
+def pop_option(options, name, convert, default=None):
+    """ Removes an option and returns its converted value or the default if it is not set. """
+    value = options.pop(name, None)
+    if value is None:
+        return default
+    try:
+        return convert(value)
+    except ValueError as exception:
+        message = "Invalid value of %s: %s" % (name, value)
+        raise Connection.ConnectionException(message) from exception
+
+def check_options(options):
+    """ Raises an exception if there are options which were not used by the backend. """
+    if options:
+        raise Connection.ConnectionException("Unknown options: %s" % ", ".join(sorted(options)))
+
+def parse_bool(text):
+    """ Converts 1, 0, true, false, yes or no into a boolean. """
+    values = {"1": True, "true": True, "yes": True, "0": False, "false": False, "no": False}
+    if text.lower() not in values:
+        raise ValueError(text)
+    return values[text.lower()]
+
+#pylint: disable=import-outside-toplevel
+
+def open_serial(location, options, baud, timeout):
+    """ Opens a serial port, e.g. serial:///dev/ttyUSB0 or serial://COM3. """
+    check_options(options)
+    if not location:
+        raise Connection.ConnectionException("Missing serial port")
+    from rpibaremetal.connection.serialconnection import SerialConnection
+    return SerialConnection(location, baud, timeout)
+
+def open_tcp(location, options, _baud, timeout):
+    """ Opens a TCP connection to host:port. """
+    check_options(options)
+    host, _, port = location.rpartition(":")
+    host = host[1:-1] if host.startswith("[") and host.endswith("]") else host # IPv6
+    if not host or not port.isdigit() or int(port) > 0xffff:
+        raise Connection.ConnectionException("Invalid TCP address: %s" % location)
+    from rpibaremetal.connection.tcpconnection import TcpConnection
+    return TcpConnection(host, int(port), timeout)
+
+def open_simulator(_location, options, _baud, timeout):
+    """ Starts a simulated target, the options are passed to SimulatedTarget. """
+    target_options = {}
+    for name, convert in [("memory_size", lambda text: int(text, 0)), ("max_baud_rate", int),
+                          ("error_rate", float), ("seed", int)]:
+        value = pop_option(options, name, convert)
+        if value is not None:
+            target_options[name] = value
+    check_options(options)
+    from rpibaremetal.connection.simulatedconnection import SimulatedConnection
+    return SimulatedConnection(timeout, **target_options)
+
+def open_replay(location, options, _baud, _timeout):
+    """ Plays back a trace file, the realtime option keeps the recorded timing. """
+    realtime = pop_option(options, "realtime", parse_bool, False)
+    check_options(options)
+    from rpibaremetal.connection.replayconnection import ReplayConnection
+    from rpibaremetal.trace import TraceException
+    try:
+        return ReplayConnection(location, realtime)
+    except (OSError, TraceException) as exception:
+        raise Connection.ConnectionException(exception) from exception
+
+register_backend("serial", open_serial)
+register_backend("tcp", open_tcp)
+register_backend("sim", open_simulator)
+register_backend("replay", open_replay)
@@ -0,0 +1,62 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+""" Connection wrapper which records the traffic of another connection into a trace file. """
+
+import struct
+import time
+
+from rpibaremetal.connection.connection import Connection
+from rpibaremetal.trace import TraceEvent, TraceWriter, EVENT_BAUDRATE, EVENT_DISCARD, \
+    EVENT_RECV, EVENT_RECV_ERROR, EVENT_SEND
+
+class RecordingConnection(Connection):
+    """
+    Forwards every call to the wrapped connection and logs the transferred data with monotonic
+    timestamps into a trace file.
+    """
+
+    def __init__(self, connection, trace_path):
+        Connection.__init__(self)
+        self.connection = connection
+        self.writer = TraceWriter(trace_path)
+
+        try:
+            self.record(EVENT_BAUDRATE, struct.pack("<I", connection.get_baudrate()))
+        except Connection.ConnectionException:
+            pass # The connection has no baud rate
+        except BaseException:
+            self.writer.close()
+            raise
+
+    def record(self, event_type, data=b""):
+        """ Writes an event into the trace. """
+        self.writer.write(TraceEvent(event_type, int(time.monotonic() * 1e9), bytes(data)))
+
+    def send(self, data):
+        self.record(EVENT_SEND, data)
+        self.connection.send(data)
+
+    def recv(self, length):
+        try:
+            data = self.connection.recv(length)
+        except Connection.ConnectionException as exception:
+            self.record(EVENT_RECV_ERROR, str(exception).encode())
+            raise
+        self.record(EVENT_RECV, data)
+        return data
+
+    def close(self):
+        self.writer.close()
+        self.connection.close()
+
+    def get_baudrate(self):
+        return self.connection.get_baudrate()
+
+    def set_baudrate(self, baudrate):
+        self.connection.set_baudrate(baudrate)
+        self.record(EVENT_BAUDRATE, struct.pack("<I", baudrate))
+
+    def discard_input(self):
+        self.connection.discard_input()
+        self.record(EVENT_DISCARD)
@@ -0,0 +1,92 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+""" Connection implementation which plays back a recorded trace. """
+
+import time
+
+from rpibaremetal.connection.connection import Connection
+from rpibaremetal.trace import read_trace, EVENT_BAUDRATE, EVENT_DISCARD, EVENT_RECV, \
+    EVENT_RECV_ERROR, EVENT_SEND
+
+class ReplayConnection(Connection):
+    """
+    Plays back a trace file instead of accessing a target. The sent data is compared to the
+    recorded requests and the recorded responses are returned in order. By default the trace is
+    replayed at full speed, if realtime is set the original timing of the received data is kept.
+    """
+
+    def __init__(self, trace_path, realtime=False):
+        Connection.__init__(self)
+        self.events = read_trace(trace_path)
+        self.realtime = realtime
+        self.index = 0
+        self.rx_buffer = bytearray()
+        self.baudrate = None
+        self.start_time = time.monotonic()
+        self.start_timestamp = self.events[0].timestamp if self.events else 0
+
+        if self.events and self.events[0].type == EVENT_BAUDRATE:
+            self.baudrate = self.events[0].get_baudrate()
+            self.index = 1
+
+    def next_event(self):
+        """ Returns the next recorded event and waits for its time in realtime mode. """
+        if self.index >= len(self.events):
+            raise self.ConnectionException("End of trace")
+
+        event = self.events[self.index]
+        self.index += 1
+        if self.realtime:
+            delay = (event.timestamp - self.start_timestamp) / 1e9 - \
+                (time.monotonic() - self.start_time)
+            if delay > 0:
+                time.sleep(delay)
+        return event
+
+    def peek_event_type(self):
+        """ Returns the type of the next event or None at the end of the trace. """
+        return self.events[self.index].type if self.index < len(self.events) else None
+
+    def send(self, data):
+        # Data received before the request, e.g. garbage, stays available for reading
+        while self.peek_event_type() == EVENT_RECV:
+            self.rx_buffer += self.next_event().data
+
+        event_type = self.peek_event_type()
+        if event_type is not None and event_type != EVENT_SEND:
+            raise self.ConnectionException("Unexpected send at event %d" % self.index)
+        event = self.next_event()
+        if bytes(data) != event.data:
+            raise self.ConnectionException("Sent data differs from the trace at event %d" %
+                                           (self.index - 1))
+
+    def recv(self, length):
+        while len(self.rx_buffer) < length:
+            event_type = self.peek_event_type()
+            if event_type == EVENT_RECV:
+                self.rx_buffer += self.next_event().data
+            elif event_type == EVENT_RECV_ERROR:
+                raise self.ConnectionException(self.next_event().data.decode())
+            else:
+                raise self.ConnectionException("No recorded data at event %d" % self.index)
+
+        data = bytes(self.rx_buffer[:length])
+        del self.rx_buffer[:length]
+        return data
+
+    def get_baudrate(self):
+        if self.baudrate is None:
+            raise self.ConnectionException("The trace has no baud rate")
+        return self.baudrate
+
+    def set_baudrate(self, baudrate):
+        if self.peek_event_type() != EVENT_BAUDRATE or \
+                self.events[self.index].get_baudrate() != baudrate:
+            raise self.ConnectionException("Unexpected baud rate change at event %d" % self.index)
+        self.baudrate = self.next_event().get_baudrate()
+
+    def discard_input(self):
+        self.rx_buffer.clear()
+        if self.peek_event_type() == EVENT_DISCARD:
+            self.next_event()
@@ -7,12 +7,15 @@ from serial import Serial, SerialException, SerialTimeoutException
 from rpibaremetal.connection.connection import Connection
 
 class SerialConnection(Connection):
-    """ Connection implementation for serial ports. """
+    """
+    Connection implementation for serial ports. If timeout is given in seconds, receiving raises an
+    exception when the requested length does not arrive in time.
+    """
 
-    def __init__(self, serial_port, baudrate):
+    def __init__(self, serial_port, baudrate, timeout=None):
         Connection.__init__(self)
         try:
-            self.port = Serial(serial_port, baudrate)
+            self.port = Serial(serial_port, baudrate, timeout=timeout)
         except (SerialException, SerialTimeoutException) as exception:
             raise self.ConnectionException(exception)
 
@@ -24,6 +27,28 @@ class SerialConnection(Connection):
 
     def recv(self, length):
         try:
-            return self.port.read(length)
+            data = self.port.read(length)
         except (SerialException, SerialTimeoutException) as exception:
             raise self.ConnectionException(exception)
+
+        if len(data) != length:
+            raise self.ConnectionException("Timeout, received %d of %d bytes" % (len(data), length))
+        return data
+
+    def close(self):
+        self.port.close()
+
+    def get_baudrate(self):
+        return self.port.baudrate
+
+    def set_baudrate(self, baudrate):
+        try:
+            self.port.baudrate = baudrate
+        except (ValueError, SerialException) as exception:
+            raise self.ConnectionException(exception) from exception
+
+    def discard_input(self):
+        try:
+            self.port.reset_input_buffer()
+        except SerialException as exception:
+            raise self.ConnectionException(exception) from exception
@@ -0,0 +1,27 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+""" Connection implementation which runs its own simulated target. """
+
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.simulator import SimulatedTarget
+
+class SimulatedConnection(SerialConnection):
+    """
+    Serial connection to a SimulatedTarget which is started with the connection and stopped when
+    the connection is closed. The keyword arguments are passed to the SimulatedTarget.
+    """
+
+    def __init__(self, timeout=None, **target_options):
+        self.target = SimulatedTarget(**target_options)
+        self.target.start()
+        try:
+            SerialConnection.__init__(self, self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                      timeout)
+        except SerialConnection.ConnectionException:
+            self.target.stop()
+            raise
+
+    def close(self):
+        SerialConnection.close(self)
+        self.target.stop()
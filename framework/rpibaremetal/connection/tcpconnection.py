@@ -0,0 +1,69 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+""" Connection implementation for TCP, e.g. for serial port servers like ser2net. """
+
+import socket
+import time
+
+from rpibaremetal.connection.connection import Connection
+
+class TcpConnection(Connection):
+    """
+    Connection implementation for TCP sockets. If timeout is given in seconds, receiving raises an
+    exception when the requested length does not arrive in time.
+    """
+
+    def __init__(self, host, port, timeout=None):
+        Connection.__init__(self)
+        self.timeout = timeout
+        try:
+            self.socket = socket.create_connection((host, port), timeout)
+            # The requests are small, do not wait for more data to fill the segments
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as exception:
+            raise self.ConnectionException(exception) from exception
+
+    def send(self, data):
+        try:
+            self.socket.settimeout(self.timeout)
+            self.socket.sendall(data)
+        except OSError as exception:
+            raise self.ConnectionException(exception) from exception
+
+    def recv(self, length):
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(data) < length:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                self.socket.settimeout(remaining)
+                chunk = self.socket.recv(length - len(data))
+            except socket.timeout:
+                break
+            except OSError as exception:
+                raise self.ConnectionException(exception) from exception
+            if not chunk:
+                raise self.ConnectionException("Connection closed by the peer")
+            data += chunk
+
+        if len(data) != length:
+            raise self.ConnectionException("Timeout, received %d of %d bytes" % (len(data), length))
+        return bytes(data)
+
+    def close(self):
+        self.socket.close()
+
+    def discard_input(self):
+        try:
+            self.socket.setblocking(False)
+            while self.socket.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError as exception:
+            raise self.ConnectionException(exception) from exception
+        finally:
+            self.socket.settimeout(self.timeout)
@@ -4,6 +4,7 @@
 """ This class is handles the serialization of data before sending it the target. """
 
 import struct
+import zlib
 
 class Packet:
     """ This class is responsible for serializing data before sending it the target. """
@@ -116,6 +117,22 @@ class Packet:
         """ Checks if the last byte of the message is a valid CRC for the message. """
         return self.data[-1] == Packet.calculate_crc(self.data[:-1])
 
+    def add_crc32(self):
+        """ Adds a little endian CRC-32 to the end of the message. """
+        self.push_u32(Packet.calculate_crc32(self.data))
+        return self
+
+    def check_crc32(self):
+        """ Checks if the last four bytes of the message are a valid CRC-32 for the message. """
+        if len(self.data) < 4:
+            return False
+        return struct.unpack("<I", self.data[-4:])[0] == Packet.calculate_crc32(self.data[:-4])
+
+    @staticmethod
+    def calculate_crc32(data):
+        """ Calculates the CRC-32 of IEEE 802.3 which is also used by zlib. """
+        return zlib.crc32(data)
+
     @staticmethod
     def calculate_crc(data):
         """ Calculates CRC-8 with 0x7 polynomial and 0 as a starting value. """
@@ -6,8 +6,12 @@ The module contains the classes related to the protocol interpretation for sendi
 target.
 """
 
+import collections
+import time
+
 from rpibaremetal.packet import Packet
 from rpibaremetal.connection.connection import Connection
+from rpibaremetal.transfer import CancelledException, Transfer
 
 class Protocol:
     """ The class handles the protocol interpretation for sending commands to the target. """
@@ -18,8 +22,12 @@ class Protocol:
     COMMAND_REGISTER_WRITE = 0x0011
     COMMAND_MEMORY_READ = 0x0020
     COMMAND_MEMORY_WRITE = 0x0021
+    COMMAND_MEMORY_WRITE_COMPRESSED = 0x0022
+    COMMAND_MEMORY_READ_VECTORED = 0x0023
+    COMMAND_MEMORY_WRITE_VECTORED = 0x0024
     COMMAND_EXECUTE = 0x0030
     COMMAND_RESET = 0x0040
+    COMMAND_SET_BAUD_RATE = 0x0050
     COMMAND_ERROR = 0x00f0
 
     ERRORCODE_INVALID_CRC = 0x0001
@@ -31,90 +39,565 @@ class Protocol:
     TYPE_U16 = 2
     TYPE_U32 = 4
     TYPE_U64 = 8
+    TYPE_LIST = 0x10 # Repeated fields, the count is the name of the field which holds it
+
+    # Message layouts of the commands. The requests and responses are built from them and they are
+    # used for decoding recorded traffic. The length of a data field is the name of the field which
+    # holds it, either in the same message or in the request.
+    DESCRIPTORS = {
+        COMMAND_GET_VERSION: {
+            "name": "get_version",
+            "request": {},
+            "response": {"version": {"type": TYPE_U16}}},
+        COMMAND_GET_BASE_ADDRESS: {
+            "name": "get_base_address",
+            "request": {},
+            "response": {"address": {"type": TYPE_U64}}},
+        COMMAND_REGISTER_READ: {
+            "name": "register_read",
+            "request": {"address": {"type": TYPE_U64}},
+            "response": {"address": {"type": TYPE_U64}, "data": {"type": TYPE_U32}}},
+        COMMAND_REGISTER_WRITE: {
+            "name": "register_write",
+            "request": {"address": {"type": TYPE_U64}, "data": {"type": TYPE_U32}},
+            "response": {"address": {"type": TYPE_U64}, "data": {"type": TYPE_U32}}},
+        COMMAND_MEMORY_READ: {
+            "name": "memory_read",
+            "request": {"address": {"type": TYPE_U64}, "length": {"type": TYPE_U32}},
+            "response": {"address": {"type": TYPE_U64}, "length": {"type": TYPE_U32},
+                         "data": {"type": TYPE_DATA, "length": "length"}}},
+        COMMAND_MEMORY_WRITE: {
+            "name": "memory_write",
+            "request": {"address": {"type": TYPE_U64}, "length": {"type": TYPE_U32},
+                        "data": {"type": TYPE_DATA, "length": "length"}},
+            "response": {"address": {"type": TYPE_U64}, "length": {"type": TYPE_U32}}},
+        COMMAND_MEMORY_WRITE_COMPRESSED: {
+            "name": "memory_write_compressed",
+            "request": {"address": {"type": TYPE_U64}, "length": {"type": TYPE_U32},
+                        "codec": {"type": TYPE_U8}, "compressed_length": {"type": TYPE_U32},
+                        "data": {"type": TYPE_DATA, "length": "compressed_length"}},
+            "response": {"address": {"type": TYPE_U64}, "length": {"type": TYPE_U32}}},
+        COMMAND_MEMORY_READ_VECTORED: {
+            "name": "memory_read_vectored",
+            "request": {"count": {"type": TYPE_U32},
+                        "segments": {"type": TYPE_LIST, "count": "count",
+                                     "fields": {"address": {"type": TYPE_U64},
+                                                "length": {"type": TYPE_U32}}}},
+            "response": {"count": {"type": TYPE_U32}, "length": {"type": TYPE_U32},
+                         "data": {"type": TYPE_DATA, "length": "length"}}},
+        COMMAND_MEMORY_WRITE_VECTORED: {
+            "name": "memory_write_vectored",
+            "request": {"count": {"type": TYPE_U32},
+                        "segments": {"type": TYPE_LIST, "count": "count",
+                                     "fields": {"address": {"type": TYPE_U64},
+                                                "length": {"type": TYPE_U32},
+                                                "data": {"type": TYPE_DATA, "length": "length"}}}},
+            "response": {"count": {"type": TYPE_U32}, "length": {"type": TYPE_U32}}},
+        COMMAND_EXECUTE: {
+            "name": "execute",
+            "request": {"address": {"type": TYPE_U64}},
+            "response": {"address": {"type": TYPE_U64}, "result": {"type": TYPE_U64}}},
+        COMMAND_RESET: {
+            "name": "reset",
+            "request": {},
+            "response": {}},
+        COMMAND_SET_BAUD_RATE: {
+            "name": "set_baud_rate",
+            "request": {"baud_rate": {"type": TYPE_U32}},
+            "response": {"baud_rate": {"type": TYPE_U32}}},
+    }
+
+    FRAMING_V1 = 1
+    FRAMING_V2 = 2
+    VERSION_FRAMING_V2 = 0x0200
+    VERSION_PIPELINING = 0x0201 # The target buffers the requests which arrive while it transmits
+    VERSION_VECTORED = 0x0201
+    FRAME_MAGIC = 0x5aa5
+    FRAME_HEADER_LENGTH = 9 # Magic, sequence, length and CRC-8
+    MAX_FRAME_LENGTH = 0x100000 # Longer frames are only accepted as the expected response
+
+    CODEC_LZ4 = 0x01
+    COMPRESSION_CHUNK_SIZE = 0x8000
+    COMPRESSION_HEADER_LENGTH = 5 # Codec and compressed length
+
+    TRANSFER_CHUNK_SIZE = 0x10000
+    VECTORED_MAX_SEGMENTS = 64
+
+    BAUD_RATE_CONFIRM_TIMEOUT = 0.2
+    BAUD_RATE_CONFIRM_ATTEMPTS = 3
+    BAUD_RATE_SETTLE_TIME = 0.05
 
     class ProtocolException(Exception):
         """ Protocol specific exception type. """
 
     def __init__(self, connection):
         self.connection = connection
+        self.framing = Protocol.FRAMING_V1
+        self.sequence = 0
+        self.chunk_size = Protocol.TRANSFER_CHUNK_SIZE
+        self.pipeline_depth = 1
+        self.version = None
+
+    def negotiate_framing(self):
+        """
+        Selects the v2 framing if the target supports it according to its version and returns the
+        version, which is also stored in the version attribute. A target which already uses v2
+        framing from an earlier session ignores the v1 query, so the connection must have a receive
+        timeout to detect this case.
+        """
+        self.framing = Protocol.FRAMING_V1
+        try:
+            version = self.get_version()
+        except self.ProtocolException:
+            self.discard_input()
+            self.framing = Protocol.FRAMING_V2
+            version = self.get_version()
+        else:
+            if version >= Protocol.VERSION_FRAMING_V2:
+                # The first v2 request switches the target to v2 framing
+                self.framing = Protocol.FRAMING_V2
+                version = self.get_version()
+
+        self.version = version
+        return version
+
+    def supports_pipelining(self):
+        """
+        Checks if requests can be sent before the responses of the earlier ones arrive. It needs
+        v2 framing and a target of VERSION_PIPELINING or above, older kernels drop the requests
+        which arrive while they are transmitting. The version is known after negotiate_framing.
+        """
+        return self.framing == Protocol.FRAMING_V2 and self.version is not None and \
+            self.version >= Protocol.VERSION_PIPELINING
 
     def get_version(self):
         """ Queries the protocol version. """
-        response = {"version": {"type": Protocol.TYPE_U16}}
-        result = self.do_transaction(Protocol.COMMAND_GET_VERSION, {}, response)
+        result = self.do_transaction(Protocol.COMMAND_GET_VERSION, {},
+                                     Protocol.build_response(Protocol.COMMAND_GET_VERSION))
         return result["version"]
 
     def get_base_address(self):
         """ Queries the base address of the memory area which is available for the user. """
-        response = {"address": {"type": Protocol.TYPE_U64}}
-        result = self.do_transaction(Protocol.COMMAND_GET_BASE_ADDRESS, {}, response)
+        result = self.do_transaction(Protocol.COMMAND_GET_BASE_ADDRESS, {},
+                                     Protocol.build_response(Protocol.COMMAND_GET_BASE_ADDRESS))
         return result["address"]
 
     def register_read(self, address):
         """ Reads data from a 32 bit register. """
-        request = {"address": {"type": Protocol.TYPE_U64, "value": address}}
-        response = {"address": {"type": Protocol.TYPE_U64},
-                    "data": {"type": Protocol.TYPE_U32}}
-        result = self.do_transaction(Protocol.COMMAND_REGISTER_READ, request, response)
+        command = Protocol.COMMAND_REGISTER_READ
+        result = self.do_transaction(command, Protocol.build_request(command, address=address),
+                                     Protocol.build_response(command))
         if result["address"] != address:
             raise self.ProtocolException("Different address in response")
         return result["data"]
 
     def register_write(self, address, data):
         """ Writes data into a 32 bit register. """
-        request = {"address": {"type": Protocol.TYPE_U64, "value": address},
-                   "data": {"type": Protocol.TYPE_U32, "value": data}}
-        response = {"address": {"type": Protocol.TYPE_U64},
-                    "data": {"type": Protocol.TYPE_U32}}
-        result = self.do_transaction(Protocol.COMMAND_REGISTER_WRITE, request, response)
+        command = Protocol.COMMAND_REGISTER_WRITE
+        result = self.do_transaction(command,
+                                     Protocol.build_request(command, address=address, data=data),
+                                     Protocol.build_response(command))
         if result["address"] != address or result["data"] != data:
             raise self.ProtocolException("Different address or data in response")
 
-    def memory_read(self, address, length):
-        """ Reads data from the gives address for the specified length in bytes. """
-        request = {"address": {"type": Protocol.TYPE_U64, "value": address},
-                   "length": {"type": Protocol.TYPE_U32, "value": length}}
-        response = {"address": {"type": Protocol.TYPE_U64},
-                    "length": {"type": Protocol.TYPE_U32},
-                    "data": {"type": Protocol.TYPE_DATA, "length": length}}
-        result = self.do_transaction(Protocol.COMMAND_MEMORY_READ, request, response)
-        if result["address"] != address or result["length"] != length:
-            raise self.ProtocolException("Different address or length in response")
-        return result["data"]
+    def memory_read(self, address, length, progress=None, cancel=None, chunk_size=None):
+        """
+        Reads data from the gives address for the specified length in bytes. Longer reads are split
+        into requests of chunk_size bytes, which defaults to the chunk_size attribute. The progress
+        callback gets a TransferStatus after each chunk and a cancelled CancellationToken stops the
+        transfer at the next chunk boundary by raising CancelledException.
+        """
+        transfer = Transfer(length, chunk_size or self.chunk_size, progress, cancel)
+        return b"".join(self.run_transfer(
+            transfer, lambda offset, length: self.create_memory_read(address + offset, length)))
+
+    def memory_read_into(self, address, buffer, progress=None, cancel=None, chunk_size=None):
+        """
+        Reads data from the given address into a writable bytes-like object, e.g. a bytearray or a
+        memoryview slice, without joining the chunks. The other arguments work like at memory_read.
+        """
+        buffer = memoryview(buffer).cast("B")
+        transfer = Transfer(len(buffer), chunk_size or self.chunk_size, progress, cancel)
+
+        def create_request(offset, length):
+            command, request, response, check = self.create_memory_read(address + offset, length)
+
+            def store(result):
+                buffer[offset:offset + length] = check(result)
+
+            return command, request, response, store
+
+        self.run_transfer(transfer, create_request)
+
+    def memory_read_chunk(self, address, length):
+        """ Reads data from the given address by a single request. """
+        return self.run_transaction(*self.create_memory_read(address, length))
+
+    def create_memory_read(self, address, length):
+        """ Returns the descriptors and the result check of a memory read request. """
+        command = Protocol.COMMAND_MEMORY_READ
+        request = Protocol.build_request(command, address=address, length=length)
+        response = Protocol.build_response(command, length=length)
+
+        def check(result):
+            if result["address"] != address or result["length"] != length:
+                raise self.ProtocolException("Different address or length in response")
+            return result["data"]
+
+        return command, request, response, check
+
+    def memory_write(self, address, data, progress=None, cancel=None, chunk_size=None):
+        """
+        Writes data to the given address. Longer writes are split into requests of chunk_size bytes,
+        the progress, cancel and chunk_size arguments work like at memory_read.
+        """
+        data = memoryview(data).cast("B")
+        transfer = Transfer(len(data), chunk_size or self.chunk_size, progress, cancel)
+        self.run_transfer(transfer, lambda offset, length: self.create_memory_write(
+            address + offset, data[offset:offset + length]))
+
+    def memory_write_chunk(self, address, data):
+        """ Writes data to the given address by a single request. """
+        self.run_transaction(*self.create_memory_write(address, data))
+
+    def create_memory_write(self, address, data):
+        """ Returns the descriptors and the result check of a memory write request. """
+        command = Protocol.COMMAND_MEMORY_WRITE
+        request = Protocol.build_request(command, address=address, length=len(data), data=data)
+        response = Protocol.build_response(command)
+
+        def check(result):
+            if result["address"] != address or result["length"] != len(data):
+                raise self.ProtocolException("Different address or length in response")
+
+        return command, request, response, check
+
+    def memory_write_lz4(self, address, length, compressed):
+        """
+        Writes an LZ4 block to the given address which is decompressed by the target. The length is
+        the decompressed length in bytes.
+        """
+        self.run_transaction(*self.create_memory_write_lz4(address, length, compressed))
+
+    def create_memory_write_lz4(self, address, length, compressed):
+        """ Returns the descriptors and the result check of a compressed memory write request. """
+        command = Protocol.COMMAND_MEMORY_WRITE_COMPRESSED
+        request = Protocol.build_request(command, address=address, length=length,
+                                         codec=Protocol.CODEC_LZ4,
+                                         compressed_length=len(compressed), data=compressed)
+        response = Protocol.build_response(command)
+
+        def check(result):
+            if result["address"] != address or result["length"] != length:
+                raise self.ProtocolException("Different address or length in response")
+
+        return command, request, response, check
+
+    def memory_write_compressed(self, address, data, progress=None, cancel=None, chunk_size=None):
+        """
+        Writes data to the given address in chunks of chunk_size bytes, which defaults to
+        COMPRESSION_CHUNK_SIZE. Each chunk is sent LZ4 compressed if it makes the transfer shorter,
+        otherwise it is sent raw. The progress is reported in uncompressed bytes, the progress and
+        cancel arguments work like at memory_read.
+        """
+        # The compression loads the lz4 package, which the other requests do not need
+        from rpibaremetal.compression import compress #pylint: disable=import-outside-toplevel
+
+        data = bytes(data)
+        transfer = Transfer(len(data), chunk_size or Protocol.COMPRESSION_CHUNK_SIZE, progress,
+                            cancel)
+
+        def create_request(offset, length):
+            chunk = data[offset:offset + length]
+            compressed = compress(chunk)
+            if len(compressed) + Protocol.COMPRESSION_HEADER_LENGTH < len(chunk):
+                return self.create_memory_write_lz4(address + offset, len(chunk), compressed)
+            return self.create_memory_write(address + offset, chunk)
+
+        self.run_transfer(transfer, create_request)
+
+    def run_transfer(self, transfer, create_request):
+        """
+        Runs the chunks of a transfer and returns the list of the checked results. The function
+        create_request(offset, length) builds the request of a chunk like create_memory_read. If the
+        target supports pipelining, up to pipeline_depth requests are sent before waiting for the
+        responses, which hides the round trip time of the link. A cancelled transfer receives the
+        responses of the requests in flight before raising CancelledException, so the stream stays
+        consistent.
+        """
+        depth = self.pipeline_depth if self.supports_pipelining() else 1
+        results = []
+        pending = collections.deque()
+        try:
+            for offset, length in transfer.chunks():
+                command, request, response, check = create_request(offset, length)
+                sequence = self.send_request(command, request)
+                pending.append((command, response, check, sequence, length))
+                if len(pending) >= depth:
+                    results.append(self.complete_transfer_request(transfer, *pending.popleft()))
+        except CancelledException as exception:
+            while pending:
+                self.complete_transfer_request(transfer, *pending.popleft())
+            raise CancelledException(transfer.done) from exception
+
+        while pending:
+            results.append(self.complete_transfer_request(transfer, *pending.popleft()))
+        return results
+
+    def complete_transfer_request(self, transfer, command, #pylint: disable=too-many-arguments
+                                  response, check, sequence, length):
+        """ Receives the response of a chunk and checks it. """
+        packet = self.recv_response(command, response, sequence)
+        result = check(self.process_response(response, packet))
+        transfer.update(length)
+        return result
 
-    def memory_write(self, address, data):
-        """ Writes data to the given address. """
-        request = {"address": {"type": Protocol.TYPE_U64, "value": address},
-                   "length": {"type": Protocol.TYPE_U32, "value": len(data)},
-                   "data": {"type": Protocol.TYPE_DATA, "value": data}}
-        response = {"address": {"type": Protocol.TYPE_U64},
-                    "length": {"type": Protocol.TYPE_U32}}
-        result = self.do_transaction(Protocol.COMMAND_MEMORY_WRITE, request, response)
-        if result["address"] != address or result["length"] != len(data):
-            raise self.ProtocolException("Different address or length in response")
+    def memory_read_vectored(self, segments):
+        """
+        Reads several memory areas by as few requests as possible. The segments are (address,
+        length) tuples or (address, buffer) tuples, where the buffer is a writable bytes-like
+        object, e.g. a memoryview slice of a larger buffer, which is filled in place. Returns the
+        list of the read bytes or the filled buffers in the order of the segments. Needs a target of
+        VERSION_VECTORED or above.
+        """
+        self.check_version(Protocol.VERSION_VECTORED, "Vectored memory read")
+        results = []
+        targets = []
+        for address, target in segments:
+            if isinstance(target, int):
+                buffer = bytearray(target)
+                results.append(buffer)
+            else:
+                buffer = memoryview(target).cast("B")
+                results.append(target)
+            targets.append((address, buffer))
+
+        for batch in self.split_segments(targets):
+            requested = [(address, len(buffer)) for address, buffer in batch]
+            data = memoryview(self.run_transaction(*self.create_memory_read_vectored(requested)))
+            offset = 0
+            for _, buffer in batch:
+                buffer[:] = data[offset:offset + len(buffer)]
+                offset += len(buffer)
+
+        return [bytes(result) if isinstance(result, bytearray) else result for result in results]
+
+    def create_memory_read_vectored(self, segments):
+        """ Returns the descriptors and the result check of a vectored memory read request. """
+        command = Protocol.COMMAND_MEMORY_READ_VECTORED
+        request = Protocol.build_request(
+            command, count=len(segments),
+            segments=[{"address": address, "length": length} for address, length in segments])
+        total_length = sum(length for _, length in segments)
+        response = Protocol.build_response(command, length=total_length)
+
+        def check(result):
+            if result["count"] != len(segments) or result["length"] != total_length:
+                raise self.ProtocolException("Different count or length in response")
+            return result["data"]
+
+        return command, request, response, check
+
+    def memory_write_vectored(self, segments):
+        """
+        Writes several memory areas by as few requests as possible. The segments are (address,
+        data) tuples where the data is a bytes-like object, e.g. a memoryview slice. Needs a target
+        of VERSION_VECTORED or above.
+
+        The target writes the segments while they are received, so a failed request can leave a
+        partial write: the segments outside of the user memory area are skipped with an invalid
+        argument error, but the valid segments of the request are written.
+        """
+        self.check_version(Protocol.VERSION_VECTORED, "Vectored memory write")
+        segments = [(address, memoryview(data).cast("B")) for address, data in segments]
+        for batch in self.split_segments(segments):
+            self.run_transaction(*self.create_memory_write_vectored(batch))
+
+    def create_memory_write_vectored(self, segments):
+        """ Returns the descriptors and the result check of a vectored memory write request. """
+        command = Protocol.COMMAND_MEMORY_WRITE_VECTORED
+        request = Protocol.build_request(
+            command, count=len(segments),
+            segments=[{"address": address, "length": len(data), "data": data}
+                      for address, data in segments])
+        total_length = sum(len(data) for _, data in segments)
+        response = Protocol.build_response(command)
+
+        def check(result):
+            if result["count"] != len(segments) or result["length"] != total_length:
+                raise self.ProtocolException("Different count or length in response")
+
+        return command, request, response, check
+
+    def check_version(self, version, feature):
+        """
+        Raises ProtocolException if the target is older than the version. The version of the
+        target is queried if negotiate_framing has not stored it yet.
+        """
+        if self.version is None:
+            self.version = self.get_version()
+        if self.version < version:
+            raise self.ProtocolException("%s needs target version 0x%04X or above, the target has "
+                                         "0x%04X" % (feature, version, self.version))
+
+    def split_segments(self, segments):
+        """
+        Groups (address, buffer) segments into batches of at most VECTORED_MAX_SEGMENTS segments
+        and chunk_size bytes. A segment longer than chunk_size gets its own batch.
+        """
+        batches = []
+        batch_length = 0
+        for segment in segments:
+            length = len(segment[1])
+            if not batches or len(batches[-1]) >= Protocol.VECTORED_MAX_SEGMENTS or \
+                    batch_length + length > self.chunk_size:
+                batches.append([])
+                batch_length = 0
+            batches[-1].append(segment)
+            batch_length += length
+        return batches
 
     def execute(self, address):
         """ Executes a context of the given address. """
-        request = {"address": {"type": Protocol.TYPE_U64, "value": address}}
-        response = {"address": {"type": Protocol.TYPE_U64},
-                    "result": {"type": Protocol.TYPE_U64}}
-        result = self.do_transaction(Protocol.COMMAND_EXECUTE, request, response)
+        command = Protocol.COMMAND_EXECUTE
+        result = self.do_transaction(command, Protocol.build_request(command, address=address),
+                                     Protocol.build_response(command))
         if result["address"] != address:
             raise self.ProtocolException("Different address in response")
         return result["result"]
 
     def reset(self):
-        """ Resets the target. """
-        self.do_transaction(Protocol.COMMAND_RESET, {}, {})
+        """ Resets the target. The restarted target uses v1 framing. """
+        self.do_transaction(Protocol.COMMAND_RESET, {},
+                            Protocol.build_response(Protocol.COMMAND_RESET))
+        self.framing = Protocol.FRAMING_V1
+
+    def set_baud_rate(self, baud_rate):
+        """
+        Switches the target and the connection to a new baud rate. The new baud rate is confirmed
+        by a GET_VERSION request and both sides fall back to the old baud rate if the confirmation
+        fails. The connection must have a receive timeout. Returns True if the new baud rate is in
+        use and False if the fallback has happened.
+        """
+        try:
+            old_baud_rate = self.connection.get_baudrate()
+        except Connection.ConnectionException as exception:
+            raise self.ProtocolException(exception) from exception
+
+        command = Protocol.COMMAND_SET_BAUD_RATE
+        result = self.do_transaction(command, Protocol.build_request(command, baud_rate=baud_rate),
+                                     Protocol.build_response(command))
+        if result["baud_rate"] != baud_rate:
+            raise self.ProtocolException("Different baud rate in response")
+        deadline = time.monotonic() + Protocol.BAUD_RATE_CONFIRM_TIMEOUT
+
+        if self.confirm_baud_rate(baud_rate, deadline):
+            return True
+
+        # The target returns to the old baud rate and framing when its confirmation timeout expires
+        time.sleep(max(0, deadline - time.monotonic()))
+        if self.confirm_baud_rate(old_baud_rate, framing=self.framing):
+            return False
+
+        # The target has accepted the confirmation but its responses were lost. The requests still
+        # get through, so the target is switched back without waiting for its response.
+        self.set_connection_baud_rate(baud_rate)
+        self.send_request(command, Protocol.build_request(command, baud_rate=old_baud_rate))
+        time.sleep(Protocol.BAUD_RATE_SETTLE_TIME)
+        if self.confirm_baud_rate(old_baud_rate):
+            return False
+
+        raise self.ProtocolException("Connection lost while changing baud rate")
+
+    def confirm_baud_rate(self, baud_rate, deadline=None, framing=FRAMING_V1):
+        """
+        Switches the connection to the baud rate and checks it by querying the version in the given
+        framing. A target which waits for the confirmation of a new baud rate only accepts v1
+        framing, otherwise the query uses the framing of the session. If the deadline is given, the
+        query is only repeated until then, otherwise it is attempted for a fixed number of times.
+        """
+        self.set_connection_baud_rate(baud_rate)
+        session_framing = self.framing
+        attempts = 0
+        while True:
+            self.discard_input()
+            try:
+                self.framing = framing
+                self.get_version()
+                return True
+            except self.ProtocolException:
+                attempts += 1
+            finally:
+                self.framing = session_framing
+
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return False
+            elif attempts >= Protocol.BAUD_RATE_CONFIRM_ATTEMPTS:
+                return False
+
+    def set_connection_baud_rate(self, baud_rate):
+        """ Changes the baud rate of the connection. """
+        try:
+            self.connection.set_baudrate(baud_rate)
+        except Connection.ConnectionException as exception:
+            raise self.ProtocolException(exception) from exception
+
+    def discard_input(self):
+        """ Drops the unread received data of the connection, e.g. a broken response. """
+        try:
+            self.connection.discard_input()
+        except Connection.ConnectionException as exception:
+            raise self.ProtocolException(exception) from exception
+
+    @staticmethod
+    def build_request(command, **values):
+        """
+        Builds the request descriptor of a command from its layout in DESCRIPTORS and the values of
+        the fields. The items of a list field are dictionaries of their field values, they are
+        flattened into numbered fields, e.g. address_0.
+        """
+        return Protocol.fill_fields(Protocol.DESCRIPTORS[command]["request"], values)
+
+    @staticmethod
+    def fill_fields(layout, values, suffix=""):
+        """ Adds the values to the fields of a layout, the suffix is appended to the keys. """
+        fields = {}
+        for key, element in layout.items():
+            if element["type"] == Protocol.TYPE_LIST:
+                for index, item in enumerate(values[key]):
+                    fields.update(Protocol.fill_fields(element["fields"], item,
+                                                       "%s_%d" % (suffix, index)))
+            else:
+                fields[key + suffix] = {"type": element["type"], "value": values[key]}
+        return fields
+
+    @staticmethod
+    def build_response(command, **lengths):
+        """
+        Builds the response descriptor of a command from its layout in DESCRIPTORS. The lengths of
+        the data fields are given by the names of the fields which hold them.
+        """
+        response = {}
+        for key, element in Protocol.DESCRIPTORS[command]["response"].items():
+            element = dict(element)
+            if element["type"] == Protocol.TYPE_DATA:
+                element["length"] = lengths[element["length"]]
+            response[key] = element
+        return response
 
     def do_transaction(self, command, request, response):
         """ Sends a requests and receives a response of a the given message descriptors. """
-        self.send_request(command, request)
-        response_packet = self.recv_response(command, response)
+        sequence = self.send_request(command, request)
+        response_packet = self.recv_response(command, response, sequence)
         return self.process_response(response, response_packet)
 
+    def run_transaction(self, command, request, response, check):
+        """ Runs a transaction and returns its result processed by the check function. """
+        return check(self.do_transaction(command, request, response))
+
     def send_request(self, command, request):
-        """ Builds a request packet and sends it. """
+        """ Builds a request packet and sends it. Returns the sequence number in v2 framing. """
         packet = Packet()
         packet.push_u16(command)
 
@@ -133,24 +616,36 @@ class Protocol:
                 packet.push_data(element["value"])
             else:
                 raise self.ProtocolException("Invalid data type: " + str(element["type"]))
-        packet.add_crc()
+
+        sequence = None
+        if self.framing == Protocol.FRAMING_V2:
+            sequence = self.sequence
+            self.sequence = (self.sequence + 1) & 0xffff
+            packet = Protocol.create_frame(sequence, packet.get_raw_data())
+        else:
+            packet.add_crc()
 
         try:
             self.connection.send(packet.get_raw_data())
         except Connection.ConnectionException as exception:
             raise self.ProtocolException(exception)
 
-    def recv_response(self, command, response):
-        """ Receives a response packet of the calculated length. """
-        response_payload_length = Protocol.calculate_response_length(response)
+        return sequence
 
+    def recv_response(self, command, response, sequence=None):
+        """ Receives a response packet of the calculated length. """
         try:
+            if self.framing == Protocol.FRAMING_V2:
+                return self.recv_frame(command, response, sequence)
+
+            response_payload_length = Protocol.calculate_response_length(response)
+
             packet = Packet()
             packet.push_data(self.connection.recv(2)) # Command bytes
             response_command = packet.peek_u16()
             if command != response_command:
                 if Protocol.COMMAND_ERROR == response_command:
-                    packet.push_data(self.connection.recv(5))
+                    packet.push_data(self.connection.recv(3)) # Error code and CRC
                     if not packet.check_crc():
                         raise self.ProtocolException("Invalid CRC in error response")
 
@@ -166,6 +661,58 @@ class Protocol:
 
         return packet
 
+    def recv_frame(self, command, response, sequence):
+        """
+        Receives a v2 response frame with the given sequence number. Frames of earlier requests
+        are dropped, so the stream recovers after a failed transaction. Returns the payload.
+        """
+        # The length is only protected by the CRC-8 of the header, so it is checked before reading
+        max_length = max(Protocol.MAX_FRAME_LENGTH,
+                         Protocol.calculate_response_length(response) + 1)
+        while True:
+            frame_sequence, length = self.recv_frame_header()
+            if length > max_length:
+                raise self.ProtocolException("Invalid frame length: %d" % length)
+            packet = Packet().push_data(self.connection.recv(length + 4))
+            if frame_sequence == sequence:
+                break
+
+        if not packet.check_crc32():
+            raise self.ProtocolException("Invalid CRC in response")
+        packet = Packet().push_data(packet.pop_data(length))
+
+        response_command = packet.peek_u16()
+        if command != response_command:
+            if Protocol.COMMAND_ERROR == response_command:
+                self.process_error_packet(packet)
+            raise self.ProtocolException("Invalid response command: 0x%04X" % response_command)
+
+        # The payload has the command instead of the CRC-8 of v1
+        if length != Protocol.calculate_response_length(response) + 1:
+            raise self.ProtocolException("Invalid response length: %d" % length)
+
+        return packet
+
+    def recv_frame_header(self):
+        """
+        Receives a v2 frame header and returns its sequence number and payload length. Bytes are
+        dropped until a valid header is found.
+        """
+        header = self.connection.recv(Protocol.FRAME_HEADER_LENGTH)
+        while True:
+            packet = Packet().push_data(header)
+            if packet.peek_u16() == Protocol.FRAME_MAGIC and packet.check_crc():
+                packet.pop_u16() # Magic
+                return packet.pop_u16(), packet.pop_u32()
+            header = header[1:] + self.connection.recv(1)
+
+    @staticmethod
+    def create_frame(sequence, payload):
+        """ Builds a v2 frame of the payload with header and CRC-32. """
+        frame = Packet().push_u16(Protocol.FRAME_MAGIC).push_u16(sequence). \
+            push_u32(len(payload)).add_crc()
+        return frame.push_data(Packet().push_data(payload).add_crc32().get_raw_data())
+
     def process_response(self, response, packet):
         """ Parses the response elements into an object. """
         result = {}
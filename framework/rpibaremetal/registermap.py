@@ -0,0 +1,230 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module implements named peripheral registers and bitfields on top of the 32 bit register
+access of the protocol. The register maps are described by a dictionary, which can be loaded from
+JSON or YAML files (the latter requires the PyYAML package):
+
+    name: GPIO
+    base_address: 0x3f200000
+    registers:
+      GPFSEL1:
+        offset: 0x04
+        fields:
+          FSEL14: {offset: 12, width: 3, values: {INPUT: 0, OUTPUT: 1, ALT5: 2}}
+      GPSET0: {offset: 0x1c, access: write-only}
+      GPLEV0: {offset: 0x34, access: read-only}
+
+Numbers can also be given as strings, e.g. "0x3f200000", because JSON has no hexadecimal literals.
+"""
+
+import json
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+ACCESS_READ_WRITE = "read-write"
+ACCESS_READ_ONLY = "read-only"
+ACCESS_WRITE_ONLY = "write-only"
+
+class RegisterMapException(Exception):
+    """ Exception type for invalid register map descriptions and accesses. """
+
+def parse_number(value):
+    """ Parses a number of the description which can be an integer or a string. """
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value, 0)
+    except (TypeError, ValueError) as exception:
+        raise RegisterMapException("Invalid number: %r" % (value,)) from exception
+
+class Field:
+    """ A bitfield of a register. The values dictionary maps symbolic names to field values. """
+
+    def __init__(self, name, description):
+        self.name = name
+        self.offset = parse_number(description["offset"])
+        self.width = parse_number(description.get("width", 1))
+        self.values = {key: parse_number(value)
+                       for key, value in description.get("values", {}).items()}
+        if self.offset < 0 or self.width <= 0 or self.offset + self.width > 32:
+            raise RegisterMapException("Invalid bit range of field " + name)
+        self.mask = ((1 << self.width) - 1) << self.offset
+
+    def extract(self, register_value):
+        """ Returns the value of the field from a register value. """
+        return (register_value & self.mask) >> self.offset
+
+    def encode(self, value):
+        """ Converts a field value or a symbolic name into the bits of the register value. """
+        if isinstance(value, str):
+            if value not in self.values:
+                raise RegisterMapException("Invalid value of field %s: %s" % (self.name, value))
+            value = self.values[value]
+        if not 0 <= value < (1 << self.width):
+            raise RegisterMapException("Value does not fit into field %s: %d" % (self.name, value))
+        return value << self.offset
+
+class Register:
+    """
+    A 32 bit register with a shadow copy of its last known value.
+
+    Volatile registers, e.g. status registers changed by the hardware, are read from the target on
+    every access. Non-volatile registers are read once and served from the shadow afterwards. Reads
+    of write-only registers return the last written value, or the reset value if the register is
+    volatile, e.g. a set or clear register, or it has not been written yet.
+
+    Field assignments, e.g. register.FSEL14 = "OUTPUT", are collected until commit, which updates
+    all of them by a single register write. The unchanged bits come from the shadow if it is valid,
+    otherwise from a register read.
+    """
+
+    def __init__(self, protocol, name, address, description):
+        self.__dict__.update({
+            "protocol": protocol,
+            "name": name,
+            "address": address,
+            "access": description.get("access", ACCESS_READ_WRITE),
+            "reset": parse_number(description.get("reset", 0)),
+            "fields": {key: Field(key, value)
+                       for key, value in description.get("fields", {}).items()},
+            "shadow": None,
+            "pending_mask": 0,
+            "pending_value": 0,
+        })
+        if self.access not in [ACCESS_READ_WRITE, ACCESS_READ_ONLY, ACCESS_WRITE_ONLY]:
+            raise RegisterMapException("Invalid access of register %s: %s" % (name, self.access))
+        self.__dict__["volatile"] = description.get("volatile", self.access == ACCESS_READ_ONLY)
+
+    def __getattr__(self, name):
+        if name not in self.__dict__.get("fields", {}):
+            raise AttributeError("Register %s has no field %s" % (self.__dict__.get("name"), name))
+        return self.get(name)
+
+    def __setattr__(self, name, value):
+        if name not in self.fields:
+            raise AttributeError("Register %s has no field %s" % (self.name, name))
+        self.set(**{name: value})
+
+    def read(self):
+        """ Returns the register value from the shadow or from the target by the policy. """
+        if self.access == ACCESS_WRITE_ONLY:
+            return self.reset if self.shadow is None else self.shadow
+        if self.shadow is not None and not self.volatile:
+            return self.shadow
+
+        value = self.protocol.register_read(self.address)
+        if not self.volatile:
+            self.__dict__["shadow"] = value
+        return value
+
+    def get(self, name):
+        """ Returns the value of a field. """
+        if name not in self.fields:
+            raise RegisterMapException("Register %s has no field %s" % (self.name, name))
+        return self.fields[name].extract(self.read())
+
+    def write(self, value):
+        """ Writes the whole register immediately. Pending field updates are dropped. """
+        if self.access == ACCESS_READ_ONLY:
+            raise RegisterMapException("Register %s is read-only" % self.name)
+        self.protocol.register_write(self.address, value)
+        self.__dict__.update({"pending_mask": 0, "pending_value": 0,
+                              "shadow": None if self.volatile else value})
+
+    def set(self, **fields):
+        """ Collects field updates until commit. """
+        if self.access == ACCESS_READ_ONLY:
+            raise RegisterMapException("Register %s is read-only" % self.name)
+        for name, value in fields.items():
+            if name not in self.fields:
+                raise RegisterMapException("Register %s has no field %s" % (self.name, name))
+            field = self.fields[name]
+            self.__dict__["pending_mask"] = self.pending_mask | field.mask
+            self.__dict__["pending_value"] = (self.pending_value & ~field.mask) | \
+                field.encode(value)
+
+    def modify(self, **fields):
+        """ Updates fields by a single register write. """
+        self.set(**fields)
+        self.commit()
+
+    def is_pending(self):
+        """ Returns True if there are field updates to commit. """
+        return self.pending_mask != 0
+
+    def commit(self):
+        """ Writes the collected field updates by a single register write. """
+        if not self.is_pending():
+            return
+        if self.pending_mask == 0xffffffff:
+            value = self.pending_value
+        else:
+            value = (self.read() & ~self.pending_mask) | self.pending_value
+        self.write(value)
+
+    def invalidate(self):
+        """ Forgets the shadow, e.g. after the target code has changed the register. """
+        self.__dict__["shadow"] = None
+
+class RegisterMap:
+    """
+    Named registers of a peripheral. The registers are available as attributes and by their names,
+    e.g. gpio.GPFSEL1.FSEL14 = "OUTPUT" or gpio["GPFSEL1"].modify(FSEL14=1). Leaving the map as a
+    context manager commits the pending field updates.
+    """
+
+    def __init__(self, protocol, description):
+        self.name = description.get("name", "")
+        self.base_address = parse_number(description.get("base_address", 0))
+        self.registers = {}
+        for name, register in description.get("registers", {}).items():
+            address = self.base_address + parse_number(register["offset"])
+            if address & 0x3:
+                raise RegisterMapException("Unaligned register: " + name)
+            self.registers[name] = Register(protocol, name, address, register)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def __getattr__(self, name):
+        registers = self.__dict__.get("registers", {})
+        if name not in registers:
+            raise AttributeError("Register map %s has no register %s" %
+                                 (self.__dict__.get("name"), name))
+        return registers[name]
+
+    def __getitem__(self, name):
+        return self.registers[name]
+
+    def __iter__(self):
+        return iter(self.registers.values())
+
+    def commit(self):
+        """ Commits the pending field updates of all registers. """
+        for register in self.registers.values():
+            register.commit()
+
+    def invalidate(self):
+        """ Forgets the shadows of all registers. """
+        for register in self.registers.values():
+            register.invalidate()
+
+def load_register_map(protocol, path):
+    """ Loads a register map description from a JSON or a YAML file. """
+    with open(path, "r", encoding="utf-8") as description_file:
+        if path.endswith(".json"):
+            description = json.load(description_file)
+        else:
+            if yaml is None:
+                raise RegisterMapException("YAML register maps require the PyYAML package")
+            description = yaml.safe_load(description_file)
+    return RegisterMap(protocol, description)
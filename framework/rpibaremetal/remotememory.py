@@ -0,0 +1,230 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module contains a cached view of a memory region of the target. Many small accesses are served
+from a page cache which is filled and written back by a few bulk transfers.
+"""
+
+import struct
+from collections import OrderedDict
+
+class RemoteMemory:
+    """
+    View of the target memory region of the given address and length, which supports indexing,
+    slicing and struct typed access. Indices are relative to the start of the region.
+
+    The region is split into pages of page_size bytes which are cached in LRU order up to
+    cache_pages pages. The missing pages of an access are fetched by one memory read per adjacent
+    run. Writes are kept in the cache until flush, which writes back each adjacent run of dirty
+    pages by one memory write. Evicting a dirty page flushes the cache.
+
+    Converting the view by bytes() or to_memoryview() reads the whole region.
+    """
+
+    class RemoteMemoryException(Exception):
+        """ RemoteMemory specific exception type. """
+
+    def __init__(self, protocol, address, length, page_size=0x1000, cache_pages=64):
+        if page_size <= 0 or cache_pages <= 0:
+            raise self.RemoteMemoryException("Invalid page size or cache size")
+
+        self.protocol = protocol
+        self.address = address
+        self.length = length
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.pages = OrderedDict()
+        self.dirty = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, length = self.get_slice_range(key)
+            return self.read(start, length)
+
+        index = self.get_index(key)
+        return self.read(index, 1)[0]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, length = self.get_slice_range(key)
+            if len(value) != length:
+                raise self.RemoteMemoryException("The size of a slice cannot be changed")
+            self.write(start, value)
+        else:
+            self.write(self.get_index(key), bytes([value]))
+
+    def __bytes__(self):
+        return self.read(0, self.length)
+
+    def to_memoryview(self):
+        """
+        Returns a read-only memoryview of a snapshot of the whole region, e.g. for the functions
+        which take bytes-like objects. Later writes of the view do not change the snapshot.
+        """
+        return memoryview(self.read(0, self.length))
+
+    def get_index(self, index):
+        """ Converts a possibly negative index into an offset of the region. """
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("RemoteMemory index out of range")
+        return index
+
+    def get_slice_range(self, key):
+        """ Converts a contiguous slice into the start offset and length. """
+        start, stop, step = key.indices(self.length)
+        if step != 1:
+            raise self.RemoteMemoryException("Only contiguous slices are supported")
+        return start, max(0, stop - start)
+
+    def check_range(self, offset, length):
+        """ Checks if the range is inside the region. """
+        if offset < 0 or length < 0 or offset + length > self.length:
+            raise self.RemoteMemoryException("Range is outside of the region: 0x%x, %d" %
+                                             (offset, length))
+
+    def read(self, offset, length):
+        """ Reads a range of the region through the cache. """
+        self.check_range(offset, length)
+        result = bytearray()
+        for page, start, end in self.iterate_pages(offset, length, True):
+            result += self.pages[page][start:end]
+        self.evict()
+        return bytes(result)
+
+    def write(self, offset, data):
+        """ Writes a range of the region into the cache. Call flush to write it to the target. """
+        data = memoryview(bytes(data))
+        self.check_range(offset, len(data))
+        position = 0
+        for page, start, end in self.iterate_pages(offset, len(data), False):
+            self.pages[page][start:end] = data[position:position + end - start]
+            self.dirty.add(page)
+            position += end - start
+        self.evict()
+
+    def unpack(self, fmt, offset):
+        """ Reads values of a struct format, e.g. unpack("<IH", 0x10). """
+        return struct.unpack(fmt, self.read(offset, struct.calcsize(fmt)))
+
+    def pack(self, fmt, offset, *values):
+        """ Writes values of a struct format, e.g. pack("<IH", 0x10, 1, 2). """
+        self.write(offset, struct.pack(fmt, *values))
+
+    def read_u8(self, offset):
+        """ Reads an 8 bit unsigned value. """
+        return self.unpack("<B", offset)[0]
+
+    def read_u16(self, offset):
+        """ Reads a 16 bit unsigned value. """
+        return self.unpack("<H", offset)[0]
+
+    def read_u32(self, offset):
+        """ Reads a 32 bit unsigned value. """
+        return self.unpack("<I", offset)[0]
+
+    def read_u64(self, offset):
+        """ Reads a 64 bit unsigned value. """
+        return self.unpack("<Q", offset)[0]
+
+    def write_u8(self, offset, value):
+        """ Writes an 8 bit unsigned value. """
+        self.pack("<B", offset, value)
+
+    def write_u16(self, offset, value):
+        """ Writes a 16 bit unsigned value. """
+        self.pack("<H", offset, value)
+
+    def write_u32(self, offset, value):
+        """ Writes a 32 bit unsigned value. """
+        self.pack("<I", offset, value)
+
+    def write_u64(self, offset, value):
+        """ Writes a 64 bit unsigned value. """
+        self.pack("<Q", offset, value)
+
+    def flush(self):
+        """ Writes the dirty pages back to the target, one memory write per adjacent run. """
+        for first, last in self.get_runs(sorted(self.dirty)):
+            data = b"".join(bytes(self.pages[page]) for page in range(first, last + 1))
+            self.protocol.memory_write(self.get_page_address(first), data)
+            self.dirty.difference_update(range(first, last + 1))
+
+    def invalidate(self):
+        """ Drops the cached pages including the unflushed writes, e.g. after the target run. """
+        self.pages.clear()
+        self.dirty.clear()
+
+    def iterate_pages(self, offset, length, fetch):
+        """
+        Makes the pages of the range available in the cache and returns (page, start, end) tuples of
+        the range. Pages which will be fully overwritten are not fetched unless fetch is set. The
+        cache may exceed its size until the caller evicts the pages.
+        """
+        ranges = []
+        missing = []
+        position = offset
+        while position < offset + length:
+            page = position // self.page_size
+            start = position - page * self.page_size
+            end = min(self.get_page_length(page), offset + length - page * self.page_size)
+            ranges.append((page, start, end))
+            if page not in self.pages:
+                if fetch or start != 0 or end != self.get_page_length(page):
+                    missing.append(page)
+                else:
+                    self.pages[page] = bytearray(self.get_page_length(page))
+            position = page * self.page_size + end
+
+        for first, last in self.get_runs(missing):
+            data = self.protocol.memory_read(self.get_page_address(first),
+                                             self.get_run_length(first, last))
+            for page in range(first, last + 1):
+                start = (page - first) * self.page_size
+                self.pages[page] = bytearray(data[start:start + self.get_page_length(page)])
+
+        for page, _, _ in ranges:
+            self.pages.move_to_end(page)
+        return ranges
+
+    def evict(self):
+        """ Drops the least recently used pages above the cache size. """
+        while len(self.pages) > self.cache_pages:
+            evicted = next(iter(self.pages))
+            if evicted in self.dirty:
+                self.flush()
+            del self.pages[evicted]
+
+    def get_page_address(self, page):
+        """ Returns the target address of a page. """
+        return self.address + page * self.page_size
+
+    def get_page_length(self, page):
+        """ Returns the length of a page, the last page of the region can be shorter. """
+        return min(self.page_size, self.length - page * self.page_size)
+
+    def get_run_length(self, first, last):
+        """ Returns the length of an adjacent run of pages. """
+        return (last - first) * self.page_size + self.get_page_length(last)
+
+    @staticmethod
+    def get_runs(pages):
+        """ Groups sorted page numbers into (first, last) tuples of adjacent runs. """
+        runs = []
+        for page in pages:
+            if runs and runs[-1][1] + 1 == page:
+                runs[-1] = (runs[-1][0], page)
+            else:
+                runs.append((page, page))
+        return runs
@@ -0,0 +1,183 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module makes a Protocol instance shareable between threads. A single worker thread owns the
+protocol and runs the requests of the other threads from a priority queue.
+"""
+
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from operator import methodcaller
+
+class Request:
+    """ A single protocol call which is completed in one step. """
+
+    def __init__(self, function, args):
+        self.future = Future()
+        self.function = function
+        self.args = args
+        self.started = False
+
+    def start(self):
+        """ Marks the request running. Returns False if it was cancelled while waiting. """
+        if self.started:
+            return True
+        self.started = True
+        return self.future.set_running_or_notify_cancel()
+
+    def step(self, protocol):
+        """ Runs the next step of the request. Returns True if the request is completed. """
+        self.future.set_result(self.function(protocol, *self.args))
+        return True
+
+class MemoryReadRequest(Request):
+    """ Memory read which is split into chunks, so other requests can run between the chunks. """
+
+    def __init__(self, address, length, chunk_size):
+        Request.__init__(self, None, ())
+        self.address = address
+        self.length = length
+        self.chunk_size = chunk_size
+        self.data = bytearray()
+
+    def step(self, protocol):
+        length = min(self.chunk_size, self.length - len(self.data))
+        self.data += protocol.memory_read(self.address + len(self.data), length)
+        if len(self.data) < self.length:
+            return False
+        self.future.set_result(bytes(self.data))
+        return True
+
+class MemoryWriteRequest(Request):
+    """ Memory write which is split into chunks, so other requests can run between the chunks. """
+
+    def __init__(self, address, data, chunk_size):
+        Request.__init__(self, None, ())
+        self.address = address
+        self.data = memoryview(bytes(data))
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def step(self, protocol):
+        chunk = self.data[self.offset:self.offset + self.chunk_size]
+        protocol.memory_write(self.address + self.offset, chunk)
+        self.offset += len(chunk)
+        if self.offset < len(self.data):
+            return False
+        self.future.set_result(None)
+        return True
+
+class ProtocolScheduler:
+    """
+    Thread-safe front end of a Protocol. The methods mirror the Protocol interface but return
+    concurrent.futures.Future objects. Requests of lower priority value run first, requests of the
+    same priority run in submission order. The priority is between PRIORITY_HIGH and
+    PRIORITY_BULK. Memory transfers are split into chunks and the remaining part of a transfer is
+    requeued after each chunk, so a register access waits for one chunk at most instead of the
+    whole transfer.
+    """
+
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
+    PRIORITY_BULK = 2
+    PRIORITY_STOP = 3 # Behind every valid priority, so close runs the queued requests first
+
+    CHUNK_SIZE = 0x1000
+
+    class SchedulerException(Exception):
+        """ ProtocolScheduler specific exception type. """
+
+    def __init__(self, protocol, chunk_size=CHUNK_SIZE):
+        self.protocol = protocol
+        self.chunk_size = chunk_size
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="ProtocolScheduler", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Runs the already submitted requests and stops the worker thread. """
+        with self.lock:
+            if not self.stopped:
+                self.stopped = True
+                self.queue.put((ProtocolScheduler.PRIORITY_STOP, next(self.counter), None))
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def submit(self, function, *args, priority=PRIORITY_NORMAL):
+        """
+        Schedules a call of function(protocol, *args), e.g. submit(Protocol.memory_write_compressed,
+        address, data), and returns the future of its result.
+        """
+        return self.submit_request(Request(function, args), priority)
+
+    def submit_request(self, request, priority):
+        """ Puts a request into the queue. """
+        if not ProtocolScheduler.PRIORITY_HIGH <= priority <= ProtocolScheduler.PRIORITY_BULK:
+            raise self.SchedulerException("Invalid priority: %s" % priority)
+        with self.lock:
+            if self.stopped:
+                raise self.SchedulerException("The scheduler is closed")
+            self.queue.put((priority, next(self.counter), request))
+        return request.future
+
+    def run(self):
+        """ Worker thread, the only user of the protocol. """
+        while True:
+            priority, _, request = self.queue.get()
+            if request is None:
+                break
+            if not request.start():
+                continue
+
+            try:
+                completed = request.step(self.protocol)
+            except Exception as exception: #pylint: disable=broad-except
+                request.future.set_exception(exception)
+                continue
+
+            if not completed:
+                self.queue.put((priority, next(self.counter), request))
+
+    def get_version(self, priority=PRIORITY_NORMAL):
+        """ Schedules Protocol.get_version. """
+        return self.submit(methodcaller("get_version"), priority=priority)
+
+    def get_base_address(self, priority=PRIORITY_NORMAL):
+        """ Schedules Protocol.get_base_address. """
+        return self.submit(methodcaller("get_base_address"), priority=priority)
+
+    def register_read(self, address, priority=PRIORITY_HIGH):
+        """ Schedules Protocol.register_read. """
+        return self.submit(methodcaller("register_read", address), priority=priority)
+
+    def register_write(self, address, data, priority=PRIORITY_HIGH):
+        """ Schedules Protocol.register_write. """
+        return self.submit(methodcaller("register_write", address, data), priority=priority)
+
+    def memory_read(self, address, length, priority=PRIORITY_BULK):
+        """ Schedules a chunked memory read. """
+        return self.submit_request(MemoryReadRequest(address, length, self.chunk_size), priority)
+
+    def memory_write(self, address, data, priority=PRIORITY_BULK):
+        """ Schedules a chunked memory write. """
+        return self.submit_request(MemoryWriteRequest(address, data, self.chunk_size), priority)
+
+    def execute(self, address, priority=PRIORITY_NORMAL):
+        """ Schedules Protocol.execute. """
+        return self.submit(methodcaller("execute", address), priority=priority)
+
+    def reset(self, priority=PRIORITY_NORMAL):
+        """ Schedules Protocol.reset. """
+        return self.submit(methodcaller("reset"), priority=priority)
@@ -0,0 +1,497 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module contains a Python model of the target kernel which makes it possible to test the host
+side without a board. The simulated target is reachable through a pseudo terminal.
+"""
+
+import os
+import random
+import re
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+
+from rpibaremetal.compression import CompressionException, decompress
+from rpibaremetal.packet import Packet
+from rpibaremetal.protocol import Protocol
+
+class SimulatedTarget:
+    """
+    Simulates the kernel behind a pseudo terminal. The host connects to the slave side of the
+    terminal through SerialConnection using the path in the port attribute.
+
+    The baud rate of the host is read from the terminal settings. When it differs from the baud rate
+    of the target, the bytes sent by the host are dropped like the bytes with framing errors in the
+    kernel and the bytes sent by the target are garbled. Above max_baud_rate the bytes sent by the
+    target are corrupted with the probability of error_rate, which models a cable or adapter with
+    limited bandwidth.
+
+    The receive buffering of the kernel is modelled in the link time: the target reads only the
+    bytes it is processing, and while it transmits a response, the host data which arrives during
+    the same time is stored in a buffer of rx_buffer_size bytes. The rest is dropped like an overrun
+    of the UART. The default size is the RX FIFO and the ring buffer of the kernel, while
+    RX_FIFO_SIZE alone models a kernel which does not drain the FIFO while transmitting.
+    """
+
+    VERSION = 0x0201
+    BASE_ADDRESS = 0x4000
+    DEFAULT_BAUD_RATE = 115200
+    MAX_BAUD_RATE = 3125000
+    BAUD_RATE_CONFIRM_TIMEOUT = 0.2
+
+    POLL_INTERVAL = 0.05
+    RECEIVE_LENGTH = 4096
+    RX_FIFO_SIZE = 16
+    RX_RING_SIZE = 4096
+    MISMATCH_PATTERN = 0xa5
+
+    SPEEDS = {getattr(termios, name): int(name[1:]) for name in dir(termios)
+              if re.fullmatch(r"B\d+", name)}
+
+    class Stopped(Exception):
+        """ Raised inside the simulation thread for stopping the simulation. """
+
+    def __init__(self, memory_size=0x100000, #pylint: disable=too-many-arguments
+                 max_baud_rate=None, error_rate=0.01, seed=0,
+                 rx_buffer_size=RX_FIFO_SIZE + RX_RING_SIZE):
+        self.memory = bytearray(memory_size)
+        self.functions = {}
+        self.baud_rate = SimulatedTarget.DEFAULT_BAUD_RATE
+        self.max_baud_rate = max_baud_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.rx_buffer_size = rx_buffer_size
+        self.rx_overruns = 0
+
+        self.master = None
+        self.slave = None
+        self.port = None
+        self.thread = None
+        self.running = False
+        self.rx_buffer = bytearray()
+        self.request = bytearray()
+
+        self.framing = Protocol.FRAMING_V1
+        self.sequence = 0
+        self.rx_remaining = 0
+        self.rx_in_frame = False
+        self.rx_valid = True
+
+        self.handlers = {
+            Protocol.COMMAND_GET_VERSION: self.handle_get_version,
+            Protocol.COMMAND_GET_BASE_ADDRESS: self.handle_get_base_address,
+            Protocol.COMMAND_REGISTER_READ: self.handle_register_read,
+            Protocol.COMMAND_REGISTER_WRITE: self.handle_register_write,
+            Protocol.COMMAND_MEMORY_READ: self.handle_memory_read,
+            Protocol.COMMAND_MEMORY_WRITE: self.handle_memory_write,
+            Protocol.COMMAND_MEMORY_WRITE_COMPRESSED: self.handle_memory_write_compressed,
+            Protocol.COMMAND_MEMORY_READ_VECTORED: self.handle_memory_read_vectored,
+            Protocol.COMMAND_MEMORY_WRITE_VECTORED: self.handle_memory_write_vectored,
+            Protocol.COMMAND_EXECUTE: self.handle_execute,
+            Protocol.COMMAND_RESET: self.handle_reset,
+            Protocol.COMMAND_SET_BAUD_RATE: self.handle_set_baud_rate,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """ Creates the pseudo terminal and starts the simulation thread. Returns the port path. """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        """ Stops the simulation thread and closes the pseudo terminal. """
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def run(self):
+        """ Main loop of the simulated kernel. """
+        try:
+            while True:
+                command = self.rx_start()
+                handler = self.handlers.get(command)
+                if handler:
+                    handler(command)
+                else:
+                    self.send_error(Protocol.ERRORCODE_INVALID_COMMAND)
+        except SimulatedTarget.Stopped:
+            pass
+
+    # Link model
+
+    def get_host_baud_rate(self):
+        """ Returns the baud rate which is set on the host side of the terminal. """
+        return SimulatedTarget.SPEEDS.get(termios.tcgetattr(self.slave)[5])
+
+    def receive(self, timeout, length=RECEIVE_LENGTH, buffered=False):
+        """
+        Waits for at most length bytes from the host and puts them into the RX buffer, False means
+        timeout. Buffered data is limited by rx_buffer_size, the excess is counted in rx_overruns.
+        """
+        if not self.running:
+            raise SimulatedTarget.Stopped()
+
+        readable, _, _ = select.select([self.master], [], [],
+                                       min(timeout, SimulatedTarget.POLL_INTERVAL))
+        if not readable:
+            return False
+
+        data = os.read(self.master, length)
+        if self.get_host_baud_rate() == self.baud_rate:
+            if buffered:
+                space = max(0, self.rx_buffer_size - len(self.rx_buffer))
+                self.rx_overruns += max(0, len(data) - space)
+                data = data[:space]
+            self.rx_buffer += data
+        return True
+
+    def transmit(self, data):
+        """
+        Sends data to the host through the modelled link. The host data arriving during the
+        transmission is buffered.
+        """
+        if self.get_host_baud_rate() != self.baud_rate:
+            data = bytes(byte ^ SimulatedTarget.MISMATCH_PATTERN for byte in data)
+        elif self.max_baud_rate is not None and self.baud_rate > self.max_baud_rate:
+            data = bytes(byte ^ (1 << self.random.randrange(8))
+                         if self.random.random() < self.error_rate else byte for byte in data)
+        # Only the data which was sent before the response can arrive during its transmission
+        self.receive(0, len(data), buffered=True)
+        os.write(self.master, data)
+
+    # Packet handling
+
+    def rx_raw(self, length):
+        """ Receives data of the given length from the link. """
+        while len(self.rx_buffer) < length:
+            self.receive(SimulatedTarget.POLL_INTERVAL, length - len(self.rx_buffer))
+        data = bytes(self.rx_buffer[:length])
+        del self.rx_buffer[:length]
+        return data
+
+    def rx_start(self):
+        """
+        Receives the start of a request and returns its command. Like the kernel, the simulated
+        target switches to v2 framing at the first valid v2 header and then drops any data until a
+        valid header is found.
+        """
+        self.request = bytearray()
+        if self.framing == Protocol.FRAMING_V1:
+            command = self.rx_u16()
+            if command != Protocol.FRAME_MAGIC or \
+                    not self.parse_header(self.request + self.rx_raw(7)):
+                return command
+            self.framing = Protocol.FRAMING_V2
+            return self.rx_u16()
+
+        if self.rx_in_frame:
+            self.rx_data(self.rx_remaining)
+            self.rx_raw(4)
+
+        header = self.rx_raw(Protocol.FRAME_HEADER_LENGTH)
+        while not self.parse_header(header):
+            header = header[1:] + self.rx_raw(1)
+        return self.rx_u16()
+
+    def parse_header(self, header):
+        """ Checks a v2 header and sets up the receiving of the frame. """
+        packet = Packet().push_data(header)
+        if packet.peek_u16() != Protocol.FRAME_MAGIC or not packet.check_crc():
+            return False
+        packet.pop_u16() # Magic
+        self.sequence = packet.pop_u16()
+        self.rx_remaining = packet.pop_u32()
+        self.rx_in_frame = True
+        self.rx_valid = True
+        self.request = bytearray()
+        return True
+
+    def rx_data(self, length):
+        """ Receives request data of the given length. """
+        if self.framing == Protocol.FRAMING_V2:
+            if length > self.rx_remaining:
+                # Never read beyond the payload of the frame
+                self.rx_valid = False
+                data = self.rx_raw(self.rx_remaining) + bytes(length - self.rx_remaining)
+                self.rx_remaining = 0
+                self.request += data
+                return data
+            self.rx_remaining -= length
+
+        data = self.rx_raw(length)
+        self.request += data
+        return data
+
+    def rx_u16(self):
+        """ Receives a little endian 16 bit unsigned value of the request. """
+        return struct.unpack("<H", self.rx_data(2))[0]
+
+    def rx_u32(self):
+        """ Receives a little endian 32 bit unsigned value of the request. """
+        return struct.unpack("<I", self.rx_data(4))[0]
+
+    def rx_u64(self):
+        """ Receives a little endian 64 bit unsigned value of the request. """
+        return struct.unpack("<Q", self.rx_data(8))[0]
+
+    def rx_validate_crc(self):
+        """ Receives the CRC of the request and checks it. """
+        if self.framing == Protocol.FRAMING_V1:
+            crc = Packet.calculate_crc(self.request)
+            return self.rx_raw(1)[0] == crc
+
+        if self.rx_remaining:
+            # Trailing payload which was not processed by the command
+            self.rx_data(self.rx_remaining)
+            self.rx_valid = False
+        self.rx_in_frame = False
+        packet = Packet().push_data(self.request).push_data(self.rx_raw(4))
+        return self.rx_valid and packet.check_crc32()
+
+    def send_packet(self, packet):
+        """ Adds CRC or v2 framing to the packet and sends it. """
+        if self.framing == Protocol.FRAMING_V2:
+            packet = Protocol.create_frame(self.sequence, packet.get_raw_data())
+        else:
+            packet.add_crc()
+        self.transmit(packet.get_raw_data())
+
+    def send_error(self, error_code):
+        """ Sends an error response. """
+        self.send_packet(Packet().push_u16(Protocol.COMMAND_ERROR).push_u16(error_code))
+
+    def is_valid_range(self, address, length):
+        """ Checks if the memory range is covered by the simulated memory. """
+        return address + length <= len(self.memory)
+
+    # Command handlers
+
+    def handle_get_version(self, command):
+        """ Handles GET_VERSION command. """
+        if self.rx_validate_crc():
+            self.send_packet(Packet().push_u16(command).push_u16(SimulatedTarget.VERSION))
+        else:
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+
+    def handle_get_base_address(self, command):
+        """ Handles GET_BASE_ADDRESS command. """
+        if self.rx_validate_crc():
+            self.send_packet(Packet().push_u16(command).push_u64(SimulatedTarget.BASE_ADDRESS))
+        else:
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+
+    def handle_register_read(self, command):
+        """ Handles REGISTER_READ command. """
+        address = self.rx_u64()
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+        elif address & 0x3 or not self.is_valid_range(address, 4):
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+        else:
+            self.send_packet(Packet().push_u16(command).push_u64(address).
+                             push_data(self.memory[address:address + 4]))
+
+    def handle_register_write(self, command):
+        """ Handles REGISTER_WRITE command. """
+        address = self.rx_u64()
+        data = self.rx_u32()
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+        elif address < SimulatedTarget.BASE_ADDRESS or address & 0x3 or \
+                not self.is_valid_range(address, 4):
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+        else:
+            self.memory[address:address + 4] = struct.pack("<I", data)
+            self.send_packet(Packet().push_u16(command).push_u64(address).push_u32(data))
+
+    def handle_memory_read(self, command):
+        """ Handles MEMORY_READ command. """
+        address = self.rx_u64()
+        length = self.rx_u32()
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+        elif not self.is_valid_range(address, length):
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+        else:
+            self.send_packet(Packet().push_u16(command).push_u64(address).push_u32(length).
+                             push_data(bytes(self.memory[address:address + length])))
+
+    def handle_memory_write(self, command):
+        """ Handles MEMORY_WRITE command. """
+        address = self.rx_u64()
+        length = self.rx_u32()
+        data = self.rx_data(length)
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+        elif address < SimulatedTarget.BASE_ADDRESS or not self.is_valid_range(address, length):
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+        else:
+            self.memory[address:address + length] = data
+            self.send_packet(Packet().push_u16(command).push_u64(address).push_u32(length))
+
+    def handle_memory_write_compressed(self, command):
+        """ Handles MEMORY_WRITE_COMPRESSED command. """
+        address = self.rx_u64()
+        length = self.rx_u32()
+        codec = self.rx_data(1)[0]
+        compressed = self.rx_data(self.rx_u32())
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+            return
+        if address < SimulatedTarget.BASE_ADDRESS or not self.is_valid_range(address, length) or \
+                codec != Protocol.CODEC_LZ4:
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+            return
+
+        try:
+            self.memory[address:address + length] = decompress(compressed, length)
+        except CompressionException:
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+            return
+        self.send_packet(Packet().push_u16(command).push_u64(address).push_u32(length))
+
+    def handle_memory_read_vectored(self, command):
+        """
+        Handles MEMORY_READ_VECTORED command. Like the kernel, only the segments within the limit
+        are kept, the rest of the list is received and dropped.
+        """
+        count = self.rx_u32()
+        segments = []
+        for _ in range(count):
+            segment = (self.rx_u64(), self.rx_u32())
+            if len(segments) < Protocol.VECTORED_MAX_SEGMENTS:
+                segments.append(segment)
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+            return
+        total_length = sum(length for _, length in segments)
+        if count > Protocol.VECTORED_MAX_SEGMENTS or total_length > 0xffffffff or \
+                not all(self.is_valid_range(address, length) for address, length in segments):
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+            return
+
+        packet = Packet().push_u16(command).push_u32(count).push_u32(total_length)
+        for address, length in segments:
+            packet.push_data(bytes(self.memory[address:address + length]))
+        self.send_packet(packet)
+
+    def handle_memory_write_vectored(self, command):
+        """
+        Handles MEMORY_WRITE_VECTORED command. Like the kernel, the segments are written while they
+        are received, so the valid segments are written even if the request fails. The segments
+        outside of the user memory area are skipped.
+        """
+        count = self.rx_u32()
+        total_length = 0
+        valid = True
+        for _ in range(count):
+            address = self.rx_u64()
+            data = self.rx_data(self.rx_u32())
+            total_length += len(data)
+            if address >= SimulatedTarget.BASE_ADDRESS and self.is_valid_range(address, len(data)):
+                self.memory[address:address + len(data)] = data
+            else:
+                valid = False
+
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+        elif not valid or total_length > 0xffffffff:
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+        else:
+            self.send_packet(Packet().push_u16(command).push_u32(count).push_u32(total_length))
+
+    def handle_execute(self, command):
+        """
+        Handles EXECUTE command. The function pointer of the context selects a Python callable from
+        the functions dictionary, which gets the x0-x7 values of the context.
+        """
+        address = self.rx_u64()
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+            return
+
+        context_length = 9 * 8
+        if address < SimulatedTarget.BASE_ADDRESS or \
+                not self.is_valid_range(address, context_length):
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+            return
+
+        context = struct.unpack("<9Q", self.memory[address:address + context_length])
+        function = self.functions.get(context[0])
+        if not function:
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+            return
+
+        result = function(*context[1:]) & 0xffffffffffffffff
+        self.memory[address + 8:address + 16] = struct.pack("<Q", result)
+        self.send_packet(Packet().push_u16(command).push_u64(address).push_u64(result))
+
+    def handle_reset(self, command):
+        """ Handles RESET command. The restarted kernel uses the default baud rate and framing. """
+        if self.rx_validate_crc():
+            self.send_packet(Packet().push_u16(command))
+            self.baud_rate = SimulatedTarget.DEFAULT_BAUD_RATE
+            self.framing = Protocol.FRAMING_V1
+            self.rx_in_frame = False
+            self.rx_buffer.clear()
+        else:
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+
+    def handle_set_baud_rate(self, command):
+        """
+        Handles SET_BAUD_RATE command. After the response the new baud rate must be confirmed by a
+        GET_VERSION request within the timeout, otherwise the old baud rate is restored.
+        """
+        baud_rate = self.rx_u32()
+        if not self.rx_validate_crc():
+            self.send_error(Protocol.ERRORCODE_INVALID_CRC)
+            return
+        if baud_rate == 0 or baud_rate > SimulatedTarget.MAX_BAUD_RATE:
+            self.send_error(Protocol.ERRORCODE_INVALID_ARG)
+            return
+
+        # The response is still sent with the old baud rate
+        self.send_packet(Packet().push_u16(command).push_u32(baud_rate))
+
+        old_baud_rate = self.baud_rate
+        self.baud_rate = baud_rate
+        self.rx_buffer.clear()
+
+        # The command and CRC bytes of the GET_VERSION request are all zeros
+        deadline = time.monotonic() + SimulatedTarget.BAUD_RATE_CONFIRM_TIMEOUT
+        window = b"\xff\xff\xff"
+        while True:
+            while self.rx_buffer:
+                window = window[1:] + bytes([self.rx_buffer.pop(0)])
+                if window == b"\x00\x00\x00":
+                    # The confirmation is always a v1 request regardless of the framing in use
+                    framing = self.framing
+                    self.framing = Protocol.FRAMING_V1
+                    self.send_packet(Packet().push_u16(Protocol.COMMAND_GET_VERSION).
+                                     push_u16(SimulatedTarget.VERSION))
+                    self.framing = framing
+                    return
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.receive(remaining)
+
+        self.baud_rate = old_baud_rate
@@ -0,0 +1,325 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module handles the binary trace files of the wire traffic and decodes them into protocol
+transactions for offline analysis.
+
+A trace file starts with a magic and a version byte followed by records. Each record consists of
+the event type, the monotonic timestamp in nanoseconds, the data length and the data.
+"""
+
+import struct
+
+from rpibaremetal.packet import Packet
+from rpibaremetal.protocol import Protocol
+
+TRACE_MAGIC = b"RBMT"
+TRACE_VERSION = 1
+TRACE_RECORD = struct.Struct("<BQI")
+
+EVENT_SEND = 1
+EVENT_RECV = 2
+EVENT_RECV_ERROR = 3
+EVENT_BAUDRATE = 4
+EVENT_DISCARD = 5
+
+class TraceException(Exception):
+    """ Exception type for invalid trace files. """
+
+class TraceEvent:
+    """ A single recorded event of a connection. """
+
+    def __init__(self, event_type, timestamp, data=b""):
+        self.type = event_type
+        self.timestamp = timestamp
+        self.data = data
+
+    def get_baudrate(self):
+        """ Returns the baud rate of a baud rate change event. """
+        return struct.unpack("<I", self.data)[0]
+
+class TraceWriter:
+    """ Writes trace events into a binary file. """
+
+    def __init__(self, path):
+        self.file = open(path, "wb") #pylint: disable=consider-using-with
+        try:
+            self.file.write(TRACE_MAGIC + bytes([TRACE_VERSION]))
+        except BaseException:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, event):
+        """ Appends an event to the trace. """
+        self.file.write(TRACE_RECORD.pack(event.type, event.timestamp, len(event.data)))
+        self.file.write(event.data)
+
+    def close(self):
+        """ Flushes and closes the trace file. """
+        self.file.close()
+
+def read_trace(path):
+    """ Reads all events of a trace file. """
+    with open(path, "rb") as trace_file:
+        data = trace_file.read()
+
+    if data[:len(TRACE_MAGIC)] != TRACE_MAGIC or len(data) <= len(TRACE_MAGIC):
+        raise TraceException("Invalid trace file")
+    if data[len(TRACE_MAGIC)] != TRACE_VERSION:
+        raise TraceException("Unsupported trace version: %d" % data[len(TRACE_MAGIC)])
+
+    events = []
+    position = len(TRACE_MAGIC) + 1
+    while position < len(data):
+        if position + TRACE_RECORD.size > len(data):
+            raise TraceException("Truncated trace record")
+        event_type, timestamp, length = TRACE_RECORD.unpack_from(data, position)
+        position += TRACE_RECORD.size
+        if position + length > len(data):
+            raise TraceException("Truncated trace data")
+        events.append(TraceEvent(event_type, timestamp, data[position:position + length]))
+        position += length
+
+    return events
+
+class Transaction:
+    """
+    A decoded request and response pair. The request and response attributes contain the parsed
+    fields by the descriptors of Protocol, the times are in seconds from the start of the trace.
+    """
+
+    def __init__(self, command, framing, sequence, request, start, request_length):
+        self.command = command
+        self.name = Protocol.DESCRIPTORS.get(command, {}).get("name", "unknown")
+        self.framing = framing
+        self.sequence = sequence
+        self.request = request
+        self.response = None
+        self.error = None
+        self.start = start
+        self.end = None
+        self.request_length = request_length
+        self.response_length = 0
+
+    def get_duration(self):
+        """ Returns the time between sending the request and receiving the response. """
+        return None if self.end is None else self.end - self.start
+
+def parse_fields(packet, descriptor, context=None):
+    """
+    Parses the fields of a message by the descriptor. The length of data fields can refer to an
+    earlier field of the message or to a field of the context, i.e. the request of a response. The
+    items of a list field are parsed into a list of dictionaries.
+    """
+    context = context or {}
+    result = {}
+    for key, element in descriptor.items():
+        if element["type"] == Protocol.TYPE_LIST:
+            result[key] = [parse_fields(packet, element["fields"], context)
+                           for _ in range(result[element["count"]])]
+        elif element["type"] == Protocol.TYPE_DATA:
+            length = element["length"]
+            if isinstance(length, str):
+                length = result[length] if length in result else context[length]
+            if len(packet.get_raw_data()) < length:
+                raise TraceException("Truncated field: " + key)
+            result[key] = packet.pop_data(length)
+        else:
+            if len(packet.get_raw_data()) < element["type"]:
+                raise TraceException("Truncated field: " + key)
+            result[key] = int.from_bytes(packet.pop_data(element["type"]), "little")
+    return result
+
+def parse_v1_request(data):
+    """ Parses a v1 request and returns its command and fields. """
+    packet = Packet().push_data(data)
+    if not packet.check_crc():
+        raise TraceException("Invalid CRC in request")
+    packet = Packet().push_data(data[:-1])
+    command = packet.pop_u16()
+    return command, parse_fields(packet, Protocol.DESCRIPTORS[command]["request"])
+
+def parse_v1_response(data, command, request):
+    """ Parses a v1 response and returns the fields, the error message and the length used. """
+    packet = Packet().push_data(data)
+    if len(data) < 2:
+        raise TraceException("Truncated response")
+    response_command = packet.pop_u16()
+
+    if response_command == Protocol.COMMAND_ERROR:
+        fields = parse_fields(packet, {"error_code": {"type": Protocol.TYPE_U16}})
+        return None, "Error code: 0x%04X" % fields["error_code"], 5
+
+    if response_command != command:
+        raise TraceException("Invalid response command: 0x%04X" % response_command)
+    fields = parse_fields(packet, Protocol.DESCRIPTORS[command]["response"], request)
+    length = len(data) - len(packet.get_raw_data()) + 1
+    if not Packet().push_data(data[:length]).check_crc():
+        raise TraceException("Invalid CRC in response")
+    return fields, None, length
+
+def parse_v2_frames(data):
+    """ Finds the valid v2 frames in a byte stream and returns (offset, header, payload) tuples. """
+    frames = []
+    position = 0
+    while position + Protocol.FRAME_HEADER_LENGTH <= len(data):
+        header = Packet().push_data(data[position:position + Protocol.FRAME_HEADER_LENGTH])
+        if header.peek_u16() != Protocol.FRAME_MAGIC or not header.check_crc():
+            position += 1
+            continue
+
+        header.pop_u16() # Magic
+        sequence = header.pop_u16()
+        length = header.pop_u32()
+        end = position + Protocol.FRAME_HEADER_LENGTH + length + 4
+        payload = Packet().push_data(data[position + Protocol.FRAME_HEADER_LENGTH:end])
+        if end > len(data) or not payload.check_crc32():
+            position += 1
+            continue
+
+        frames.append((end, sequence, data[position + Protocol.FRAME_HEADER_LENGTH:end - 4]))
+        position = end
+    return frames
+
+def decode_transactions(events):
+    """
+    Decodes the events of a trace into transactions. Each send event is a request. The response of
+    a v1 request is the data received until the next request, while v2 responses are matched by
+    their sequence numbers.
+    """
+    return TraceDecoder(events).decode()
+
+class TraceDecoder:
+    """ Matches the requests of a trace with the responses in the received byte stream. """
+
+    def __init__(self, events):
+        self.start = events[0].timestamp if events else 0
+        self.requests = []
+        self.rx_stream = bytearray()
+        self.rx_times = []
+
+        for event in events:
+            if event.type == EVENT_SEND:
+                self.requests.append((event, len(self.rx_stream)))
+            elif event.type == EVENT_RECV:
+                self.rx_stream += event.data
+                self.rx_times.append((len(self.rx_stream), event.timestamp))
+
+        self.frames = parse_v2_frames(bytes(self.rx_stream))
+        self.used_frames = set()
+
+    def get_time(self, timestamp):
+        """ Converts a timestamp into seconds from the start of the trace. """
+        return (timestamp - self.start) / 1e9
+
+    def get_rx_time(self, offset):
+        """ Returns the time when the received stream has reached the given offset. """
+        for end, timestamp in self.rx_times:
+            if end >= offset:
+                return self.get_time(timestamp)
+        return None
+
+    def decode(self):
+        """ Decodes all requests of the trace. """
+        transactions = []
+        for index, (event, rx_start) in enumerate(self.requests):
+            if index + 1 < len(self.requests):
+                rx_end = self.requests[index + 1][1]
+            else:
+                rx_end = len(self.rx_stream)
+            transactions.append(self.decode_transaction(event, rx_start, rx_end))
+        return transactions
+
+    def decode_transaction(self, event, rx_start, rx_end):
+        """ Decodes a single request and finds its response. """
+        data = event.data
+        header = Packet().push_data(data[:Protocol.FRAME_HEADER_LENGTH])
+        is_v2 = len(data) >= Protocol.FRAME_HEADER_LENGTH and \
+            header.peek_u16() == Protocol.FRAME_MAGIC and header.check_crc()
+
+        try:
+            if is_v2:
+                request_frames = parse_v2_frames(data)
+                if not request_frames:
+                    raise TraceException("Invalid v2 request")
+                _, sequence, payload = request_frames[0]
+                packet = Packet().push_data(payload)
+                command = packet.pop_u16()
+                request = parse_fields(packet, Protocol.DESCRIPTORS[command]["request"])
+            else:
+                sequence = None
+                command, request = parse_v1_request(data)
+        except (TraceException, KeyError, struct.error) as exception:
+            transaction = Transaction(None, None, None, None, self.get_time(event.timestamp),
+                                      len(data))
+            transaction.error = "Undecodable request: %s" % exception
+            return transaction
+
+        framing = Protocol.FRAMING_V2 if is_v2 else Protocol.FRAMING_V1
+        transaction = Transaction(command, framing, sequence, request,
+                                  self.get_time(event.timestamp), len(data))
+
+        try:
+            if is_v2:
+                self.decode_v2_response(transaction, rx_start)
+            else:
+                if rx_start == rx_end:
+                    raise TraceException("No response")
+                transaction.response, transaction.error, length = \
+                    parse_v1_response(bytes(self.rx_stream[rx_start:rx_end]), command, request)
+                transaction.response_length = length
+                transaction.end = self.get_rx_time(rx_start + length)
+        except (TraceException, KeyError, struct.error) as exception:
+            transaction.error = str(exception)
+
+        return transaction
+
+    def decode_v2_response(self, transaction, rx_start):
+        """ Finds the first unused response frame with the sequence number of the transaction. """
+        for index, (end, sequence, payload) in enumerate(self.frames):
+            if index in self.used_frames or sequence != transaction.sequence or end <= rx_start:
+                continue
+
+            self.used_frames.add(index)
+            transaction.response_length = len(payload) + Protocol.FRAME_HEADER_LENGTH + 4
+            transaction.end = self.get_rx_time(end)
+            packet = Packet().push_data(payload)
+            if packet.pop_u16() == Protocol.COMMAND_ERROR:
+                transaction.error = "Error code: 0x%04X" % packet.pop_u16()
+            else:
+                transaction.response = parse_fields(
+                    packet, Protocol.DESCRIPTORS[transaction.command]["response"],
+                    transaction.request)
+            return
+
+        raise TraceException("No response")
+
+def summarize(transactions):
+    """
+    Calculates per command statistics of the transactions: count, errors, transferred bytes, total
+    time and the effective throughput in bytes per second.
+    """
+    summary = {}
+    for transaction in transactions:
+        entry = summary.setdefault(transaction.name, {"count": 0, "errors": 0, "bytes": 0,
+                                                      "time": 0.0, "throughput": None})
+        entry["count"] += 1
+        if transaction.error:
+            entry["errors"] += 1
+        entry["bytes"] += transaction.request_length + transaction.response_length
+        duration = transaction.get_duration()
+        if duration is not None:
+            entry["time"] += duration
+
+    for entry in summary.values():
+        if entry["time"] > 0:
+            entry["throughput"] = entry["bytes"] / entry["time"]
+
+    return summary
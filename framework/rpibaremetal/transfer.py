@@ -0,0 +1,86 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+"""
+This module contains the progress reporting and cancellation helpers of the bulk memory transfers.
+The transfers are split into chunks, the progress is reported and the cancellation is checked
+between the chunks, so a cancelled transfer never leaves a half sent request on the link.
+"""
+
+import threading
+import time
+
+class CancelledException(Exception):
+    """ Raised by a cancelled transfer. The done attribute is the number of transferred bytes. """
+
+    def __init__(self, done):
+        Exception.__init__(self, "Transfer cancelled after %d bytes" % done)
+        self.done = done
+
+class CancellationToken:
+    """ Thread-safe flag for cancelling transfers from another thread or a signal handler. """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        """ Requests the cancellation of the transfers which use this token. """
+        self.event.set()
+
+    def is_cancelled(self):
+        """ Returns True if the cancellation has been requested. """
+        return self.event.is_set()
+
+class TransferStatus:
+    """
+    State of a transfer passed to the progress callbacks. The rates are in bytes per second, rate
+    is measured on the last chunk and average_rate from the start of the transfer.
+    """
+
+    def __init__(self, done, total, rate, average_rate, elapsed):
+        self.done = done
+        self.total = total
+        self.rate = rate
+        self.average_rate = average_rate
+        self.elapsed = elapsed
+
+class Transfer:
+    """ Splits a transfer into chunks, reports its progress and checks the cancellation token. """
+
+    def __init__(self, total, chunk_size, progress=None, cancel=None):
+        if chunk_size <= 0:
+            raise ValueError("Invalid chunk size: %d" % chunk_size)
+        self.total = total
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.cancel = cancel
+        self.done = 0
+        self.start = time.monotonic()
+        self.last_update = self.start
+
+    def chunks(self):
+        """
+        Yields the (offset, length) tuples of the chunks. An empty transfer has a single empty
+        chunk. Raises CancelledException before the next chunk if the token is cancelled.
+        """
+        offset = 0
+        while True:
+            if self.cancel is not None and self.cancel.is_cancelled():
+                raise CancelledException(self.done)
+            length = min(self.chunk_size, self.total - offset)
+            yield offset, length
+            offset += length
+            if offset >= self.total:
+                break
+
+    def update(self, length):
+        """ Records a completed chunk and calls the progress callback. """
+        now = time.monotonic()
+        self.done += length
+        if self.progress is not None:
+            elapsed = now - self.start
+            chunk_time = now - self.last_update
+            self.progress(TransferStatus(self.done, self.total,
+                                         length / chunk_time if chunk_time > 0 else 0.0,
+                                         self.done / elapsed if elapsed > 0 else 0.0, elapsed))
+        self.last_update = now
@@ -0,0 +1,16 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+from setuptools import setup, find_packages
+
+setup(
+    name="rpibaremetal",
+    version="0.2.0",
+    description="Host side framework for Raspberry Pi bare metal prototyping through UART",
+    license="MIT",
+    packages=find_packages(exclude=["tests"]),
+    python_requires=">=3.6",
+    install_requires=["pyserial"],
+    extras_require={"lz4": ["lz4"], "numpy": ["numpy"], "yaml": ["PyYAML"]},
+    entry_points={"console_scripts": ["rpibm = rpibaremetal.cli:main"]},
+)
@@ -0,0 +1,83 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import struct
+import unittest
+from rpibaremetal import arrays
+from rpibaremetal.arrays import ArrayException, read_array, write_array
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+numpy = arrays.numpy
+
+@unittest.skipUnless(numpy, "numpy package is not installed")
+class TestArrays(unittest.TestCase):
+    """ This class is responsible for testing the NumPy array access on the simulator. """
+    ADDR = SimulatedTarget.BASE_ADDRESS
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.connection = SerialConnection(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=1)
+        self.protocol = Protocol(self.connection)
+        self.protocol.chunk_size = 0x100
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def test_read(self):
+        values = list(range(0, 0x30000, 0x100))
+        self.target.memory[self.ADDR:self.ADDR + 4 * len(values)] = \
+            struct.pack("<%dI" % len(values), *values)
+        for dtype in ["<u4", ">u4"]:
+            array = read_array(self.protocol, self.ADDR, dtype, len(values))
+            self.assertEqual(array.dtype, numpy.dtype(dtype))
+            self.assertEqual(array.tolist(), values)
+
+        matrix = read_array(self.protocol, self.ADDR, numpy.uint32, (3, 0x100))
+        self.assertEqual(matrix.shape, (3, 0x100))
+        self.assertEqual(matrix[2, 0], values[0x200])
+
+    def test_read_in_place(self):
+        self.target.memory[self.ADDR:self.ADDR + 0x40] = struct.pack("<16f", *range(16))
+        out = numpy.zeros(16, numpy.float32)
+        self.assertIs(read_array(self.protocol, self.ADDR, out=out), out)
+        self.assertEqual(out.tolist(), list(range(16)))
+        for count in [numpy.int64(16), out.size, (numpy.uint8(16),)]:
+            self.assertIs(read_array(self.protocol, self.ADDR, count=count, out=out), out)
+
+        # Strided and big endian views are filled through a temporary buffer
+        matrix = numpy.zeros((4, 8), ">f4")
+        read_array(self.protocol, self.ADDR, out=matrix[:, ::2])
+        self.assertEqual(matrix[1].tolist(), [4, 0, 5, 0, 6, 0, 7, 0])
+
+    def test_write(self):
+        array = numpy.arange(0x400, dtype=">i2")
+        write_array(self.protocol, self.ADDR, array[::2])
+        self.assertEqual(self.target.memory[self.ADDR:self.ADDR + 0x400],
+                         struct.pack("<512h", *range(0, 0x400, 2)))
+
+        record = numpy.zeros(2, [("id", "<u2"), ("value", ">f8")])
+        record["id"] = [1, 2]
+        record["value"] = [0.5, 1.5]
+        write_array(self.protocol, self.ADDR, record)
+        self.assertEqual(self.target.memory[self.ADDR:self.ADDR + 20],
+                         struct.pack("<HdHd", 1, 0.5, 2, 1.5))
+        self.assertEqual(read_array(self.protocol, self.ADDR, record.dtype, 2).tolist(),
+                         record.tolist())
+
+    def test_invalid(self):
+        with self.assertRaises(ArrayException):
+            read_array(self.protocol, self.ADDR, numpy.uint8)
+        out = numpy.zeros(4, numpy.uint8)
+        with self.assertRaises(ArrayException):
+            read_array(self.protocol, self.ADDR, numpy.uint16, out=out)
+        out.flags.writeable = False
+        with self.assertRaises(ArrayException):
+            read_array(self.protocol, self.ADDR, out=out)
+
+if __name__ == "__main__":
+    unittest.main()
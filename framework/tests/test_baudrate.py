@@ -0,0 +1,78 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import unittest
+from rpibaremetal.baudrate import probe_baud_rate
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+class FixedBaudRateConnection(SerialConnection):
+    """ Serial connection of an adapter which silently ignores the baud rate changes. """
+
+    def set_baudrate(self, baudrate):
+        pass
+
+class TestBaudRate(unittest.TestCase):
+    """ This class is responsible for testing the baud rate handshake and probing. """
+    TIMEOUT = 0.2
+
+    def start(self, connection_class=SerialConnection, **kwargs):
+        self.target = SimulatedTarget(**kwargs)
+        self.target.start()
+        self.connection = connection_class(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=self.TIMEOUT)
+        self.protocol = Protocol(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def assert_baud_rate(self, baud_rate):
+        self.assertEqual(self.target.baud_rate, baud_rate, "Invalid target baud rate")
+        self.assertEqual(self.connection.get_baudrate(), baud_rate, "Invalid host baud rate")
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION, "Invalid version")
+
+    def test_set_baud_rate(self):
+        self.start()
+        self.assertTrue(self.protocol.set_baud_rate(921600))
+        self.assert_baud_rate(921600)
+
+    def test_set_baud_rate_invalid(self):
+        self.start()
+        with self.assertRaisesRegex(Protocol.ProtocolException, "Invalid.*argument"):
+            self.protocol.set_baud_rate(SimulatedTarget.MAX_BAUD_RATE + 1)
+        self.assert_baud_rate(SimulatedTarget.DEFAULT_BAUD_RATE)
+
+    def test_set_baud_rate_fallback_unconfirmed(self):
+        self.start(FixedBaudRateConnection)
+        self.assertFalse(self.protocol.set_baud_rate(921600))
+        self.assertEqual(self.target.baud_rate, SimulatedTarget.DEFAULT_BAUD_RATE)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_set_baud_rate_fallback_unconfirmed_v2(self):
+        self.start(FixedBaudRateConnection)
+        self.protocol.negotiate_framing()
+        self.assertFalse(self.protocol.set_baud_rate(921600))
+        self.assertEqual(self.target.baud_rate, SimulatedTarget.DEFAULT_BAUD_RATE)
+        self.assertEqual(self.protocol.framing, Protocol.FRAMING_V2)
+        self.assertEqual(self.target.framing, Protocol.FRAMING_V2)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_set_baud_rate_fallback_lost_responses(self):
+        self.start(max_baud_rate=115200, error_rate=1.0)
+        self.assertFalse(self.protocol.set_baud_rate(921600))
+        self.assert_baud_rate(SimulatedTarget.DEFAULT_BAUD_RATE)
+
+    def test_probe_baud_rate(self):
+        self.start(max_baud_rate=921600, error_rate=0.05)
+        self.assertEqual(probe_baud_rate(self.protocol), 921600)
+        self.assert_baud_rate(921600)
+
+    def test_probe_baud_rate_unlimited(self):
+        self.start()
+        self.assertEqual(probe_baud_rate(self.protocol, [230400, 2000000]), 2000000)
+        self.assert_baud_rate(2000000)
+
+if __name__ == "__main__":
+    unittest.main()
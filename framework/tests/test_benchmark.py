@@ -0,0 +1,101 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import os
+import random
+import tempfile
+import unittest
+from rpibaremetal.benchmark import BenchmarkException, ResultStore, collect_metadata, compare, \
+    create_metric, create_record, mann_whitney_u, run_benchmarks, run_startup_benchmarks
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+def create_samples(median, count=10, seed=0):
+    generator = random.Random(seed)
+    return [median * generator.uniform(0.97, 1.03) for _ in range(count)]
+
+class TestBenchmark(unittest.TestCase):
+    """ This class is responsible for testing the benchmark runs, store and comparison. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.directory.name, "results.jsonl"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_run(self, label, read_time, write_time, seed):
+        metrics = [create_metric("memory_read", 4096, create_samples(read_time, seed=seed)),
+                   create_metric("memory_write", 4096, create_samples(write_time, seed=seed + 1))]
+        metadata = {"version": 0x0200, "host": {}, "adaptor": {}, "link": {}}
+        record = create_record(metadata, metrics, label)
+        self.store.append(record)
+        return record
+
+    def test_run_benchmarks(self):
+        with SimulatedTarget() as target:
+            connection = SerialConnection(target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                          timeout=1)
+            protocol = Protocol(connection)
+            protocol.negotiate_framing()
+            metrics = run_benchmarks(protocol, [0x100], repeats=3)
+            metadata = collect_metadata(protocol, target.port)
+            connection.close()
+
+        self.assertEqual([(metric["name"], metric["size"]) for metric in metrics],
+                         [("get_version", 0), ("register_read", 4), ("memory_write", 0x100),
+                          ("memory_read", 0x100)])
+        self.assertTrue(all(len(metric["samples"]) == 3 for metric in metrics))
+        self.assertEqual(metadata["version"], SimulatedTarget.VERSION)
+        self.assertEqual(metadata["link"]["baud_rate"], SimulatedTarget.DEFAULT_BAUD_RATE)
+        self.assertEqual(metadata["link"]["framing"], Protocol.FRAMING_V2)
+
+    def test_startup_benchmarks(self):
+        metrics = run_startup_benchmarks(["rpibaremetal.connection.factory"], repeats=2)
+        self.assertEqual([metric["name"] for metric in metrics],
+                         ["python_startup", "import factory"])
+        self.assertTrue(all(len(metric["samples"]) == 2 and min(metric["samples"]) > 0
+                            for metric in metrics))
+
+    def test_store(self):
+        self.assertEqual(self.store.read(), [])
+        first = self.create_run("nightly", 0.010, 0.020, 0)
+        second = self.create_run("nightly", 0.010, 0.020, 2)
+        third = self.create_run("manual", 0.010, 0.020, 4)
+
+        self.assertEqual(self.store.read(), [first, second, third])
+        self.assertEqual(self.store.select("nightly"), [first, second])
+        self.assertEqual(self.store.select(third["run_id"]), [third])
+        self.assertEqual(self.store.select("latest"), [third])
+        self.assertEqual(self.store.select("previous"), [second])
+
+    def test_store_invalid(self):
+        with open(self.store.path, "w") as store_file:
+            store_file.write("{\n")
+        with self.assertRaises(BenchmarkException):
+            self.store.read()
+
+    def test_mann_whitney_u(self):
+        self.assertLess(mann_whitney_u(create_samples(1.0), create_samples(1.2, seed=1)), 0.01)
+        self.assertGreater(mann_whitney_u(create_samples(1.0), create_samples(1.0, seed=1)), 0.05)
+        self.assertEqual(mann_whitney_u([1.0, 1.0], [1.0, 1.0]), 1.0)
+
+    def test_compare(self):
+        baseline = self.create_run("baseline", 0.010, 0.020, 0)
+        candidate = self.create_run("candidate", 0.013, 0.017, 2)
+        comparisons = {comparison.name: comparison for comparison in
+                       compare([baseline], [candidate])}
+
+        self.assertEqual(comparisons["memory_read"].status, "regression")
+        self.assertAlmostEqual(comparisons["memory_read"].change, 0.3, delta=0.05)
+        self.assertEqual(comparisons["memory_write"].status, "improvement")
+
+    def test_compare_unchanged(self):
+        baseline = self.create_run("baseline", 0.010, 0.020, 0)
+        candidate = self.create_run("candidate", 0.0101, 0.020, 2)
+        self.assertTrue(all(comparison.status == "unchanged"
+                            for comparison in compare([baseline], [candidate])))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import tempfile
+import unittest
+from rpibaremetal.calibration import LinkProfile, calibrate, get_chunk_sizes, \
+    get_default_profile, get_profile_path, get_test_length, load_profile, save_profile
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+class CorruptingProtocol(Protocol):
+    """ Protocol of a link which corrupts the read data. """
+
+    def memory_read(self, address, length, progress=None, cancel=None, chunk_size=None):
+        data = Protocol.memory_read(self, address, length, progress, cancel, chunk_size)
+        return bytes(byte ^ 0x01 for byte in data)
+
+class TestCalibration(unittest.TestCase):
+    """ This class is responsible for testing the link calibration and the profile files. """
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.connection = SerialConnection(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=0.5)
+        self.protocol = Protocol(self.connection)
+        self.protocol.negotiate_framing()
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def test_pipelined_transfer(self):
+        self.protocol.pipeline_depth = 4
+        data = bytes(i * 31 & 0xff for i in range(0x2345))
+        self.protocol.memory_write(SimulatedTarget.BASE_ADDRESS, data, chunk_size=0x100)
+        self.assertEqual(self.protocol.memory_read(SimulatedTarget.BASE_ADDRESS, len(data),
+                                                   chunk_size=0x100), data)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+        self.assertEqual(self.target.rx_overruns, 0)
+
+    def test_pipelined_transfer_old_kernel(self):
+        # Kernel which reports the version before the RX ring and drops the streamed requests
+        self.target.rx_buffer_size = SimulatedTarget.RX_FIFO_SIZE
+        self.protocol.version = Protocol.VERSION_FRAMING_V2
+        self.protocol.pipeline_depth = 4
+        data = self.protocol.memory_read(SimulatedTarget.BASE_ADDRESS, 0x1000, chunk_size=0x100)
+        self.assertEqual(len(data), 0x1000)
+        self.assertEqual(self.target.rx_overruns, 0)
+
+        profile = calibrate(self.protocol, [0x100], [1, 4], test_length=0x400, rounds=1)
+        self.assertEqual(profile.pipeline_depth, 1)
+
+    def test_calibrate(self):
+        profile = calibrate(self.protocol, [0x100, 0x1000], [1, 4], test_length=0x2000, rounds=1)
+        self.assertIn(profile.chunk_size, [0x100, 0x1000])
+        self.assertIn(profile.pipeline_depth, [1, 4])
+        self.assertEqual(profile.error_rate, 0.0)
+        self.assertGreater(profile.goodput, 0)
+        self.assertEqual(profile.baud_rate, SimulatedTarget.DEFAULT_BAUD_RATE)
+        self.assertEqual(self.protocol.chunk_size, profile.chunk_size)
+        self.assertEqual(self.protocol.pipeline_depth, profile.pipeline_depth)
+
+    def test_calibrate_default_length(self):
+        profile = calibrate(self.protocol, rounds=1, timeout=0.5)
+        self.assertIn(profile.chunk_size, [0x400, 0x1000])
+
+    def test_calibrate_v1(self):
+        self.protocol.reset()
+        profile = calibrate(self.protocol, [0x1000], [1, 4], test_length=0x1000, rounds=1)
+        self.assertEqual(profile.pipeline_depth, 1)
+
+    def test_calibrate_unreliable(self):
+        protocol = CorruptingProtocol(self.connection)
+        protocol.negotiate_framing()
+        with self.assertRaisesRegex(Protocol.ProtocolException, "No reliable"):
+            calibrate(protocol, [0x100], [1, 2], test_length=0x100, rounds=1)
+        self.assertEqual(protocol.chunk_size, Protocol.TRANSFER_CHUNK_SIZE)
+        self.assertEqual(protocol.pipeline_depth, 1)
+
+class TestProfile(unittest.TestCase):
+    """ This class is responsible for testing the profile files. """
+
+    def test_chunk_sizes(self):
+        # 0x4000 bytes take 1.42 s at 115200 baud
+        self.assertEqual(get_chunk_sizes(115200, 2.0), [0x400, 0x1000, 0x4000])
+        self.assertEqual(get_chunk_sizes(115200, 0.01), [0x400])
+        self.assertEqual(get_chunk_sizes(None, 2.0), [0x400, 0x1000, 0x4000, 0x10000])
+        self.assertEqual(get_chunk_sizes(3000000, None, [0x800, 0x100]), [0x100, 0x800])
+        self.assertEqual(get_default_profile(115200, 2.0).chunk_size, 0x4000)
+        self.assertEqual(get_default_profile(115200, 2.0).pipeline_depth, 1)
+
+    def test_test_length(self):
+        self.assertEqual(get_test_length(115200), 5760)
+        self.assertEqual(get_test_length(3000000), 0x10000)
+        self.assertEqual(get_test_length(None), 0x10000)
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(load_profile("/dev/ttyUSB0", 115200, directory))
+            save_profile("/dev/ttyUSB0", LinkProfile(115200, 0x1000, 2, 10000.0), directory)
+            save_profile("/dev/ttyUSB0", LinkProfile(921600, 0x4000, 4, 80000.0), directory)
+            self.assertTrue(get_profile_path("/dev/ttyUSB0", directory).endswith(
+                "dev_ttyUSB0.json"))
+
+            profile = load_profile("/dev/ttyUSB0", 115200, directory)
+            self.assertEqual((profile.chunk_size, profile.pipeline_depth), (0x1000, 2))
+            profile = load_profile("/dev/ttyUSB0", 921600, directory)
+            self.assertEqual((profile.chunk_size, profile.pipeline_depth), (0x4000, 4))
+            self.assertIsNone(load_profile("/dev/ttyUSB1", 115200, directory))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import contextlib
+import io
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+from rpibaremetal.calibration import load_profile
+from rpibaremetal.cli import Progress, main
+from rpibaremetal.connection.connection import Connection
+from rpibaremetal.connection.factory import BACKENDS, register_backend
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+class NoBaudRateConnection(SerialConnection):
+    """ Serial connection which behaves like a transport without baud rate, e.g. TCP. """
+
+    def get_baudrate(self):
+        return Connection.get_baudrate(self)
+
+class TestCli(unittest.TestCase):
+    """ This class is responsible for testing the rpibm command line tool. """
+    ADDR = SimulatedTarget.BASE_ADDRESS
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.target.stop()
+        self.directory.cleanup()
+
+    def run_cli(self, *args):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = main(["--port", self.target.port, "--timeout", "0.5"] + list(args))
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def get_path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_info(self):
+        status, output, _ = self.run_cli("info")
+        self.assertEqual(status, 0)
+        self.assertIn("Version:      0x0201", output)
+        self.assertIn("Framing:      v2", output)
+        self.assertIn("Base address: 0x%016X" % self.ADDR, output)
+
+    def test_connection_url(self):
+        status, output, _ = self.run_cli("--port", "sim://", "--no-profile", "info")
+        self.assertEqual(status, 0)
+        self.assertIn("Framing:      v2", output)
+        # The default chunk of 0x1000 bytes takes 0.36 s at 115200 baud, within the 0.5 s timeout
+        self.assertIn("Chunk size:   %d" % 0x1000, output)
+
+        status, _, error = self.run_cli("--port", "unknown://", "info")
+        self.assertEqual(status, 1)
+        self.assertIn("Unknown connection scheme", error)
+
+    def test_no_baud_rate(self):
+        register_backend("nobaud", lambda location, _options, baud, timeout:
+                         NoBaudRateConnection(location, baud, timeout))
+        try:
+            status, output, _ = self.run_cli("--port", "nobaud://" + self.target.port,
+                                             "--profile-dir", self.directory.name, "info")
+            self.assertEqual(status, 0)
+            self.assertIn("@ %d baud" % SimulatedTarget.DEFAULT_BAUD_RATE, output)
+
+            status, output, _ = self.run_cli("--port", "nobaud://" + self.target.port,
+                                             "--profile-dir", self.directory.name, "calibrate",
+                                             "--rounds", "1")
+            self.assertEqual(status, 0)
+            self.assertIn("Saved to", output)
+        finally:
+            del BACKENDS["nobaud"]
+
+    def test_load_dump(self):
+        data = bytes(i * 7 & 0xff for i in range(10000))
+        with open(self.get_path("image.bin"), "wb") as image:
+            image.write(data)
+
+        status, output, progress = self.run_cli("load", "--chunk-size", "0x1000",
+                                                self.get_path("image.bin"))
+        self.assertEqual(status, 0)
+        self.assertIn("Loaded 10000 bytes", output)
+        self.assertIn("100%", progress)
+        self.assertEqual(self.target.memory[self.ADDR:self.ADDR + len(data)], data)
+
+        status, _, _ = self.run_cli("dump", "0x%x" % self.ADDR, str(len(data)),
+                                    self.get_path("dump.bin"))
+        self.assertEqual(status, 0)
+        with open(self.get_path("dump.bin"), "rb") as dump:
+            self.assertEqual(dump.read(), data)
+
+    def test_load_compressed(self):
+        data = bytes(100) + b"pattern" * 1000
+        with open(self.get_path("image.bin"), "wb") as image:
+            image.write(data)
+
+        status, _, _ = self.run_cli("load", "-z", self.get_path("image.bin"), "0x8000")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.target.memory[0x8000:0x8000 + len(data)], data)
+
+    def test_peek_poke(self):
+        self.assertEqual(self.run_cli("poke", "0x%x" % self.ADDR, "0x12345678")[0], 0)
+        status, output, _ = self.run_cli("peek", "0x%x" % self.ADDR)
+        self.assertEqual(status, 0)
+        self.assertEqual(output, "0x12345678\n")
+
+        status, output, _ = self.run_cli("peek", "0x%x" % self.ADDR, "4")
+        self.assertEqual(status, 0)
+        self.assertIn("78 56 34 12", output)
+
+    def test_exec(self):
+        self.target.functions[0x1000] = lambda *args: args[0] + 1
+        self.target.memory[self.ADDR:self.ADDR + 16] = struct.pack("<QQ", 0x1000, 41)
+        status, output, _ = self.run_cli("exec", "0x%x" % self.ADDR)
+        self.assertEqual(status, 0)
+        self.assertEqual(int(output, 16), 42)
+
+    def test_reset(self):
+        self.assertEqual(self.run_cli("reset")[0], 0)
+        self.assertEqual(self.target.framing, Protocol.FRAMING_V1)
+
+    def test_calibrate(self):
+        status, output, _ = self.run_cli("--profile-dir", self.directory.name, "calibrate",
+                                         "--length", "0x1000", "--rounds", "1")
+        self.assertEqual(status, 0)
+        self.assertIn("Saved to", output)
+
+        status, output, _ = self.run_cli("--profile-dir", self.directory.name, "info")
+        self.assertEqual(status, 0)
+        profile = load_profile(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                               self.directory.name)
+        self.assertIn("Chunk size:   %d" % profile.chunk_size, output)
+        self.assertIn("Pipeline:     %d" % profile.pipeline_depth, output)
+
+    def test_bench_compare(self):
+        store = self.get_path("results.jsonl")
+        for label in ["baseline", "candidate"]:
+            status, output, _ = self.run_cli("bench", "--store", store, "--label", label,
+                                             "--size", "256", "--repeats", "3")
+            self.assertEqual(status, 0)
+            self.assertIn("memory_read", output)
+            self.assertIn("import cli", output)
+
+        status, output, _ = self.run_cli("compare", "--store", store, "--alpha", "0",
+                                         "baseline", "candidate")
+        self.assertEqual(status, 0)
+        self.assertIn("0 regressions", output)
+
+        status, _, error = self.run_cli("compare", "--store", store, "unknown")
+        self.assertEqual(status, 1)
+        self.assertIn("No runs found for unknown", error)
+
+    def test_error(self):
+        status, _, error = self.run_cli("peek", "0x%x" % len(self.target.memory))
+        self.assertEqual(status, 1)
+        self.assertIn("rpibm: error:", error)
+
+    def test_progress(self):
+        stream = io.StringIO()
+        progress = Progress(4096, stream)
+        progress.update(1024)
+        progress.finish()
+        self.assertEqual(stream.getvalue().count("\n"), 1)
+        self.assertIn("1.0 KiB / 4.0 KiB  25%", stream.getvalue())
+        self.assertIn("ETA", stream.getvalue())
+
+class TestCliStartup(unittest.TestCase):
+    """ This class is responsible for testing that the tool does not load the backends early. """
+
+    def run_python(self, code):
+        return subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.PIPE,
+                              universal_newlines=True,
+                              cwd=os.path.dirname(os.path.dirname(__file__))).stdout
+
+    def test_lazy_imports(self):
+        code = "import sys; import rpibaremetal.cli, rpibaremetal.protocol; " \
+            "print('serial' in sys.modules, 'rpibaremetal.compression' in sys.modules)"
+        self.assertEqual(self.run_python(code).strip(), "False False")
+
+    def test_lazy_imports_info(self):
+        code = "import sys; from rpibaremetal.cli import main; " \
+            "main(['--port', 'sim://', '--no-profile', 'info']); " \
+            "print('rpibaremetal.benchmark' in sys.modules, 'statistics' in sys.modules)"
+        self.assertEqual(self.run_python(code).splitlines()[-1], "False False")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import random
+import unittest
+from rpibaremetal import compression
+from rpibaremetal.compression import CompressionException, decompress, lz4_compress
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+class TestCompression(unittest.TestCase):
+    """ This class is responsible for testing the LZ4 block codec. """
+    RANDOM = bytes(random.Random(0).getrandbits(8) for _ in range(5000))
+    TEXT = b"The quick brown fox jumps over the lazy dog. " * 100
+    ZEROS = bytes(70000)
+    SAMPLES = [b"", b"a", b"abcdefghijklm", RANDOM, TEXT, ZEROS, TEXT + RANDOM + ZEROS]
+
+    def test_round_trip(self):
+        for sample in self.SAMPLES:
+            self.assertEqual(decompress(lz4_compress(sample), len(sample)), sample)
+
+    def test_compression_ratio(self):
+        self.assertLess(len(lz4_compress(self.ZEROS)), len(self.ZEROS) // 100)
+        self.assertLess(len(lz4_compress(self.TEXT)), len(self.TEXT) // 10)
+
+    @unittest.skipUnless(compression.lz4_block, "lz4 package is not installed")
+    def test_lz4_package_compatibility(self):
+        for sample in self.SAMPLES:
+            compressed = lz4_compress(sample)
+            self.assertEqual(compression.lz4_block.decompress(compressed, len(sample)), sample)
+            self.assertEqual(decompress(compression.compress(sample), len(sample)), sample)
+
+    def test_decompress_invalid_offset(self):
+        with self.assertRaisesRegex(CompressionException, "offset"):
+            decompress(bytes([0x10, 0x61, 0x02, 0x00]), 5)
+
+    def test_decompress_truncated(self):
+        with self.assertRaisesRegex(CompressionException, "Truncated"):
+            decompress(bytes([0x50, 0x61]), 5)
+
+    def test_decompress_invalid_length(self):
+        with self.assertRaisesRegex(CompressionException, "length"):
+            decompress(lz4_compress(self.TEXT), len(self.TEXT) - 1)
+
+class TestCompressedWrite(unittest.TestCase):
+    """ This class is responsible for testing compressed memory writes on a simulated target. """
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.connection = SerialConnection(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=1)
+        self.protocol = Protocol(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def test_memory_write_compressed(self):
+        data = TestCompression.TEXT + TestCompression.RANDOM + TestCompression.ZEROS
+        data = data[:3 * 0x1000]
+        address = SimulatedTarget.BASE_ADDRESS + 3
+        self.protocol.memory_write_compressed(address, data, chunk_size=0x1000)
+        self.assertEqual(self.protocol.memory_read(address, len(data)), data)
+
+    def test_memory_write_lz4_invalid(self):
+        with self.assertRaisesRegex(Protocol.ProtocolException, "Invalid.*argument"):
+            self.protocol.memory_write_lz4(SimulatedTarget.BASE_ADDRESS, 5,
+                                           bytes([0x10, 0x61, 0x02, 0x00]))
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+if __name__ == "__main__":
+    unittest.main()
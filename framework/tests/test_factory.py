@@ -0,0 +1,111 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from rpibaremetal.connection.connection import Connection
+from rpibaremetal.connection.factory import connect, register_backend, BACKENDS
+from rpibaremetal.connection.recordingconnection import RecordingConnection
+from rpibaremetal.packet import Packet
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+from rpibaremetal.trace import TraceWriter
+
+class TestFactory(unittest.TestCase):
+    """ This class is responsible for testing the connection URL factory. """
+
+    def test_serial(self):
+        with SimulatedTarget() as target:
+            for url in [target.port, "serial://%s?baud=115200&timeout=0.5" % target.port]:
+                connection = connect(url, timeout=0.5)
+                self.assertEqual(connection.get_baudrate(), SimulatedTarget.DEFAULT_BAUD_RATE)
+                self.assertEqual(Protocol(connection).get_version(), SimulatedTarget.VERSION)
+                connection.close()
+
+            connection = connect("serial://" + target.port, baud=9600)
+            self.assertEqual(connection.get_baudrate(), 9600)
+            connection.close()
+
+    def test_simulator(self):
+        connection = connect("sim://?memory_size=0x10000&seed=1", timeout=0.5)
+        self.assertEqual(len(connection.target.memory), 0x10000)
+        self.assertEqual(Protocol(connection).negotiate_framing(), SimulatedTarget.VERSION)
+        connection.close()
+        self.assertFalse(connection.target.thread.is_alive())
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session trace")
+            connection = RecordingConnection(connect("sim://", timeout=0.5), path)
+            Protocol(connection).get_version()
+            connection.close()
+
+            connection = connect("replay://" + path.replace(" ", "%20"))
+            self.assertEqual(Protocol(connection).get_version(), SimulatedTarget.VERSION)
+            connection.close()
+
+            with open(path, "wb"):
+                pass # An empty file is not a valid trace
+            for url in ["replay://" + os.path.join(directory, "missing"), "replay://" + path]:
+                with self.assertRaises(Connection.ConnectionException, msg=url):
+                    connect(url)
+
+    def test_tcp(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+
+        def serve():
+            client, _ = server.accept()
+            with client:
+                request = client.recv(3)
+                if request == Packet().push_u16(Protocol.COMMAND_GET_VERSION).add_crc(). \
+                        get_raw_data():
+                    client.sendall(Packet().push_u16(Protocol.COMMAND_GET_VERSION).
+                                   push_u16(SimulatedTarget.VERSION).add_crc().get_raw_data())
+                client.recv(1)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        connection = connect("tcp://127.0.0.1:%d?timeout=1" % server.getsockname()[1])
+        protocol = Protocol(connection)
+        self.assertEqual(protocol.get_version(), SimulatedTarget.VERSION)
+        with self.assertRaisesRegex(Protocol.ProtocolException, "Timeout"):
+            Protocol(connection).recv_response(Protocol.COMMAND_GET_VERSION, {})
+        connection.close()
+        thread.join()
+        server.close()
+
+    def test_invalid(self):
+        for url in ["unknown://x", "sim://?timeout=x", "sim://?colour=red", "sim://?a",
+                    "tcp://localhost", "tcp://:80", "replay://trace?realtime=maybe", "serial://"]:
+            with self.assertRaises(Connection.ConnectionException, msg=url):
+                connect(url)
+
+    def test_register_backend(self):
+        calls = []
+        register_backend("test", lambda *args: calls.append(args))
+        try:
+            connect("test://location?name=value", timeout=2)
+        finally:
+            del BACKENDS["test"]
+        self.assertEqual(calls, [("location", {"name": "value"}, 115200, 2)])
+
+    def test_lazy_imports(self):
+        code = "import sys; from rpibaremetal.connection.factory import connect; " \
+            "connect('replay://%s'); print('serial' in sys.modules, 'urllib.parse' in sys.modules)"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "empty.trace")
+            TraceWriter(path).close()
+            output = subprocess.run([sys.executable, "-c", code % path], check=True,
+                                    stdout=subprocess.PIPE, universal_newlines=True,
+                                    cwd=os.path.dirname(os.path.dirname(__file__))).stdout
+        self.assertEqual(output.strip(), "False False")
+
+if __name__ == "__main__":
+    unittest.main()
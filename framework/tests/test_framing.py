@@ -0,0 +1,106 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import unittest
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.packet import Packet
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+class TestFraming(unittest.TestCase):
+    """ This class is responsible for testing the v2 framing on a simulated target. """
+    DATA = bytes(range(256)) * 64
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.connection = SerialConnection(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=0.5)
+        self.protocol = Protocol(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def test_negotiate(self):
+        self.assertEqual(self.protocol.negotiate_framing(), SimulatedTarget.VERSION)
+        self.assertEqual(self.protocol.framing, Protocol.FRAMING_V2)
+        self.assertEqual(self.protocol.get_base_address(), SimulatedTarget.BASE_ADDRESS)
+        self.assertEqual(self.target.framing, Protocol.FRAMING_V2)
+
+    def test_negotiate_target_in_v2(self):
+        self.protocol.negotiate_framing()
+        self.assertEqual(Protocol(self.connection).negotiate_framing(), SimulatedTarget.VERSION)
+
+    def test_large_frame(self):
+        self.protocol.negotiate_framing()
+        self.protocol.memory_write(SimulatedTarget.BASE_ADDRESS, self.DATA)
+        self.assertEqual(self.protocol.memory_read(SimulatedTarget.BASE_ADDRESS, len(self.DATA)),
+                         self.DATA)
+
+    def test_resynchronisation(self):
+        self.protocol.negotiate_framing()
+        self.connection.send(bytes([0xa5, 0x5a, 0x01, 0x02, 0x03]))
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_truncated_request(self):
+        self.protocol.negotiate_framing()
+        self.connection.send(Protocol.create_frame(0x1234, bytes(1)).get_raw_data())
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_stale_response(self):
+        self.protocol.negotiate_framing()
+        self.protocol.send_request(Protocol.COMMAND_GET_BASE_ADDRESS, {})
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def stream_read_requests(self, count, length):
+        """ Sends memory read requests in a single write and returns their sequence numbers. """
+        sequences = []
+        requests = bytearray()
+        for _ in range(count):
+            sequences.append(self.protocol.sequence)
+            payload = Packet().push_u16(Protocol.COMMAND_MEMORY_READ). \
+                push_u64(SimulatedTarget.BASE_ADDRESS).push_u32(length).get_raw_data()
+            requests += Protocol.create_frame(self.protocol.sequence, payload).get_raw_data()
+            self.protocol.sequence += 1
+        self.connection.send(bytes(requests))
+        return sequences
+
+    def recv_read_response(self, sequence, length):
+        _, _, response, check = self.protocol.create_memory_read(SimulatedTarget.BASE_ADDRESS,
+                                                                 length)
+        packet = self.protocol.recv_response(Protocol.COMMAND_MEMORY_READ, response, sequence)
+        return check(self.protocol.process_response(response, packet))
+
+    def test_streamed_requests(self):
+        self.protocol.negotiate_framing()
+        self.target.memory[SimulatedTarget.BASE_ADDRESS:SimulatedTarget.BASE_ADDRESS + 0x400] = \
+            self.DATA[:0x400]
+        for sequence in self.stream_read_requests(4, 0x400):
+            self.assertEqual(self.recv_read_response(sequence, 0x400), self.DATA[:0x400])
+        self.assertEqual(self.target.rx_overruns, 0)
+
+    def test_streamed_requests_overrun(self):
+        # Kernel which does not drain the RX FIFO while it is transmitting
+        self.target.rx_buffer_size = SimulatedTarget.RX_FIFO_SIZE
+        self.protocol.negotiate_framing()
+        sequences = self.stream_read_requests(4, 0x400)
+        self.recv_read_response(sequences[0], 0x400)
+        with self.assertRaises(Protocol.ProtocolException):
+            self.recv_read_response(sequences[1], 0x400)
+        self.assertGreater(self.target.rx_overruns, 0)
+
+    def test_reset(self):
+        self.protocol.negotiate_framing()
+        self.protocol.reset()
+        self.assertEqual(self.protocol.framing, Protocol.FRAMING_V1)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_set_baud_rate(self):
+        self.protocol.negotiate_framing()
+        self.assertTrue(self.protocol.set_baud_rate(921600))
+        self.assertEqual(self.protocol.framing, Protocol.FRAMING_V2)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+if __name__ == "__main__":
+    unittest.main()
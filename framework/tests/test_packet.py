@@ -13,6 +13,7 @@ class TestPacket(unittest.TestCase): #pylint: disable=too-many-public-methods
     DATA = [0x12, 0x34, 0x56, 0x78, 0x90]
     CRC = 0xad
     EMPTY_CRC = 0x00
+    CRC32_DATA = [0xb1, 0x6e, 0x93, 0xdc]
 
     U8_DATA = [0x12]
     U16_DATA = [0x34, 0x12]
@@ -122,5 +123,23 @@ class TestPacket(unittest.TestCase): #pylint: disable=too-many-public-methods
         # No add_crc here
         self.assertEqual(self.packet.check_crc(), False, "Invalid check_crc result")
 
+    def test_add_crc32(self):
+        self.packet.push_data(bytes(self.DATA))
+        self.assertEqual(self.packet, self.packet.add_crc32())
+        self.assert_packet_data(self.DATA + self.CRC32_DATA)
+
+    def test_check_crc32_ok(self):
+        self.packet.push_data(bytes(self.DATA))
+        self.assertEqual(self.packet, self.packet.add_crc32())
+        self.assertEqual(self.packet.check_crc32(), True, "Invalid check_crc32 result")
+
+    def test_check_crc32_fail(self):
+        self.packet.push_data(bytes(self.DATA))
+        # No add_crc32 here
+        self.assertEqual(self.packet.check_crc32(), False, "Invalid check_crc32 result")
+
+    def test_calculate_crc32(self):
+        self.assertEqual(Packet.calculate_crc32(b"123456789"), 0xcbf43926, "Invalid CRC-32")
+
 if __name__ == "__main__":
     unittest.main()
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: MIT
 
 import unittest
+from rpibaremetal.compression import compress
 from rpibaremetal.connection.connection import Connection
 from rpibaremetal.packet import Packet
 from rpibaremetal.protocol import Protocol
@@ -332,6 +333,119 @@ class TestProtocol(unittest.TestCase): #pylint: disable=too-many-public-methods
         with self.expect_protocol_error("Invalid.*argument"):
             self.protocol.memory_write(self.ADDR, self.DATA)
 
+    # memory_write_lz4
+
+    def test_memory_write_lz4(self):
+        compressed = bytes([0x80]) + self.DATA
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_COMPRESSED).push_u64(self.ADDR). \
+            push_u32(len(self.DATA)).push_u8(Protocol.CODEC_LZ4).push_u32(len(compressed)). \
+            push_data(compressed).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_COMPRESSED). \
+            push_u64(self.ADDR).push_u32(len(self.DATA)).add_crc()
+        self.expect_transaction(request, response)
+        self.protocol.memory_write_lz4(self.ADDR, len(self.DATA), compressed)
+
+    def test_memory_write_lz4_different_length(self):
+        compressed = bytes([0x80]) + self.DATA
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_COMPRESSED).push_u64(self.ADDR). \
+            push_u32(len(self.DATA)).push_u8(Protocol.CODEC_LZ4).push_u32(len(compressed)). \
+            push_data(compressed).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_COMPRESSED). \
+            push_u64(self.ADDR).push_u32(len(self.DATA) + 1).add_crc()
+        self.expect_transaction(request, response)
+        with self.expect_protocol_error("Different.*length"):
+            self.protocol.memory_write_lz4(self.ADDR, len(self.DATA), compressed)
+
+    # memory_write_compressed
+
+    def test_memory_write_compressed_raw(self):
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE).push_u64(self.ADDR). \
+            push_u32(len(self.DATA)).push_data(self.DATA).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE).push_u64(self.ADDR). \
+            push_u32(len(self.DATA)).add_crc()
+        self.expect_transaction(request, response)
+        self.protocol.memory_write_compressed(self.ADDR, self.DATA)
+
+    def test_memory_write_compressed_chunks(self):
+        data = bytes(64) + self.DATA
+        compressed = compress(data[:64])
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_COMPRESSED).push_u64(self.ADDR). \
+            push_u32(64).push_u8(Protocol.CODEC_LZ4).push_u32(len(compressed)). \
+            push_data(compressed).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_COMPRESSED). \
+            push_u64(self.ADDR).push_u32(64).add_crc()
+        self.expect_transaction(request, response)
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE).push_u64(self.ADDR + 64). \
+            push_u32(len(self.DATA)).push_data(self.DATA).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE).push_u64(self.ADDR + 64). \
+            push_u32(len(self.DATA)).add_crc()
+        self.expect_transaction(request, response)
+        self.protocol.memory_write_compressed(self.ADDR, data, chunk_size=64)
+
+    # vectored memory access
+
+    def test_memory_read_vectored(self):
+        self.protocol.version = Protocol.VERSION_VECTORED
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_READ_VECTORED).push_u32(2). \
+            push_u64(self.ADDR).push_u32(3).push_u64(self.ADDR + 0x100).push_u32(5).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_READ_VECTORED).push_u32(2). \
+            push_u32(len(self.DATA)).push_data(self.DATA).add_crc()
+        self.expect_transaction(request, response)
+        buffer = bytearray(5)
+        self.assertEqual(self.protocol.memory_read_vectored([(self.ADDR, 3),
+                                                             (self.ADDR + 0x100, buffer)]),
+                         [self.DATA[:3], buffer])
+        self.assertEqual(buffer, self.DATA[3:])
+
+    def test_memory_read_vectored_different_length(self):
+        self.protocol.version = Protocol.VERSION_VECTORED
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_READ_VECTORED).push_u32(1). \
+            push_u64(self.ADDR).push_u32(len(self.DATA)).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_READ_VECTORED).push_u32(1). \
+            push_u32(len(self.DATA) + 1).push_data(self.DATA).add_crc()
+        self.expect_transaction(request, response)
+        with self.expect_protocol_error("Different.*length"):
+            self.protocol.memory_read_vectored([(self.ADDR, len(self.DATA))])
+
+    def test_memory_write_vectored(self):
+        self.protocol.version = Protocol.VERSION_VECTORED
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_VECTORED).push_u32(2). \
+            push_u64(self.ADDR).push_u32(3).push_data(self.DATA[:3]). \
+            push_u64(self.ADDR + 0x100).push_u32(5).push_data(self.DATA[3:]).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_VECTORED).push_u32(2). \
+            push_u32(len(self.DATA)).add_crc()
+        self.expect_transaction(request, response)
+        data = memoryview(self.DATA)
+        self.protocol.memory_write_vectored([(self.ADDR, data[:3]), (self.ADDR + 0x100, data[3:])])
+
+    def test_memory_write_vectored_invalid_arg_error(self):
+        self.protocol.version = Protocol.VERSION_VECTORED
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_WRITE_VECTORED).push_u32(1). \
+            push_u64(self.ADDR).push_u32(len(self.DATA)).push_data(self.DATA).add_crc()
+        response = TestProtocol.create_error_packet(Protocol.ERRORCODE_INVALID_ARG)
+        self.expect_transaction(request, response)
+        with self.expect_protocol_error("Invalid.*argument"):
+            self.protocol.memory_write_vectored([(self.ADDR, self.DATA)])
+
+    def test_vectored_version(self):
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION). \
+            push_u16(Protocol.VERSION_FRAMING_V2).add_crc()
+        self.expect_transaction(request, response)
+        with self.expect_protocol_error("needs target version"):
+            self.protocol.memory_read_vectored([(self.ADDR, 1)])
+        with self.expect_protocol_error("needs target version"):
+            self.protocol.memory_write_vectored([(self.ADDR, b"\x01")])
+        self.assertEqual(self.protocol.version, Protocol.VERSION_FRAMING_V2)
+
+    def test_split_segments(self):
+        self.protocol.chunk_size = 0x10
+        segments = [(i, bytes(8)) for i in range(3)] + [(3, bytes(0x20))] + \
+            [(i, b"") for i in range(Protocol.VECTORED_MAX_SEGMENTS + 1)]
+        batches = self.protocol.split_segments(segments)
+        self.assertEqual([len(batch) for batch in batches],
+                         [2, 1, 1, Protocol.VECTORED_MAX_SEGMENTS, 1])
+
     # execute
 
     def test_execute(self):
@@ -479,5 +593,120 @@ class TestProtocol(unittest.TestCase): #pylint: disable=too-many-public-methods
         with self.expect_protocol_error("Invalid.*type"):
             self.protocol.do_transaction(0, {}, {"test": {"type": 0xffff, "value": 1}})
 
+    # framing v2
+
+    @staticmethod
+    def create_frame(sequence, payload):
+        header = Packet().push_u16(Protocol.FRAME_MAGIC).push_u16(sequence). \
+            push_u32(len(payload.get_raw_data())).add_crc()
+        return header.push_data(payload.add_crc32().get_raw_data())
+
+    def expect_frames(self, sequence, request, response, response_sequence=None):
+        response_sequence = sequence if response_sequence is None else response_sequence
+        self.connection.expect_send(self.create_frame(sequence, request).get_raw_data())
+        self.connection.expect_recv(self.create_frame(response_sequence, response).get_raw_data())
+
+    def test_v2_get_version(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION).push_u16(self.VERSION)
+        self.expect_frames(0, request, response)
+        self.assertEqual(self.protocol.get_version(), self.VERSION, "Invalid version")
+
+    def test_v2_sequence(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        self.protocol.sequence = 0xffff
+        for sequence in [0xffff, 0x0000]:
+            request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+            response = Packet().push_u16(Protocol.COMMAND_GET_VERSION).push_u16(self.VERSION)
+            self.expect_frames(sequence, request, response)
+            self.assertEqual(self.protocol.get_version(), self.VERSION, "Invalid version")
+
+    def test_v2_memory_read(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        request = Packet().push_u16(Protocol.COMMAND_MEMORY_READ).push_u64(self.ADDR). \
+            push_u32(len(self.DATA))
+        response = Packet().push_u16(Protocol.COMMAND_MEMORY_READ).push_u64(self.ADDR). \
+            push_u32(len(self.DATA)).push_data(self.DATA)
+        self.expect_frames(0, request, response)
+        self.assertEqual(self.protocol.memory_read(self.ADDR, len(self.DATA)), self.DATA,
+                         "Invalid data")
+
+    def test_v2_stale_frame(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        stale = Packet().push_u16(Protocol.COMMAND_MEMORY_READ).push_data(self.DATA)
+        self.connection.expect_recv(self.create_frame(0xffff, stale).get_raw_data())
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION).push_u16(self.VERSION)
+        self.expect_frames(0, request, response)
+        self.assertEqual(self.protocol.get_version(), self.VERSION, "Invalid version")
+
+    def test_v2_resynchronisation(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        self.connection.expect_recv([0xa5, 0x5a, 0x00, 0xa5, 0x12])
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION).push_u16(self.VERSION)
+        self.expect_frames(0, request, response)
+        self.assertEqual(self.protocol.get_version(), self.VERSION, "Invalid version")
+
+    def test_v2_crc_error(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = self.create_frame(0, Packet().push_u16(Protocol.COMMAND_GET_VERSION).
+                                     push_u16(self.VERSION)).get_raw_data()
+        self.connection.expect_send(self.create_frame(0, request).get_raw_data())
+        self.connection.expect_recv(response[:-1] + bytes([response[-1] ^ 0xff]))
+        with self.expect_protocol_error("CRC.*response"):
+            self.protocol.get_version()
+
+    def test_v2_crc_target_error(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = Packet().push_u16(Protocol.COMMAND_ERROR). \
+            push_u16(Protocol.ERRORCODE_INVALID_CRC)
+        self.expect_frames(0, request, response)
+        with self.expect_protocol_error("CRC.*target"):
+            self.protocol.get_version()
+
+    def test_v2_invalid_length(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION).push_u32(self.VERSION)
+        self.expect_frames(0, request, response)
+        with self.expect_protocol_error("Invalid.*length"):
+            self.protocol.get_version()
+
+    def test_v2_frame_length_limit(self):
+        self.protocol.framing = Protocol.FRAMING_V2
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        self.connection.expect_send(self.create_frame(0, request).get_raw_data())
+        self.connection.expect_recv(Packet().push_u16(Protocol.FRAME_MAGIC).push_u16(0).
+                                    push_u32(0xffffffff).add_crc().get_raw_data())
+        with self.expect_protocol_error("Invalid frame length"):
+            self.protocol.get_version()
+
+    def test_negotiate_framing_v2(self):
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION). \
+            push_u16(Protocol.VERSION_FRAMING_V2).add_crc()
+        self.expect_transaction(request, response)
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION)
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION). \
+            push_u16(Protocol.VERSION_FRAMING_V2)
+        self.expect_frames(0, request, response)
+        self.assertEqual(self.protocol.negotiate_framing(), Protocol.VERSION_FRAMING_V2)
+        self.assertEqual(self.protocol.framing, Protocol.FRAMING_V2)
+        self.assertEqual(self.protocol.version, Protocol.VERSION_FRAMING_V2)
+        self.assertFalse(self.protocol.supports_pipelining())
+        self.protocol.version = Protocol.VERSION_PIPELINING
+        self.assertTrue(self.protocol.supports_pipelining())
+
+    def test_negotiate_framing_v1(self):
+        request = Packet().push_u16(Protocol.COMMAND_GET_VERSION).add_crc()
+        response = Packet().push_u16(Protocol.COMMAND_GET_VERSION).push_u16(0x0100).add_crc()
+        self.expect_transaction(request, response)
+        self.assertEqual(self.protocol.negotiate_framing(), 0x0100)
+        self.assertEqual(self.protocol.framing, Protocol.FRAMING_V1)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,147 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import tempfile
+import unittest
+from rpibaremetal.registermap import RegisterMap, RegisterMapException, load_register_map, yaml
+
+class MockProtocol:
+    """ Register access part of the Protocol interface which records the transfers. """
+
+    def __init__(self):
+        self.registers = {}
+        self.reads = []
+        self.writes = []
+
+    def register_read(self, address):
+        self.reads.append(address)
+        return self.registers.get(address, 0)
+
+    def register_write(self, address, data):
+        self.writes.append((address, data))
+        self.registers[address] = data
+
+DESCRIPTION = {
+    "name": "GPIO",
+    "base_address": "0x3f200000",
+    "registers": {
+        "GPFSEL1": {
+            "offset": "0x04",
+            "fields": {
+                "FSEL14": {"offset": 12, "width": 3, "values": {"INPUT": 0, "OUTPUT": 1}},
+                "FSEL15": {"offset": 15, "width": 3}
+            }
+        },
+        "GPSET0": {"offset": "0x1c", "access": "write-only", "volatile": True,
+                   "fields": {"SET14": {"offset": 14}, "SET15": {"offset": 15}}},
+        "GPLEV0": {"offset": "0x34", "access": "read-only",
+                   "fields": {"LEV14": {"offset": 14}}},
+        "CONTROL": {"offset": "0x40", "access": "write-only", "reset": "0x100",
+                    "fields": {"ENABLE": {"offset": 0}, "MODE": {"offset": 4, "width": 4}}}
+    }
+}
+
+class TestRegisterMap(unittest.TestCase):
+    """ This class is responsible for testing RegisterMap class. """
+    GPFSEL1 = 0x3f200004
+    GPSET0 = 0x3f20001c
+    GPLEV0 = 0x3f200034
+    CONTROL = 0x3f200040
+
+    def setUp(self):
+        self.protocol = MockProtocol()
+        self.map = RegisterMap(self.protocol, DESCRIPTION)
+
+    def test_coalesced_field_writes(self):
+        self.protocol.registers[self.GPFSEL1] = 0x00000007
+        self.map.GPFSEL1.FSEL14 = "OUTPUT"
+        self.map.GPFSEL1.FSEL15 = 4
+        self.assertEqual(self.protocol.writes, [])
+        self.map.commit()
+        self.assertEqual(self.protocol.reads, [self.GPFSEL1])
+        self.assertEqual(self.protocol.writes, [(self.GPFSEL1, 0x00021007)])
+
+    def test_non_volatile_shadow(self):
+        self.map.GPFSEL1.modify(FSEL14=1)
+        self.map.GPFSEL1.modify(FSEL15=1)
+        self.assertEqual(self.map.GPFSEL1.FSEL14, 1)
+        self.assertEqual(self.protocol.reads, [self.GPFSEL1])
+        self.assertEqual(self.protocol.writes, [(self.GPFSEL1, 0x1000), (self.GPFSEL1, 0x9000)])
+
+        self.map.invalidate()
+        self.assertEqual(self.map.GPFSEL1.FSEL15, 1)
+        self.assertEqual(self.protocol.reads, [self.GPFSEL1, self.GPFSEL1])
+
+    def test_volatile(self):
+        self.protocol.registers[self.GPLEV0] = 1 << 14
+        self.assertEqual(self.map.GPLEV0.LEV14, 1)
+        self.protocol.registers[self.GPLEV0] = 0
+        self.assertEqual(self.map.GPLEV0.LEV14, 0)
+        self.assertEqual(self.protocol.reads, [self.GPLEV0, self.GPLEV0])
+
+    def test_read_only(self):
+        with self.assertRaises(RegisterMapException):
+            self.map.GPLEV0.LEV14 = 1
+        with self.assertRaises(RegisterMapException):
+            self.map.GPLEV0.write(0)
+
+    def test_write_only_volatile(self):
+        self.map.GPSET0.modify(SET14=1)
+        self.map.GPSET0.modify(SET15=1)
+        self.assertEqual(self.protocol.reads, [])
+        self.assertEqual(self.protocol.writes, [(self.GPSET0, 1 << 14), (self.GPSET0, 1 << 15)])
+
+    def test_write_only_shadow(self):
+        self.map.CONTROL.modify(ENABLE=1)
+        self.map.CONTROL.modify(MODE=3)
+        self.assertEqual(self.protocol.reads, [])
+        self.assertEqual(self.protocol.writes, [(self.CONTROL, 0x101), (self.CONTROL, 0x131)])
+
+    def test_context_manager(self):
+        with self.map as gpio:
+            gpio["GPFSEL1"].set(FSEL14=1, FSEL15=1)
+            self.assertTrue(gpio.GPFSEL1.is_pending())
+        self.assertEqual(self.protocol.writes, [(self.GPFSEL1, 0x9000)])
+        self.assertFalse(self.map.GPFSEL1.is_pending())
+
+    def test_invalid_access(self):
+        with self.assertRaises(RegisterMapException):
+            self.map.GPFSEL1.FSEL14 = 8
+        with self.assertRaises(RegisterMapException):
+            self.map.GPFSEL1.FSEL14 = "ALT0"
+        with self.assertRaises(AttributeError):
+            self.map.GPFSEL1.FSEL16 = 1
+        with self.assertRaises(AttributeError):
+            self.map.GPFSEL2 #pylint: disable=pointless-statement
+
+    def test_invalid_description(self):
+        with self.assertRaises(RegisterMapException):
+            RegisterMap(self.protocol, {"registers": {"R": {"offset": 2}}})
+        with self.assertRaises(RegisterMapException):
+            RegisterMap(self.protocol, {"registers": {"R": {"offset": 0, "fields": {
+                "F": {"offset": 30, "width": 4}}}}})
+
+    def test_load_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "gpio.json")
+            with open(path, "w") as description_file:
+                json.dump(DESCRIPTION, description_file)
+            register_map = load_register_map(self.protocol, path)
+        self.assertEqual(register_map.GPFSEL1.address, self.GPFSEL1)
+
+    @unittest.skipIf(yaml is None, "PyYAML is not installed")
+    def test_load_yaml(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "gpio.yaml")
+            with open(path, "w") as description_file:
+                description_file.write("base_address: 0x3f200000\n"
+                                       "registers:\n"
+                                       "  GPLEV0: {offset: 0x34, access: read-only}\n")
+            register_map = load_register_map(self.protocol, path)
+        self.assertEqual(register_map.GPLEV0.address, self.GPLEV0)
+        self.assertTrue(register_map.GPLEV0.volatile)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import unittest
+from rpibaremetal.remotememory import RemoteMemory
+
+class MockProtocol:
+    """ Memory access part of the Protocol interface which records the transfers. """
+
+    def __init__(self, address, length):
+        self.address = address
+        self.memory = bytearray(i & 0xff for i in range(length))
+        self.reads = []
+        self.writes = []
+
+    def memory_read(self, address, length):
+        self.reads.append((address, length))
+        offset = address - self.address
+        return bytes(self.memory[offset:offset + length])
+
+    def memory_write(self, address, data):
+        self.writes.append((address, len(data)))
+        offset = address - self.address
+        self.memory[offset:offset + len(data)] = data
+
+class TestRemoteMemory(unittest.TestCase):
+    """ This class is responsible for testing RemoteMemory class. """
+    ADDR = 0x10000
+    LENGTH = 0x1000
+    PAGE_SIZE = 0x100
+
+    def setUp(self):
+        self.protocol = MockProtocol(self.ADDR, self.LENGTH)
+        self.memory = RemoteMemory(self.protocol, self.ADDR, self.LENGTH, self.PAGE_SIZE,
+                                   cache_pages=4)
+
+    def test_index(self):
+        self.assertEqual(len(self.memory), self.LENGTH)
+        self.assertEqual(self.memory[0x123], 0x23)
+        self.assertEqual(self.memory[-1], 0xff)
+        self.assertEqual(self.memory[0x124], 0x24)
+        self.assertEqual(self.protocol.reads, [(self.ADDR + 0x100, self.PAGE_SIZE),
+                                               (self.ADDR + 0xf00, self.PAGE_SIZE)])
+        with self.assertRaises(IndexError):
+            self.memory[self.LENGTH] #pylint: disable=pointless-statement
+
+    def test_slice(self):
+        self.assertEqual(self.memory[0x0f0:0x210], bytes(self.protocol.memory[0x0f0:0x210]))
+        self.assertEqual(self.protocol.reads, [(self.ADDR, 3 * self.PAGE_SIZE)])
+        with self.assertRaises(RemoteMemory.RemoteMemoryException):
+            self.memory[0:10:2] #pylint: disable=pointless-statement
+
+    def test_coalesce_misses(self):
+        self.memory.read(0x100, 1)
+        self.memory.read(0x000, 0x400)
+        self.assertEqual(self.protocol.reads, [(self.ADDR + 0x100, self.PAGE_SIZE),
+                                               (self.ADDR, self.PAGE_SIZE),
+                                               (self.ADDR + 0x200, 2 * self.PAGE_SIZE)])
+
+    def test_write_back(self):
+        self.memory[0x010:0x014] = b"abcd"
+        self.memory.write_u32(0x120, 0x12345678)
+        self.memory[0x300] = 0x55
+        self.assertEqual(self.protocol.writes, [])
+        self.assertEqual(self.memory[0x010:0x014], b"abcd")
+
+        self.memory.flush()
+        self.assertEqual(self.protocol.writes, [(self.ADDR, 2 * self.PAGE_SIZE),
+                                                (self.ADDR + 0x300, self.PAGE_SIZE)])
+        self.assertEqual(self.protocol.memory[0x010:0x014], b"abcd")
+        self.assertEqual(self.protocol.memory[0x120:0x124], bytes([0x78, 0x56, 0x34, 0x12]))
+        self.assertEqual(self.protocol.memory[0x300], 0x55)
+
+        self.memory.flush()
+        self.assertEqual(len(self.protocol.writes), 2)
+
+    def test_full_page_write_without_fetch(self):
+        self.memory[0x100:0x300] = bytes(0x200)
+        self.assertEqual(self.protocol.reads, [])
+        self.memory.flush()
+        self.assertEqual(self.protocol.memory[0x100:0x300], bytes(0x200))
+
+    def test_lru_eviction(self):
+        for page in range(5):
+            self.memory.read(page * self.PAGE_SIZE, 1)
+        self.memory.read(0, 1)
+        self.assertEqual(len(self.protocol.reads), 6)
+        self.memory.read(4 * self.PAGE_SIZE, 1)
+        self.assertEqual(len(self.protocol.reads), 6)
+
+    def test_eviction_writes_back(self):
+        self.memory[0] = 0xaa
+        for page in range(1, 5):
+            self.memory.read(page * self.PAGE_SIZE, 1)
+        self.assertEqual(self.protocol.writes, [(self.ADDR, self.PAGE_SIZE)])
+        self.assertEqual(self.protocol.memory[0], 0xaa)
+
+    def test_large_access(self):
+        data = bytes(range(256)) * 8
+        self.memory[0x400:0xc00] = data
+        self.assertEqual(self.memory[0x400:0xc00], data)
+        self.memory.flush()
+        self.assertEqual(self.protocol.memory[0x400:0xc00], data)
+
+    def test_struct(self):
+        self.memory.pack("<HQ", 0x10, 0x1234, 0x1122334455667788)
+        self.assertEqual(self.memory.unpack("<HQ", 0x10), (0x1234, 0x1122334455667788))
+        self.assertEqual(self.memory.read_u16(0x10), 0x1234)
+        self.assertEqual(self.memory.read_u64(0x12), 0x1122334455667788)
+
+    def test_bytes(self):
+        self.assertEqual(bytes(self.memory), bytes(self.protocol.memory))
+
+    def test_to_memoryview(self):
+        view = self.memory.to_memoryview()
+        self.assertTrue(view.readonly)
+        self.assertEqual(view.tobytes(), bytes(self.protocol.memory))
+        self.memory[0] = 0xff
+        self.assertEqual(view[0], self.protocol.memory[0])
+
+    def test_short_last_page(self):
+        memory = RemoteMemory(self.protocol, self.ADDR, 0x150, self.PAGE_SIZE)
+        self.assertEqual(memory[0x140:0x150], bytes(self.protocol.memory[0x140:0x150]))
+        self.assertEqual(self.protocol.reads, [(self.ADDR + 0x100, 0x50)])
+
+    def test_out_of_range(self):
+        with self.assertRaises(RemoteMemory.RemoteMemoryException):
+            self.memory.read(self.LENGTH - 1, 2)
+
+    def test_context_manager(self):
+        with self.memory as memory:
+            memory.write_u8(0, 0x99)
+        self.assertEqual(self.protocol.memory[0], 0x99)
+
+    def test_invalidate(self):
+        self.memory[0] = 0x99
+        self.memory.invalidate()
+        self.assertEqual(self.memory[0], 0)
+        self.assertEqual(self.protocol.writes, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import threading
+import unittest
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.scheduler import ProtocolScheduler
+from rpibaremetal.simulator import SimulatedTarget
+
+class BlockingProtocol:
+    """ Protocol mock which records the calls and blocks until it is released. """
+
+    def __init__(self):
+        self.calls = []
+        self.called = threading.Event()
+        self.release = threading.Event()
+
+    def register_read(self, address):
+        self.release.wait()
+        self.calls.append(("register_read", address))
+        return address
+
+    def memory_read(self, address, length):
+        self.called.set()
+        self.release.wait()
+        self.calls.append(("memory_read", address, length))
+        return bytes(length)
+
+    def get_version(self):
+        self.release.wait()
+        raise Protocol.ProtocolException("Invalid CRC")
+
+class TestScheduler(unittest.TestCase):
+    """ This class is responsible for testing ProtocolScheduler class. """
+
+    def test_priority(self):
+        protocol = BlockingProtocol()
+        with ProtocolScheduler(protocol, chunk_size=0x100) as scheduler:
+            bulk = scheduler.memory_read(0x1000, 0x300)
+            protocol.called.wait(1)
+            register = scheduler.register_read(0x2000)
+            protocol.release.set()
+            self.assertEqual(bulk.result(1), bytes(0x300))
+            self.assertEqual(register.result(1), 0x2000)
+
+        self.assertEqual(protocol.calls, [("memory_read", 0x1000, 0x100),
+                                          ("register_read", 0x2000),
+                                          ("memory_read", 0x1100, 0x100),
+                                          ("memory_read", 0x1200, 0x100)])
+
+    def test_exception(self):
+        protocol = BlockingProtocol()
+        protocol.release.set()
+        with ProtocolScheduler(protocol) as scheduler:
+            with self.assertRaisesRegex(Protocol.ProtocolException, "CRC"):
+                scheduler.get_version().result(1)
+            self.assertEqual(scheduler.register_read(0x10).result(1), 0x10)
+
+    def test_cancel(self):
+        protocol = BlockingProtocol()
+        with ProtocolScheduler(protocol) as scheduler:
+            first = scheduler.register_read(0x10)
+            second = scheduler.register_read(0x20)
+            self.assertTrue(second.cancel())
+            protocol.release.set()
+            first.result(1)
+        self.assertEqual(protocol.calls, [("register_read", 0x10)])
+
+    def test_closed(self):
+        scheduler = ProtocolScheduler(BlockingProtocol())
+        scheduler.close()
+        with self.assertRaises(ProtocolScheduler.SchedulerException):
+            scheduler.register_read(0)
+
+    def test_invalid_priority(self):
+        protocol = BlockingProtocol()
+        protocol.release.set()
+        with ProtocolScheduler(protocol) as scheduler:
+            for priority in [ProtocolScheduler.PRIORITY_HIGH - 1, ProtocolScheduler.PRIORITY_STOP]:
+                with self.assertRaisesRegex(ProtocolScheduler.SchedulerException, "priority"):
+                    scheduler.register_read(0x10, priority=priority)
+        self.assertEqual(protocol.calls, [])
+
+    def test_threads(self):
+        with SimulatedTarget() as target:
+            connection = SerialConnection(target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                          timeout=1)
+            address = SimulatedTarget.BASE_ADDRESS
+            data = bytes(i & 0xff for i in range(0x4000))
+            results = []
+
+            with ProtocolScheduler(Protocol(connection)) as scheduler:
+                def poll():
+                    for _ in range(20):
+                        results.append(scheduler.get_version().result(5))
+
+                thread = threading.Thread(target=poll)
+                thread.start()
+                scheduler.memory_write(address, data).result(5)
+                self.assertEqual(scheduler.memory_read(address, len(data)).result(5), data)
+                thread.join()
+
+            connection.close()
+            self.assertEqual(results, [SimulatedTarget.VERSION] * 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import time
+import unittest
+from rpibaremetal.connection import recordingconnection
+from rpibaremetal.connection.connection import Connection
+from rpibaremetal.connection.recordingconnection import RecordingConnection
+from rpibaremetal.connection.replayconnection import ReplayConnection
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+from rpibaremetal.trace import TraceException, TraceWriter, decode_transactions, read_trace, \
+    summarize
+
+class FailingConnection(Connection):
+    """ Connection which fails with an unexpected error when its baud rate is queried. """
+
+    def get_baudrate(self):
+        raise RuntimeError("Unexpected error")
+
+class TrackedTraceWriter(TraceWriter):
+    """ Trace writer which remembers its instances. """
+    instances = []
+
+    def __init__(self, path):
+        TraceWriter.__init__(self, path)
+        self.instances.append(self)
+
+class TestTrace(unittest.TestCase):
+    """ This class is responsible for testing the recording, decoding and replaying of traces. """
+    ADDR = SimulatedTarget.BASE_ADDRESS + 0x100
+    DATA = bytes(range(200))
+    DELAY = 0.2
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "session.trace")
+
+        with SimulatedTarget() as target:
+            connection = SerialConnection(target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                          timeout=0.5)
+            self.recording = RecordingConnection(connection, self.path)
+            self.results = self.run_session(Protocol(self.recording), self.DELAY)
+            self.recording.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_session(self, protocol, delay=0):
+        results = [protocol.negotiate_framing(), protocol.get_base_address()]
+        protocol.memory_write(self.ADDR, self.DATA)
+        time.sleep(delay)
+        results.append(protocol.memory_read(self.ADDR, len(self.DATA)))
+        with self.assertRaises(Protocol.ProtocolException):
+            protocol.memory_write(0, self.DATA)
+        return results
+
+    def test_decode(self):
+        transactions = decode_transactions(read_trace(self.path))
+        self.assertEqual([transaction.name for transaction in transactions],
+                         ["get_version", "get_version", "get_base_address", "memory_write",
+                          "memory_read", "memory_write"])
+        self.assertEqual([transaction.framing for transaction in transactions],
+                         [Protocol.FRAMING_V1] + [Protocol.FRAMING_V2] * 5)
+
+        memory_read = transactions[4]
+        self.assertEqual(memory_read.request, {"address": self.ADDR, "length": len(self.DATA)})
+        self.assertEqual(memory_read.response["data"], self.DATA)
+        self.assertGreater(memory_read.start - transactions[3].start, self.DELAY)
+        self.assertGreater(memory_read.get_duration(), 0)
+        self.assertRegex(transactions[5].error, "0x0003")
+
+    def test_decode_vectored(self):
+        with SimulatedTarget() as target:
+            connection = SerialConnection(target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                          timeout=0.5)
+            recording = RecordingConnection(connection, self.path)
+            protocol = Protocol(recording)
+            protocol.negotiate_framing()
+            protocol.memory_write_vectored([(self.ADDR, b"\x01\x02"), (self.ADDR + 8, b"\x03")])
+            protocol.memory_read_vectored([(self.ADDR, 2), (self.ADDR + 8, 1)])
+            recording.close()
+
+        write, read = decode_transactions(read_trace(self.path))[-2:]
+        self.assertEqual(write.request["segments"],
+                         [{"address": self.ADDR, "length": 2, "data": b"\x01\x02"},
+                          {"address": self.ADDR + 8, "length": 1, "data": b"\x03"}])
+        self.assertEqual(write.response, {"count": 2, "length": 3})
+        self.assertEqual(read.request, {"count": 2, "segments": [
+            {"address": self.ADDR, "length": 2}, {"address": self.ADDR + 8, "length": 1}]})
+        self.assertEqual(read.response["data"], b"\x01\x02\x03")
+
+    def test_summarize(self):
+        summary = summarize(decode_transactions(read_trace(self.path)))
+        self.assertEqual(summary["get_version"]["count"], 2)
+        self.assertEqual(summary["memory_write"]["errors"], 1)
+        self.assertGreater(summary["memory_read"]["bytes"], len(self.DATA))
+        self.assertGreater(summary["memory_read"]["throughput"], 0)
+
+    def test_replay(self):
+        start = time.monotonic()
+        self.assertEqual(self.run_session(Protocol(ReplayConnection(self.path))), self.results)
+        self.assertLess(time.monotonic() - start, self.DELAY)
+
+    def test_replay_realtime(self):
+        start = time.monotonic()
+        protocol = Protocol(ReplayConnection(self.path, realtime=True))
+        self.assertEqual(self.run_session(protocol), self.results)
+        self.assertGreater(time.monotonic() - start, self.DELAY)
+
+    def test_replay_mismatch(self):
+        protocol = Protocol(ReplayConnection(self.path))
+        protocol.negotiate_framing()
+        with self.assertRaisesRegex(Protocol.ProtocolException, "differs"):
+            protocol.memory_read(self.ADDR, 1)
+
+    def test_replay_end(self):
+        connection = ReplayConnection(self.path)
+        connection.events = connection.events[:connection.index]
+        with self.assertRaisesRegex(Connection.ConnectionException, "End"):
+            connection.send(b"")
+
+    def test_writer_context(self):
+        with TraceWriter(self.path) as writer:
+            self.assertFalse(writer.file.closed)
+        self.assertTrue(writer.file.closed)
+
+    def test_recording_setup_failure(self):
+        recordingconnection.TraceWriter = TrackedTraceWriter
+        try:
+            with self.assertRaisesRegex(RuntimeError, "Unexpected"):
+                RecordingConnection(FailingConnection(), self.path)
+        finally:
+            recordingconnection.TraceWriter = TraceWriter
+        self.assertTrue(TrackedTraceWriter.instances[-1].file.closed)
+
+    def test_invalid_trace(self):
+        with open(self.path, "wb") as trace_file:
+            trace_file.write(b"INVALID")
+        with self.assertRaisesRegex(TraceException, "Invalid"):
+            read_trace(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import unittest
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+from rpibaremetal.transfer import CancellationToken, CancelledException, Transfer
+
+class TestTransfer(unittest.TestCase):
+    """ This class is responsible for testing the chunked transfers with progress and cancel. """
+    ADDR = SimulatedTarget.BASE_ADDRESS
+    CHUNK_SIZE = 0x400
+    DATA = bytes(i * 13 & 0xff for i in range(0x1000))
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.connection = SerialConnection(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=1)
+        self.protocol = Protocol(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def test_chunks(self):
+        self.assertEqual(list(Transfer(10, 4).chunks()), [(0, 4), (4, 4), (8, 2)])
+        self.assertEqual(list(Transfer(0, 4).chunks()), [(0, 0)])
+
+    def test_progress(self):
+        statuses = []
+        self.protocol.memory_write(self.ADDR, self.DATA, progress=statuses.append,
+                                   chunk_size=self.CHUNK_SIZE)
+        self.assertEqual([status.done for status in statuses], [0x400, 0x800, 0xc00, 0x1000])
+        self.assertTrue(all(status.total == len(self.DATA) for status in statuses))
+        self.assertTrue(all(status.rate > 0 and status.average_rate > 0 for status in statuses))
+
+        statuses.clear()
+        data = self.protocol.memory_read(self.ADDR, len(self.DATA), progress=statuses.append,
+                                         chunk_size=self.CHUNK_SIZE)
+        self.assertEqual(data, self.DATA)
+        self.assertEqual(len(statuses), 4)
+
+    def test_read_into(self):
+        self.protocol.memory_write(self.ADDR, self.DATA)
+        buffer = bytearray(len(self.DATA) + 2)
+        statuses = []
+        self.protocol.memory_read_into(self.ADDR, memoryview(buffer)[1:-1], statuses.append,
+                                       chunk_size=self.CHUNK_SIZE)
+        self.assertEqual(buffer, b"\0" + self.DATA + b"\0")
+        self.assertEqual(len(statuses), 4)
+
+    def test_cancel_write(self):
+        token = CancellationToken()
+
+        def progress(status):
+            if status.done == 0x800:
+                token.cancel()
+
+        with self.assertRaises(CancelledException) as context:
+            self.protocol.memory_write(self.ADDR, self.DATA, progress, token, self.CHUNK_SIZE)
+        self.assertEqual(context.exception.done, 0x800)
+        self.assertEqual(self.target.memory[self.ADDR:self.ADDR + 0x800], self.DATA[:0x800])
+        self.assertEqual(self.target.memory[self.ADDR + 0x800:self.ADDR + 0x1000], bytes(0x800))
+
+        # The link is still in sync
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_cancel_read(self):
+        token = CancellationToken()
+        token.cancel()
+        with self.assertRaises(CancelledException) as context:
+            self.protocol.memory_read(self.ADDR, len(self.DATA), cancel=token)
+        self.assertEqual(context.exception.done, 0)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_cancel_compressed(self):
+        token = CancellationToken()
+        data = bytes(0x3000)
+
+        def progress(status):
+            if status.done == 0x1000:
+                token.cancel()
+
+        with self.assertRaises(CancelledException):
+            self.protocol.memory_write_compressed(self.ADDR, data, progress, token, 0x1000)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_empty(self):
+        for write in [self.protocol.memory_write, self.protocol.memory_write_compressed]:
+            statuses = []
+            write(self.ADDR, b"", statuses.append)
+            self.assertEqual([(status.done, status.total) for status in statuses], [(0, 0)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# Copyright (c) 2020, Kis Imre. All rights reserved.
+# SPDX-License-Identifier: MIT
+
+import unittest
+from rpibaremetal.connection.serialconnection import SerialConnection
+from rpibaremetal.protocol import Protocol
+from rpibaremetal.simulator import SimulatedTarget
+
+class TestVectored(unittest.TestCase):
+    """ This class is responsible for testing the vectored memory access on the simulator. """
+    ADDR = SimulatedTarget.BASE_ADDRESS
+
+    def setUp(self):
+        self.target = SimulatedTarget()
+        self.target.start()
+        self.connection = SerialConnection(self.target.port, SimulatedTarget.DEFAULT_BAUD_RATE,
+                                           timeout=1)
+        self.protocol = Protocol(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        self.target.stop()
+
+    def test_scatter_gather(self):
+        for framing in [Protocol.FRAMING_V1, Protocol.FRAMING_V2]:
+            if framing == Protocol.FRAMING_V2:
+                self.protocol.negotiate_framing()
+            data = bytes((i * 7 + framing) & 0xff for i in range(0x300))
+            view = memoryview(data)
+            segments = [(self.ADDR + 0x1000 * i, view[0x100 * i:0x100 * (i + 1)])
+                        for i in range(3)]
+            self.protocol.memory_write_vectored(segments)
+            for address, segment in segments:
+                self.assertEqual(self.target.memory[address:address + 0x100], segment)
+
+            buffer = bytearray(0x300)
+            target = memoryview(buffer)
+            result = self.protocol.memory_read_vectored(
+                [(address, target[index * 0x100:(index + 1) * 0x100])
+                 for index, (address, _) in enumerate(segments)])
+            self.assertEqual(len(result), 3)
+            self.assertEqual(buffer, data)
+
+    def test_batches(self):
+        self.protocol.chunk_size = 0x40
+        segments = [(self.ADDR + 0x10 * i, bytes([i]) * 0x10)
+                    for i in range(Protocol.VECTORED_MAX_SEGMENTS + 10)]
+        self.protocol.memory_write_vectored(segments)
+        self.assertEqual(self.protocol.memory_read_vectored(
+            [(address, len(data)) for address, data in segments]), [data for _, data in segments])
+
+    def test_too_many_segments(self):
+        count = Protocol.VECTORED_MAX_SEGMENTS + 1
+        with self.assertRaisesRegex(Protocol.ProtocolException, "Invalid.*argument"):
+            self.protocol.run_transaction(*self.protocol.create_memory_read_vectored(
+                [(self.ADDR, 1)] * count))
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+    def test_kernel_area(self):
+        # The valid segments are written even though the request fails
+        with self.assertRaisesRegex(Protocol.ProtocolException, "Invalid.*argument"):
+            self.protocol.memory_write_vectored([(self.ADDR, b"\x01"), (0, b"\x02"),
+                                                 (self.ADDR + 1, b"\x03")])
+        self.assertEqual(self.target.memory[self.ADDR:self.ADDR + 2], b"\x01\x03")
+        self.assertEqual(self.target.memory[0], 0)
+        self.assertEqual(self.protocol.get_version(), SimulatedTarget.VERSION)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+/*
+ * Copyright (c) 2020, Kis Imre. All rights reserved.
+ *
+ * SPDX-License-Identifier: MIT
+ */
+
+#include "lz4.h"
+#include "packet.h"
+
+struct lz4_stream {
+    uint8_t *output;
+    size_t length;
+    size_t position;
+    size_t remaining;
+    bool valid;
+};
+
+static uint8_t lz4_rx_u8(struct lz4_stream *stream) {
+    if (stream->remaining == 0) {
+        /* Truncated block, do not consume the bytes of the next packet */
+        stream->valid = false;
+        return 0;
+    }
+
+    stream->remaining--;
+    return packet_rx_u8();
+}
+
+static size_t lz4_rx_length(struct lz4_stream *stream, size_t length) {
+    uint8_t value = 0;
+
+    if (length == 15) {
+        do {
+            value = lz4_rx_u8(stream);
+            length += value;
+        } while (value == 255 && stream->valid);
+    }
+
+    return length;
+}
+
+static void lz4_put(struct lz4_stream *stream, uint8_t value) {
+    if (stream->position < stream->length) {
+        stream->output[stream->position++] = value;
+    } else {
+        stream->valid = false;
+    }
+}
+
+/*
+ * Receives an LZ4 block of compressed_length bytes and decompresses it into the output buffer
+ * while the data is arriving. The matches are copied from the already decompressed output so no
+ * extra buffer is needed. The whole block is always consumed, even if it turns out to be invalid.
+ */
+bool lz4_rx_block(uint8_t *output, size_t length, size_t compressed_length) {
+    struct lz4_stream stream = {output, length, 0, compressed_length, true};
+    uint8_t token = 0;
+    size_t literal_length = 0;
+    size_t match_length = 0;
+    size_t offset = 0;
+    size_t i = 0;
+
+    while (stream.remaining > 0) {
+        token = lz4_rx_u8(&stream);
+
+        literal_length = lz4_rx_length(&stream, token >> 4);
+        for (i = 0; i < literal_length && stream.valid; i++) {
+            lz4_put(&stream, lz4_rx_u8(&stream));
+        }
+
+        if (stream.remaining == 0 || !stream.valid) {
+            /* The last sequence only contains literals */
+            break;
+        }
+
+        offset = lz4_rx_u8(&stream);
+        offset |= (size_t)lz4_rx_u8(&stream) << 8;
+        match_length = lz4_rx_length(&stream, token & 0x0f) + 4;
+
+        if (offset == 0 || offset > stream.position) {
+            stream.valid = false;
+            break;
+        }
+
+        /* Byte by byte copy as the match can overlap with itself */
+        for (i = 0; i < match_length && stream.valid; i++) {
+            lz4_put(&stream, output[stream.position - offset]);
+        }
+    }
+
+    while (stream.remaining > 0) {
+        lz4_rx_u8(&stream);
+    }
+
+    return stream.valid && stream.position == length;
+}
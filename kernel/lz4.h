@@ -0,0 +1,16 @@
+/*
+ * Copyright (c) 2020, Kis Imre. All rights reserved.
+ *
+ * SPDX-License-Identifier: MIT
+ */
+
+#ifndef KERNEL_LZ4_H_
+#define KERNEL_LZ4_H_
+
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+bool lz4_rx_block(uint8_t *output, size_t length, size_t compressed_length);
+
+#endif /* KERNEL_LZ4_H_ */
@@ -4,7 +4,9 @@
  * SPDX-License-Identifier: MIT
  */
 
+#include "lz4.h"
 #include "packet.h"
+#include "timer.h"
 #include "uart.h"
 #include "watchdog.h"
 
@@ -14,16 +16,26 @@
 #define COMMAND_REGISTER_WRITE      0x0011
 #define COMMAND_MEMORY_READ         0x0020
 #define COMMAND_MEMORY_WRITE        0x0021
+#define COMMAND_MEMORY_WRITE_COMPRESSED 0x0022
+#define COMMAND_MEMORY_READ_VECTORED    0x0023
+#define COMMAND_MEMORY_WRITE_VECTORED   0x0024
 #define COMMAND_EXECUTE             0x0030
 #define COMMAND_RESET               0x0040
+#define COMMAND_SET_BAUD_RATE       0x0050
 #define COMMAND_ERROR               0x00f0
 
-#define VERSION                     0x0100
+#define VERSION                     0x0201
 
 #define ERRORCODE_INVALID_CRC       0x0001
 #define ERRORCODE_INVALID_COMMAND   0x0002
 #define ERRORCODE_INVALID_ARG       0x0003
 
+#define BAUD_RATE_CONFIRM_TIMEOUT_US    200000
+
+#define CODEC_LZ4                   0x01
+
+#define VECTORED_MAX_SEGMENTS       64
+
 extern uint64_t base;
 const uint64_t base_address = (const uint64_t)&base;
 
@@ -42,13 +54,68 @@ struct context {
     uint64_t x7;
 };
 
+struct segment {
+    uint64_t address;
+    uint32_t length;
+};
+
+static uint32_t baud_rate = UART_DEFAULT_BAUD_RATE;
+static struct segment segments[VECTORED_MAX_SEGMENTS];
+
 static void send_error(uint16_t error_code) {
-    packet_tx_start();
+    packet_tx_start(sizeof(uint16_t) + sizeof(uint16_t));
     packet_tx_u16(COMMAND_ERROR);
     packet_tx_u16(error_code);
     packet_tx_crc();
 }
 
+static void send_version(void) {
+    packet_tx_start(sizeof(uint16_t) + sizeof(uint16_t));
+    packet_tx_u16(COMMAND_GET_VERSION);
+    packet_tx_u16(VERSION);
+    packet_tx_crc();
+}
+
+static bool wait_for_baud_rate_confirmation(void) {
+    uint64_t deadline = timer_get_us() + BAUD_RATE_CONFIRM_TIMEOUT_US;
+    uint32_t window = 0xffffffff;
+    uint8_t c = 0;
+
+    /*
+     * The host confirms the new baud rate by sending a GET_VERSION request. Its command and CRC
+     * bytes are all zeros, so it is found by looking for three consecutive zero bytes. Anything
+     * else is garbage which has passed the UART error checks despite mismatching baud rates.
+     */
+    while (timer_get_us() < deadline) {
+        if (uart_rx_poll(&c)) {
+            window = (window << 8) | c;
+            if ((window & 0x00ffffff) == 0) {
+                return true;
+            }
+        }
+    }
+
+    return false;
+}
+
+static void change_baud_rate(uint32_t new_baud_rate) {
+    uint8_t framing = packet_get_framing();
+
+    uart_set_baud_rate(new_baud_rate);
+
+    if (wait_for_baud_rate_confirmation()) {
+        baud_rate = new_baud_rate;
+
+        /* The confirmation is always a v1 request regardless of the framing in use */
+        packet_set_framing(PACKET_FRAMING_V1);
+        send_version();
+        packet_set_framing(framing);
+    } else {
+        /* Fall back to the last working baud rate */
+        uart_set_baud_rate(baud_rate);
+    }
+}
+
 static uint64_t execute(uint64_t context_address) {
     struct context *context = (struct context*) context_address;
     context->x0 = context->function(context->x0, context->x1, context->x2, context->x3,
@@ -56,26 +123,104 @@ static uint64_t execute(uint64_t context_address) {
     return context->x0;
 }
 
+static void memory_read_vectored(void) {
+    uint64_t total_length = 0;
+    uint32_t count = 0;
+    uint32_t i = 0;
+    struct segment segment = {0};
+
+    /* The whole list is needed for the length of the response, the excess segments are dropped */
+    count = packet_rx_u32();
+    for (i = 0; i < count; i++) {
+        segment.address = packet_rx_u64();
+        segment.length = packet_rx_u32();
+        if (i < VECTORED_MAX_SEGMENTS) {
+            segments[i] = segment;
+            total_length += segment.length;
+        }
+    }
+
+    if (!packet_rx_validate_crc()) {
+        send_error(ERRORCODE_INVALID_CRC);
+        return;
+    }
+
+    if (count > VECTORED_MAX_SEGMENTS || total_length > UINT32_MAX) {
+        send_error(ERRORCODE_INVALID_ARG);
+        return;
+    }
+
+    packet_tx_start(sizeof(uint16_t) + sizeof(uint32_t) + sizeof(uint32_t) +
+                    (uint32_t) total_length);
+    packet_tx_u16(COMMAND_MEMORY_READ_VECTORED);
+    packet_tx_u32(count);
+    packet_tx_u32((uint32_t) total_length);
+    for (i = 0; i < count; i++) {
+        packet_tx_data((const uint8_t*) segments[i].address, segments[i].length);
+    }
+    packet_tx_crc();
+}
+
+static void memory_write_vectored(void) {
+    uint64_t total_length = 0;
+    uint64_t address = 0;
+    uint32_t length = 0;
+    uint32_t count = 0;
+    uint32_t i = 0;
+    bool valid = true;
+
+    /*
+     * The segments are written while they are received, like in the case of MEMORY_WRITE. A
+     * segment below the base address is skipped, the other segments of the request are still
+     * written, so an INVALID_ARG or INVALID_CRC error can follow a partial write.
+     */
+    count = packet_rx_u32();
+    for (i = 0; i < count; i++) {
+        address = packet_rx_u64();
+        length = packet_rx_u32();
+        total_length += length;
+        if (address >= base_address) {
+            packet_rx_data((uint8_t*) address, length);
+        } else {
+            /* Prevent overwriting kernel. */
+            packet_rx_ignore_data(length);
+            valid = false;
+        }
+    }
+
+    if (!packet_rx_validate_crc()) {
+        send_error(ERRORCODE_INVALID_CRC);
+    } else if (!valid || total_length > UINT32_MAX) {
+        send_error(ERRORCODE_INVALID_ARG);
+    } else {
+        packet_tx_start(sizeof(uint16_t) + sizeof(uint32_t) + sizeof(uint32_t));
+        packet_tx_u16(COMMAND_MEMORY_WRITE_VECTORED);
+        packet_tx_u32(count);
+        packet_tx_u32((uint32_t) total_length);
+        packet_tx_crc();
+    }
+}
+
 int main(void) {
     uint64_t address = 0;
     uint64_t result = 0;
     uint32_t length = 0;
     uint32_t register_data = 0;
+    uint32_t new_baud_rate = 0;
+    uint32_t compressed_length = 0;
     uint16_t command = 0;
+    uint8_t codec = 0;
+    bool valid = false;
 
-    uart_init(115200);
+    uart_init(baud_rate);
 
     while (1) {
-        packet_rx_start();
-        command = packet_rx_u16();
+        command = packet_rx_start();
 
         switch (command) {
             case COMMAND_GET_VERSION:
                 if (packet_rx_validate_crc()) {
-                    packet_tx_start();
-                    packet_tx_u16(command);
-                    packet_tx_u16(VERSION);
-                    packet_tx_crc();
+                    send_version();
                 } else {
                     send_error(ERRORCODE_INVALID_CRC);
                 }
@@ -83,7 +228,7 @@ int main(void) {
 
             case COMMAND_GET_BASE_ADDRESS:
                 if (packet_rx_validate_crc()) {
-                    packet_tx_start();
+                    packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t));
                     packet_tx_u16(command);
                     packet_tx_u64(base_address);
                     packet_tx_crc();
@@ -96,7 +241,7 @@ int main(void) {
                 address = packet_rx_u64();
                 if (packet_rx_validate_crc()) {
                     if ((address & 0x3U) == 0) {
-                        packet_tx_start();
+                        packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t) + sizeof(uint32_t));
                         packet_tx_u16(command);
                         packet_tx_u64(address);
                         packet_tx_u32(*(volatile uint32_t *)address);
@@ -117,7 +262,7 @@ int main(void) {
                     if (address >= base_address && (address & 0x03U) == 0) {
                         *(volatile uint32_t *)address = register_data;
 
-                        packet_tx_start();
+                        packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t) + sizeof(uint32_t));
                         packet_tx_u16(command);
                         packet_tx_u64(address);
                         packet_tx_u32(register_data);
@@ -135,7 +280,8 @@ int main(void) {
                 address = packet_rx_u64();
                 length = packet_rx_u32();
                 if (packet_rx_validate_crc()) {
-                    packet_tx_start();
+                    packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t) + sizeof(uint32_t) +
+                                    length);
                     packet_tx_u16(command);
                     packet_tx_u64(address);
                     packet_tx_u32(length);
@@ -153,7 +299,7 @@ int main(void) {
                     /* Prevent overwriting kernel. */
                     packet_rx_data((uint8_t*) address, length);
                     if (packet_rx_validate_crc()) {
-                        packet_tx_start();
+                        packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t) + sizeof(uint32_t));
                         packet_tx_u16(command);
                         packet_tx_u64(address);
                         packet_tx_u32(length);
@@ -168,12 +314,49 @@ int main(void) {
                 }
                 break;
 
+            case COMMAND_MEMORY_WRITE_COMPRESSED:
+                address = packet_rx_u64();
+                length = packet_rx_u32();
+                codec = packet_rx_u8();
+                compressed_length = packet_rx_u32();
+                if (address >= base_address && codec == CODEC_LZ4) {
+                    /* Prevent overwriting kernel. */
+                    valid = lz4_rx_block((uint8_t*) address, length, compressed_length);
+                    if (packet_rx_validate_crc()) {
+                        if (valid) {
+                            packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t) + sizeof(uint32_t));
+                            packet_tx_u16(command);
+                            packet_tx_u64(address);
+                            packet_tx_u32(length);
+                            packet_tx_crc();
+                        } else {
+                            /* Malformed compressed data or length mismatch */
+                            send_error(ERRORCODE_INVALID_ARG);
+                        }
+                    } else {
+                        send_error(ERRORCODE_INVALID_CRC);
+                    }
+                } else {
+                    packet_rx_ignore_data(compressed_length);
+                    packet_rx_validate_crc(); // Ignore possible error as this is already an invalid state
+                    send_error(ERRORCODE_INVALID_ARG);
+                }
+                break;
+
+            case COMMAND_MEMORY_READ_VECTORED:
+                memory_read_vectored();
+                break;
+
+            case COMMAND_MEMORY_WRITE_VECTORED:
+                memory_write_vectored();
+                break;
+
             case COMMAND_EXECUTE:
                 address = packet_rx_u64();
                 if (packet_rx_validate_crc()) {
                     if (address >= base_address) {
                         result = execute(address);
-                        packet_tx_start();
+                        packet_tx_start(sizeof(uint16_t) + sizeof(uint64_t) + sizeof(uint64_t));
                         packet_tx_u16(command);
                         packet_tx_u64(address);
                         packet_tx_u64(result);
@@ -189,7 +372,7 @@ int main(void) {
 
             case COMMAND_RESET:
                 if (packet_rx_validate_crc()) {
-                    packet_tx_start();
+                    packet_tx_start(sizeof(uint16_t));
                     packet_tx_u16(command);
                     packet_tx_crc();
                     uart_flush();
@@ -200,10 +383,27 @@ int main(void) {
                 }
                 break;
 
+            case COMMAND_SET_BAUD_RATE:
+                new_baud_rate = packet_rx_u32();
+                if (packet_rx_validate_crc()) {
+                    if (uart_is_valid_baud_rate(new_baud_rate)) {
+                        /* The response is still sent with the old baud rate */
+                        packet_tx_start(sizeof(uint16_t) + sizeof(uint32_t));
+                        packet_tx_u16(command);
+                        packet_tx_u32(new_baud_rate);
+                        packet_tx_crc();
+
+                        change_baud_rate(new_baud_rate);
+                    } else {
+                        send_error(ERRORCODE_INVALID_ARG);
+                    }
+                } else {
+                    send_error(ERRORCODE_INVALID_CRC);
+                }
+                break;
+
             default:
                 send_error(ERRORCODE_INVALID_COMMAND);
         }
-
-        uart_flush();
     }
 }
@@ -7,9 +7,24 @@
 #include "packet.h"
 #include "uart.h"
 
+#define PACKET_MAGIC_0  0xa5
+#define PACKET_MAGIC_1  0x5a
+#define PACKET_MAGIC    ((PACKET_MAGIC_1 << 8) | PACKET_MAGIC_0)
+#define PACKET_HEADER_LENGTH    9
+
+static uint8_t framing = PACKET_FRAMING_V1;
+
 static uint8_t rx_crc = 0xff;
 static uint8_t tx_crc = 0xff;
 
+/* Framing v2 state */
+static uint32_t rx_crc32 = 0xffffffff;
+static uint32_t tx_crc32 = 0xffffffff;
+static uint16_t sequence = 0;
+static uint32_t rx_remaining = 0;
+static bool rx_in_frame = false;
+static bool rx_valid = true;
+
 static uint8_t crc_step(uint8_t crc, uint8_t data) {
     size_t i = 0;
 
@@ -25,15 +40,129 @@ static uint8_t crc_step(uint8_t crc, uint8_t data) {
     return crc;
 }
 
-void packet_rx_start(void) {
-    rx_crc = 0;
+static uint32_t crc32_step(uint32_t crc, uint8_t data) {
+    size_t i = 0;
+
+    crc ^= data;
+    for (i = 0; i < 8; i++) {
+        if ((crc & 0x01) != 0) {
+            crc = (crc >> 1) ^ 0xedb88320;
+        } else {
+            crc >>= 1;
+        }
+    }
+
+    return crc;
+}
+
+/*
+ * Checks a v2 header and sets up the receiving of the frame. The header consists of the magic, the
+ * sequence number, the payload length and a CRC-8 of these.
+ */
+static bool packet_parse_header(const uint8_t *header) {
+    uint8_t crc = 0;
+    size_t i = 0;
+
+    if (header[0] != PACKET_MAGIC_0 || header[1] != PACKET_MAGIC_1) {
+        return false;
+    }
+
+    for (i = 0; i < PACKET_HEADER_LENGTH - 1; i++) {
+        crc = crc_step(crc, header[i]);
+    }
+
+    if (header[PACKET_HEADER_LENGTH - 1] != crc) {
+        return false;
+    }
+
+    sequence = header[2] | (header[3] << 8);
+    rx_remaining = header[4] | (header[5] << 8) | (header[6] << 16) | ((uint32_t)header[7] << 24);
+    rx_crc32 = 0xffffffff;
+    rx_in_frame = true;
+    rx_valid = true;
+
+    return true;
+}
+
+static void packet_rx_skip_frame(void) {
+    size_t i = 0;
+
+    while (rx_remaining > 0) {
+        packet_rx_u8();
+    }
+
+    for (i = 0; i < sizeof(uint32_t); i++) {
+        uart_rx();
+    }
+
+    rx_in_frame = false;
+}
+
+uint8_t packet_get_framing(void) {
+    return framing;
+}
+
+void packet_set_framing(uint8_t new_framing) {
+    framing = new_framing;
+}
+
+uint16_t packet_rx_start(void) {
+    uint8_t header[PACKET_HEADER_LENGTH] = {PACKET_MAGIC_0, PACKET_MAGIC_1};
+    uint16_t command = 0;
+    size_t i = 0;
+
+    if (framing == PACKET_FRAMING_V1) {
+        rx_crc = 0;
+        command = packet_rx_u16();
+        if (command != PACKET_MAGIC) {
+            return command;
+        }
+
+        /* A valid v2 header switches to v2 framing until the next reset */
+        for (i = 2; i < PACKET_HEADER_LENGTH; i++) {
+            header[i] = uart_rx();
+        }
+        if (!packet_parse_header(header)) {
+            return command;
+        }
+        framing = PACKET_FRAMING_V2;
+        return packet_rx_u16();
+    }
+
+    if (rx_in_frame) {
+        /* The previous request was not processed completely */
+        packet_rx_skip_frame();
+    }
+
+    /* Resynchronisation: the header window slides until a valid header is found */
+    for (i = 0; i < PACKET_HEADER_LENGTH; i++) {
+        header[i] = uart_rx();
+    }
+    while (!packet_parse_header(header)) {
+        for (i = 0; i < PACKET_HEADER_LENGTH - 1; i++) {
+            header[i] = header[i + 1];
+        }
+        header[PACKET_HEADER_LENGTH - 1] = uart_rx();
+    }
+
+    return packet_rx_u16();
 }
 
 uint8_t packet_rx_u8(void) {
     uint8_t value = 0;
 
-    value = uart_rx();
-    rx_crc = crc_step(rx_crc, value);
+    if (framing == PACKET_FRAMING_V1) {
+        value = uart_rx();
+        rx_crc = crc_step(rx_crc, value);
+    } else if (rx_remaining > 0) {
+        rx_remaining--;
+        value = uart_rx();
+        rx_crc32 = crc32_step(rx_crc32, value);
+    } else {
+        /* Never read beyond the payload of the frame */
+        rx_valid = false;
+    }
+
     return value;
 }
 
@@ -71,15 +200,59 @@ void packet_rx_ignore_data(size_t length) {
 }
 
 bool packet_rx_validate_crc(void) {
-    return (uart_rx() == rx_crc);
+    uint32_t crc = 0;
+    size_t i = 0;
+
+    if (framing == PACKET_FRAMING_V1) {
+        return (uart_rx() == rx_crc);
+    }
+
+    /* Trailing payload which was not processed by the command */
+    while (rx_remaining > 0) {
+        packet_rx_u8();
+        rx_valid = false;
+    }
+
+    for (i = 0; i < sizeof(crc); i++) {
+        crc |= (uint32_t)uart_rx() << (8 * i);
+    }
+    rx_in_frame = false;
+
+    return rx_valid && (crc == ~rx_crc32);
+}
+
+static void packet_tx_header_u8(uint8_t value) {
+    tx_crc = crc_step(tx_crc, value);
+    uart_tx(value);
 }
 
-void packet_tx_start(void) {
+void packet_tx_start(size_t length) {
+    size_t i = 0;
+
     tx_crc = 0;
+    if (framing == PACKET_FRAMING_V1) {
+        return;
+    }
+
+    /* The response echoes the sequence number of the request */
+    packet_tx_header_u8(PACKET_MAGIC_0);
+    packet_tx_header_u8(PACKET_MAGIC_1);
+    packet_tx_header_u8(sequence & 0xff);
+    packet_tx_header_u8(sequence >> 8);
+    for (i = 0; i < sizeof(uint32_t); i++) {
+        packet_tx_header_u8((length >> (8 * i)) & 0xff);
+    }
+    uart_tx(tx_crc);
+
+    tx_crc32 = 0xffffffff;
 }
 
 void packet_tx_u8(uint8_t value) {
-    tx_crc = crc_step(tx_crc, value);
+    if (framing == PACKET_FRAMING_V1) {
+        tx_crc = crc_step(tx_crc, value);
+    } else {
+        tx_crc32 = crc32_step(tx_crc32, value);
+    }
     uart_tx(value);
 }
 
@@ -104,5 +277,15 @@ void packet_tx_data(const uint8_t *data, size_t length) {
 }
 
 void packet_tx_crc(void) {
-    uart_tx(tx_crc);
+    uint32_t crc = ~tx_crc32;
+    size_t i = 0;
+
+    if (framing == PACKET_FRAMING_V1) {
+        uart_tx(tx_crc);
+        return;
+    }
+
+    for (i = 0; i < sizeof(crc); i++) {
+        uart_tx((crc >> (8 * i)) & 0xff);
+    }
 }
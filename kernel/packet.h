@@ -10,7 +10,13 @@
 #include <stddef.h>
 #include <stdint.h>
 
-void packet_rx_start(void);
+#define PACKET_FRAMING_V1   1
+#define PACKET_FRAMING_V2   2
+
+uint8_t packet_get_framing(void);
+void packet_set_framing(uint8_t framing);
+
+uint16_t packet_rx_start(void);
 uint8_t packet_rx_u8(void);
 uint16_t packet_rx_u16(void);
 uint32_t packet_rx_u32(void);
@@ -19,7 +25,7 @@ void packet_rx_data(uint8_t *data, size_t length);
 void packet_rx_ignore_data(size_t length);
 bool packet_rx_validate_crc(void);
 
-void packet_tx_start(void);
+void packet_tx_start(size_t length);
 void packet_tx_u8(uint8_t value);
 void packet_tx_u16(uint16_t value);
 void packet_tx_u32(uint32_t value);
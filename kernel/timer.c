@@ -0,0 +1,18 @@
+/*
+ * Copyright (c) 2020, Kis Imre. All rights reserved.
+ *
+ * SPDX-License-Identifier: MIT
+ */
+
+#include "timer.h"
+
+uint64_t timer_get_us(void) {
+    uint64_t count = 0;
+    uint64_t frequency = 0;
+
+    __asm__ volatile ("isb; mrs %0, cntpct_el0" : "=r" (count));
+    __asm__ volatile ("mrs %0, cntfrq_el0" : "=r" (frequency));
+
+    /* Split the conversion to avoid overflowing the multiplication */
+    return (count / frequency) * 1000000 + ((count % frequency) * 1000000) / frequency;
+}
@@ -0,0 +1,14 @@
+/*
+ * Copyright (c) 2020, Kis Imre. All rights reserved.
+ *
+ * SPDX-License-Identifier: MIT
+ */
+
+#ifndef KERNEL_TIMER_H_
+#define KERNEL_TIMER_H_
+
+#include <stdint.h>
+
+uint64_t timer_get_us(void);
+
+#endif /* KERNEL_TIMER_H_ */
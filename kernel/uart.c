@@ -9,6 +9,7 @@
 #include "mailbox.h"
 
 #define UART_BASE   (IO_BASE + 0x201000)
+#define UART_CLOCK  50000000
 
 #define UART_DR     (*(volatile uint32_t *)(UART_BASE + 0x00))
 #define UART_FR     (*(volatile uint32_t *)(UART_BASE + 0x18))
@@ -17,10 +18,39 @@
 #define UART_LCRH   (*(volatile uint32_t *)(UART_BASE + 0x2C))
 #define UART_CR     (*(volatile uint32_t *)(UART_BASE + 0x30))
 
+#define UART_DR_ERROR_MASK  0x700 /* Break, parity and framing errors */
+#define UART_FR_RXFE        (1 << 4)
+#define UART_FR_TXFF        (1 << 5)
+
+/* Must be a power of two */
+#define UART_RX_BUFFER_SIZE 4096
+
 #define GPIO_GPFSEL (*(volatile uint32_t *)(IO_BASE + 0x00200004))
 
 static uint32_t mailbox_message[8] __attribute__((aligned(16)));
 
+/*
+ * RX ring buffer. The 16 byte FIFO of the PL011 would overflow when the host sends the next
+ * requests while the kernel is transmitting, so the FIFO is drained into the ring buffer whenever
+ * the kernel waits for the UART. The indices are free running counters.
+ */
+static uint8_t rx_buffer[UART_RX_BUFFER_SIZE];
+static uint32_t rx_head = 0;
+static uint32_t rx_tail = 0;
+
+static void uart_rx_fill(void) {
+    uint32_t data = 0;
+
+    while ((UART_FR & UART_FR_RXFE) == 0 && (rx_head - rx_tail) < UART_RX_BUFFER_SIZE) {
+        data = UART_DR;
+        /* Bytes with errors are dropped, these are typically caused by baud rate mismatch */
+        if ((data & UART_DR_ERROR_MASK) == 0) {
+            rx_buffer[rx_head & (UART_RX_BUFFER_SIZE - 1)] = data & 0xff;
+            rx_head++;
+        }
+    }
+}
+
 void uart_clock_set_rate(uint32_t rate) {
     mailbox_message[0] = sizeof(mailbox_message); /* Size */
     mailbox_message[1] = 0x00000000; /* Code */
@@ -35,45 +65,77 @@ void uart_clock_set_rate(uint32_t rate) {
 }
 
 void uart_init(uint32_t baud_rate) {
-    uint32_t base_clock = 50000000;
-
     /* Deinit */
     UART_CR = 0x00;
 
-    uart_clock_set_rate(base_clock);
+    uart_clock_set_rate(UART_CLOCK);
 
     /* UART TX/RX pins: 14, 15 */
     GPIO_GPFSEL &= 0xfffc0fff;
     GPIO_GPFSEL |= 0x00024000;
 
-    base_clock <<= 6;
-    base_clock /= (baud_rate << 4);
+    uart_set_baud_rate(baud_rate);
+}
+
+bool uart_is_valid_baud_rate(uint32_t baud_rate) {
+    /* The integer part of the divisor must not be zero */
+    return (baud_rate > 0 && baud_rate <= UART_MAX_BAUD_RATE);
+}
 
-    /* Set baud rate */
-    UART_FBRD = base_clock & 0x3f;
-    UART_IBRD = base_clock >> 6;
+void uart_set_baud_rate(uint32_t baud_rate) {
+    uint32_t divisor = 0;
+
+    /* Finish ongoing transmission before disabling the UART */
+    uart_flush();
+    UART_CR = 0x00;
+
+    divisor = UART_CLOCK << 6;
+    divisor /= (baud_rate << 4);
+
+    /* Set baud rate, the divisor registers are latched by writing LCRH */
+    UART_FBRD = divisor & 0x3f;
+    UART_IBRD = divisor >> 6;
 
     UART_LCRH = 0x70; /* 8 bit, FIFO enable */
     UART_CR = 0x0301;
 
-    uart_flush();
+    /* Drop the bytes which were received during the change */
+    while ((UART_FR & UART_FR_RXFE) == 0) {
+        (void)UART_DR;
+    }
+    rx_tail = rx_head;
 }
 
 void uart_tx(uint8_t c) {
-    /* Waiting for FIFO not full */
-    while ((UART_FR & (1 << 5))) {
+    /* Waiting for FIFO not full, meanwhile the received bytes are buffered */
+    while ((UART_FR & UART_FR_TXFF)) {
+        uart_rx_fill();
     }
     UART_DR = c;
 }
 
+bool uart_rx_poll(uint8_t *c) {
+    uart_rx_fill();
+    if (rx_head == rx_tail) {
+        return false;
+    }
+
+    *c = rx_buffer[rx_tail & (UART_RX_BUFFER_SIZE - 1)];
+    rx_tail++;
+    return true;
+}
+
 uint8_t uart_rx(void) {
+    uint8_t c = 0;
+
     /* Waiting for FIFO not empty */
-    while ((UART_FR & (1 << 4))) {
+    while (!uart_rx_poll(&c)) {
     }
-    return UART_DR;
+    return c;
 }
 
 void uart_flush(void) {
-    while ((UART_FR & 0x90) != 0x90) {
+    while ((UART_FR & 0x88) != 0x80) {
+        uart_rx_fill();
     }
 }
@@ -7,12 +7,19 @@
 #ifndef UART_H_
 #define UART_H_
 
+#include <stdbool.h>
 #include <stdint.h>
 
+#define UART_DEFAULT_BAUD_RATE  115200
+#define UART_MAX_BAUD_RATE      3125000
+
 void uart_init(uint32_t baud_rate);
 void uart_deinit(void);
+bool uart_is_valid_baud_rate(uint32_t baud_rate);
+void uart_set_baud_rate(uint32_t baud_rate);
 
 void uart_tx(uint8_t c);
+bool uart_rx_poll(uint8_t *c);
 uint8_t uart_rx(void);
 void uart_flush(void);
 